@@ -0,0 +1,119 @@
+"""對賬基準測試: 向量化對賬引擎處理千萬級交易的耗時
+
+1. 引擎: 直接構造 --transactions 筆交易的列式快照 (Ledger，交易列為整數編碼的 array)，測量 reconcile 的耗時
+   (參與方表映射為賬戶下標 + numpy按下標取值與分組求和)
+2. 端到端: 向內存存儲寫入 --store-transactions 筆交易，測量 get_ledger 讀取快照 + 對賬的耗時
+   (每筆 TransactionRecord 約佔400字節，千萬筆超出一般機器內存，因此單獨設定規模)
+
+交易狀態按 待接收:已完成:已取消 = 1:8:1 隨機生成，餘額按流水算出，對賬結果應為平賬。
+
+用法: python benchmarks/bench_audit.py [--transactions 10000000] [--accounts 100000] [--store-transactions 1000000]
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import uuid
+from array import array
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+
+from app.database import db
+from app.database.db import Ledger
+from app.models.money import INITIAL_BALANCE
+from app.utils.audit import reconcile
+
+STATUSES = np.array(["pending", "completed", "cancelled"], dtype=object)
+
+
+def synthetic(accounts, count, seed=1):
+    """返回 (賬戶email列表, 各筆交易的發送方下標、接收方下標、狀態、金額, 按流水算出的餘額)"""
+    rng = np.random.default_rng(seed)
+    emails = [f"user{i}@example.com" for i in range(accounts)]
+    senders = rng.integers(0, accounts, count)
+    receivers = rng.integers(0, accounts, count)
+    statuses = rng.choice(3, count, p=[0.1, 0.8, 0.1])
+    amounts = rng.integers(1, 10_000, count, dtype=np.int64)
+    balances = np.full(accounts, INITIAL_BALANCE, np.int64)
+    np.subtract.at(balances, senders[statuses < 2], amounts[statuses < 2])
+    np.add.at(balances, receivers[statuses == 1], amounts[statuses == 1])
+    return emails, senders, receivers, statuses, amounts, balances
+
+
+def _column(typecode, values):
+    column = array(typecode)
+    column.frombytes(values.astype(np.int8 if typecode == "b" else np.int64).tobytes())
+    return column
+
+
+def bench_engine(accounts, count):
+    emails, senders, receivers, statuses, amounts, balances = synthetic(accounts, count)
+    # 與存儲返回的快照相同: 參與方表 + 整數編碼的交易列
+    ledger = Ledger(
+        emails, balances.tolist(), list(emails),
+        _column("q", senders), _column("q", receivers), _column("b", statuses), _column("q", amounts),
+    )
+    del senders, receivers, statuses
+    gc.collect()
+    began = time.perf_counter()
+    report = reconcile(ledger)
+    elapsed = time.perf_counter() - began
+    print(f"engine: {count:,} transactions / {accounts:,} accounts")
+    print(f"  reconcile {elapsed:>8.2f} s  ({count / elapsed:,.0f} tx/s)  balanced={report.balanced}")
+
+
+def bench_store(accounts, count):
+    emails, senders, receivers, statuses, amounts, balances = synthetic(accounts, count, seed=2)
+    repository = db.MemoryRepository()
+    now = datetime.now()
+    for i, email in enumerate(emails):
+        repository.add_user({
+            "user_id": f"u{i}", "email": email, "name": f"用戶{i}",
+            "hashed_password": "x", "balance": int(balances[i]), "created_at": now,
+        })
+    batch = []
+    for i, (sender, receiver, state, amount) in enumerate(
+        zip(senders.tolist(), receivers.tolist(), STATUSES[statuses].tolist(), amounts.tolist())
+    ):
+        created_at = now - timedelta(seconds=count - i)
+        batch.append({
+            "transaction_id": str(uuid.uuid4()), "amount": amount, "note": None,
+            "sender_id": f"u{sender}", "sender_email": emails[sender], "sender_name": f"用戶{sender}",
+            "receiver_id": f"u{receiver}", "receiver_email": emails[receiver], "receiver_name": f"用戶{receiver}",
+            "status": state, "created_at": created_at, "expires_at": None, "completed_at": None,
+        })
+        if len(batch) == 10000:
+            repository.add_transactions(batch)
+            batch = []
+    if batch:
+        repository.add_transactions(batch)
+    gc.collect()
+
+    began = time.perf_counter()
+    ledger = repository.get_ledger()
+    loaded = time.perf_counter() - began
+    report = reconcile(ledger)
+    elapsed = time.perf_counter() - began
+    print(f"memory store: {count:,} transactions / {accounts:,} accounts")
+    print(f"  get_ledger {loaded:>7.2f} s   reconcile {elapsed - loaded:>7.2f} s   "
+          f"total {elapsed:>7.2f} s  ({count / elapsed:,.0f} tx/s)  balanced={report.balanced}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--transactions", type=int, default=10_000_000)
+    parser.add_argument("--accounts", type=int, default=100_000)
+    parser.add_argument("--store-transactions", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    bench_engine(args.accounts, args.transactions)
+    if args.store_transactions:
+        bench_store(args.accounts, args.store_transactions)
+
+
+if __name__ == "__main__":
+    main()
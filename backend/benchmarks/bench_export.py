@@ -0,0 +1,103 @@
+"""交易導出基準測試: CSV 與列式格式的導出速度 (行/秒)、每行字節數與峰值內存
+
+與現有的 /me/transactions (一次性序列化全部歷史為JSON) 對比。
+導出直接消費響應生成器，不經過網絡，測量的是讀取存儲 + 編碼的成本。
+
+用法: python benchmarks/bench_export.py [--transactions 200000] [--backend memory|sqlite]
+"""
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from app.database import db
+from app.utils.export import export_response
+from app.utils.serialization import encode_transactions
+
+USER_ID = "bench-user"
+
+
+def populate(repository, count):
+    start = datetime.now() - timedelta(days=365)
+    batch = []
+    for i in range(count):
+        created_at = start + timedelta(seconds=i)
+        batch.append({
+            "transaction_id": str(uuid.uuid4()),
+            "amount": (i % 100 + 1) * 100,
+            "note": f"轉賬 {i}" if i % 3 else None,
+            "sender_id": USER_ID,
+            "sender_email": "bench@example.com",
+            "sender_name": "基準用戶",
+            "receiver_id": f"receiver-{i % 50}",
+            "receiver_email": f"receiver{i % 50}@example.com",
+            "receiver_name": f"接收方{i % 50}",
+            "status": "completed",
+            "created_at": created_at,
+            "expires_at": created_at + timedelta(minutes=30),
+            "completed_at": created_at + timedelta(minutes=1),
+        })
+        if len(batch) == 10000:
+            repository.add_transactions(batch)
+            batch = []
+    if batch:
+        repository.add_transactions(batch)
+
+
+async def consume(response):
+    size = 0
+    async for chunk in response.body_iterator:
+        size += len(chunk)
+    return size
+
+
+def measure(label, run, count):
+    """先測速度，再在 tracemalloc 下重跑一次測峰值內存 (tracemalloc 本身會拖慢執行)"""
+    gc.collect()
+    began = time.perf_counter()
+    size = run()
+    elapsed = time.perf_counter() - began
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<22} {count / elapsed:>10,.0f} rows/s  {size / count:>6.1f} bytes/row  "
+          f"peak {peak / 1024 / 1024:>7.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--transactions", type=int, default=200_000)
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--path", default="/tmp/bench-export.db")
+    args = parser.parse_args()
+
+    if args.backend == "sqlite" and os.path.exists(args.path):
+        os.remove(args.path)
+    repository = db.create_repository(args.backend, path=args.path)
+    populate(repository, args.transactions)
+    count = args.transactions
+
+    def fetch(before, limit):
+        return repository.get_user_transactions(USER_ID, before=before, limit=limit)
+
+    print(f"{args.backend}: {count:,} transactions for one user")
+    measure("json (materialized)", lambda: len(encode_transactions(repository.get_user_transactions(USER_ID)).encode()), count)
+    for export_format in ("csv", "columnar"):
+        measure(
+            f"export {export_format}",
+            lambda: asyncio.run(consume(export_response(fetch, export_format, None, None, "bench"))),
+            count,
+        )
+    repository.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""交易ID過濾器基準測試: 布隆過濾器的內存、實測假陽性率，以及分片模式下拒絕未知ID的耗時
+
+1. 過濾器: 加入 --keys 個隨機UUID，再用 --probes 個未加入的UUID探測，
+   對比估算與實測的假陽性率，並與保存同樣ID的 set 比較內存
+2. 分片: 啟動 --shards 個分片進程並寫入 --transactions 筆交易，對比未知ID經過濾器判定
+   (只讀共享映射) 與經socket查詢分片 (get_transaction) 的單次耗時
+
+用法: python benchmarks/bench_filter.py [--keys 1000000] [--error-rate 0.001] [--probes 200000] [--shards 2] [--transactions 10000]
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from app.database.bloom import BloomFilter
+
+SOCKET_DIR = "/tmp/bench-filter"
+
+
+def set_bytes(keys):
+    """set 本身與其中字符串對象的內存"""
+    return sys.getsizeof(keys) + sum(sys.getsizeof(key) for key in keys)
+
+
+def bench_filter(count, error_rate, probes):
+    keys = [str(uuid.uuid4()) for _ in range(count)]
+    transaction_filter = BloomFilter.create(count, error_rate)
+    began = time.perf_counter()
+    for key in keys:
+        transaction_filter.add(key)
+    added = time.perf_counter() - began
+
+    unknown = [str(uuid.uuid4()) for _ in range(probes)]
+    began = time.perf_counter()
+    false_positives = sum(key in transaction_filter for key in unknown)
+    probed = time.perf_counter() - began
+    assert all(key in transaction_filter for key in keys[:10000]), "過濾器出現假陰性"
+
+    stats = transaction_filter.stats()
+    print(f"filter: {count:,} keys, target error rate {error_rate}")
+    print(f"  {stats['bits']:,} bits, {stats['hashes']} hashes, {stats['bytes'] / 2**20:.2f} MiB "
+          f"({stats['bytes'] * 8 / count:.1f} bits/key), set of the same IDs {set_bytes(set(keys)) / 2**20:.1f} MiB")
+    print(f"  false positives: estimated {stats['false_positive_rate']:.4%}, measured {false_positives / probes:.4%} "
+          f"({false_positives:,}/{probes:,})")
+    print(f"  add {added / count * 1e6:.2f} us/key   lookup (unknown) {probed / probes * 1e6:.2f} us/key")
+
+
+def new_transaction():
+    now = datetime.now()
+    return {
+        "transaction_id": str(uuid.uuid4()), "amount": 100, "note": None,
+        "sender_id": "a", "sender_email": "a@example.com", "sender_name": "a",
+        "receiver_id": None, "receiver_email": None, "receiver_name": None,
+        "status": "pending", "created_at": now, "expires_at": None, "completed_at": None,
+    }
+
+
+def bench_shards(shards, count, probes):
+    from app.database.shard import ShardedRepository, start_shards, _stop
+    processes = start_shards(shards, SOCKET_DIR)
+    repository = ShardedRepository(SOCKET_DIR, count=shards)
+    try:
+        batch = [new_transaction() for _ in range(count)]
+        repository.add_transactions(batch)
+        unknown = [str(uuid.uuid4()) for _ in range(probes)]
+
+        began = time.perf_counter()
+        passed = sum(repository.might_contain_transaction(key) for key in unknown)
+        filtered = time.perf_counter() - began
+        began = time.perf_counter()
+        found = sum(repository.get_transaction(key) is not None for key in unknown)
+        fetched = time.perf_counter() - began
+        assert found == 0 and all(repository.might_contain_transaction(item["transaction_id"]) for item in batch)
+
+        stats = repository.transaction_filter_stats()
+        print(f"sharded: {shards} shards, {count:,} transactions, {probes:,} unknown IDs")
+        print(f"  filter {filtered / probes * 1e6:>7.2f} us/lookup  ({passed} passed to storage)")
+        print(f"  socket {fetched / probes * 1e6:>7.2f} us/lookup")
+        print(f"  {stats['bytes'] / 2**20:.2f} MiB mapped per worker, estimated false-positive rate "
+              f"{stats['false_positive_rate']:.2e}")
+    finally:
+        repository.close()
+        _stop(processes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--keys", type=int, default=1_000_000)
+    parser.add_argument("--error-rate", type=float, default=0.001)
+    parser.add_argument("--probes", type=int, default=200_000)
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--transactions", type=int, default=10_000)
+    args = parser.parse_args()
+
+    bench_filter(args.keys, args.error_rate, args.probes)
+    if args.shards:
+        bench_shards(args.shards, args.transactions, min(args.probes, 20_000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""追加日誌基準測試: 比較內存存儲有無日誌時的寫入吞吐量，以及重啟恢復時間
+
+寫入階段對每筆交易執行 open_transfer + close_transfer (即完整的扣款與入賬)，
+以 --concurrency 個並發請求在事件循環中執行: 與服務一樣，每個請求在 durable_commits() 內等待自己的操作fsync，
+同時進行的請求共享一次fsync (報告每次fsync平均覆蓋的操作數)。
+恢復時間在新進程中測量，分別為: 只重放日誌、載入快照 + 重放少量日誌尾部。
+
+用法: python benchmarks/bench_journal.py [--transactions 1000000] [--tail 10000] [--concurrency 1000] [--dir /tmp/bench-journal]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from app.database import db
+from app.database.journal import JournaledMemoryRepository, durable_commits
+
+USERS = 1000
+
+
+def make_users():
+    now = datetime.now()
+    return [{
+        "user_id": str(uuid.uuid4()),
+        "email": f"user{i}@example.com",
+        "name": f"用戶{i}",
+        "hashed_password": "x",
+        "balance": 10 ** 9,
+        "created_at": now,
+    } for i in range(USERS)]
+
+
+def transfer(repository, users, i):
+    sender, receiver = users[i % USERS], users[(i * 7 + 1) % USERS]
+    now = datetime.now()
+    transaction = repository.open_transfer({
+        "transaction_id": str(uuid.uuid4()),
+        "amount": 100,
+        "note": None,
+        "sender_id": sender["user_id"],
+        "sender_email": sender["email"],
+        "sender_name": sender["name"],
+        "receiver_id": None,
+        "receiver_email": None,
+        "receiver_name": None,
+        "status": "pending",
+        "created_at": now,
+        "expires_at": now + timedelta(minutes=30),
+        "completed_at": None,
+    })
+    repository.close_transfer(
+        transaction["transaction_id"], "completed", receiver["email"],
+        receiver_id=receiver["user_id"], receiver_email=receiver["email"],
+        receiver_name=receiver["name"], completed_at=now,
+    )
+
+
+async def requests(repository, users, start, count, concurrency):
+    async def client(offset):
+        for i in range(start + offset, start + count, concurrency):
+            # 一個請求: 扣款與入賬都fsync之後才算完成
+            async with durable_commits():
+                transfer(repository, users, i)
+
+    await asyncio.gather(*(client(offset) for offset in range(min(concurrency, count))))
+
+
+def write(repository, start, count, concurrency):
+    users = [repository.get_user(f"user{i}@example.com") for i in range(USERS)]
+    began = time.perf_counter()
+    asyncio.run(requests(repository, users, start, count, concurrency))
+    return count / (time.perf_counter() - began)
+
+
+def restore(directory):
+    """在子進程中重啟並返回 (恢復秒數, 交易數)"""
+    output = subprocess.run(
+        [sys.executable, __file__, "--restore", directory],
+        check=True, capture_output=True, text=True,
+    ).stdout.split()
+    return float(output[0]), int(output[1])
+
+
+def reset_storage():
+    for store in (db.users_db, db.transactions_db, db.transactions_by_sender,
+                  db.transactions_by_receiver, db.transactions_by_status):
+        store.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--tail", type=int, default=10_000, help="快照之後寫入的交易數")
+    parser.add_argument("--concurrency", type=int, default=1000, help="同時進行的請求數")
+    parser.add_argument("--dir", default="/tmp/bench-journal")
+    parser.add_argument("--restore", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.restore:
+        began = time.perf_counter()
+        repository = JournaledMemoryRepository(args.restore)
+        elapsed = time.perf_counter() - began
+        print(elapsed, len(repository.transactions))
+        return
+
+    count = args.transactions
+    print(f"{USERS:,} users, {count:,} transfers (open + close)")
+
+    memory = db.MemoryRepository()
+    for user in make_users():
+        memory.add_user(user)
+    baseline = write(memory, 0, count, args.concurrency)
+    print(f"  {'memory':<22} {baseline:>10,.0f} transfers/s")
+    reset_storage()
+
+    shutil.rmtree(args.dir, ignore_errors=True)
+    # 關閉自動壓縮，第一次重啟只重放日誌
+    journaled = JournaledMemoryRepository(args.dir, compact_bytes=sys.maxsize)
+    for user in make_users():
+        journaled.add_user(user)
+    fsyncs = journaled.fsync_count
+    throughput = write(journaled, 0, count, args.concurrency)
+    fsyncs = journaled.fsync_count - fsyncs
+    print(f"  {'memory + journal':<22} {throughput:>10,.0f} transfers/s  ({throughput / baseline:.0%}, "
+          f"{journaled.journal_bytes / count:,.0f} journal bytes/transfer, "
+          f"{2 * count / max(fsyncs, 1):,.0f} operations/fsync)")
+
+    # 每個請求都等到fsync之後才完成，子進程可直接讀取日誌
+    elapsed, restored = restore(args.dir)
+    print(f"  restart (journal only)  {elapsed:>8.2f} s  ({restored:,} transactions)")
+
+    began = time.perf_counter()
+    journaled.compact_journal()
+    print(f"  compaction              {time.perf_counter() - began:>8.2f} s")
+    write(journaled, count, args.tail, args.concurrency)
+    journaled.close()
+    elapsed, restored = restore(args.dir)
+    print(f"  restart (snapshot + {args.tail:,} tail) {elapsed:.2f} s  ({restored:,} transactions)")
+    shutil.rmtree(args.dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
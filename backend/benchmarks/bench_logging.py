@@ -0,0 +1,71 @@
+"""日誌開銷微基準: 比較 get_current_user 熱路徑在舊 print 調試輸出與結構化日誌下的單次成本
+
+用法: python benchmarks/bench_logging.py [--calls 20000]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import redirect_stdout
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from app.database.db import add_user
+from app.utils.auth import create_access_token, get_current_user
+from app.utils.log import setup_logging, shutdown_logging
+
+
+async def legacy_get_current_user(token):
+    # 重現改動前每次請求的 print 調試輸出
+    print(f"嘗試獲取當前用戶，令牌長度: {len(token) if token else 0}")
+    print(f"解析令牌: {token[:10]}...（已截断）")
+    user = await get_current_user(token)
+    print(f"解析到用戶ID: {user.user_id}, Email: {user.email}")
+    print(f"通過Email查找用戶: {user.email}, 結果: 找到")
+    print(f"獲取到最新的用戶餘額: {user.balance}")
+    return user
+
+
+async def measure(func, token, calls):
+    began = time.perf_counter()
+    for _ in range(calls):
+        await func(token)
+    return (time.perf_counter() - began) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    user = add_user({
+        "user_id": str(uuid.uuid4()), "email": "bench@example.com", "name": "bench",
+        "hashed_password": "x", "balance": 1000, "created_at": datetime.now(),
+    })
+    token = create_access_token({"sub": user["user_id"], "email": user["email"]})
+
+    # 日誌與print都寫入真實文件，模擬容器中stdout被重定向的情況
+    sink = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+    setup_logging(level="INFO", stream=sink)
+    app_logger = logging.getLogger("app")
+
+    results = {}
+    with redirect_stdout(sink):
+        results["print (舊實現)"] = asyncio.run(measure(legacy_get_current_user, token, args.calls))
+    results["logging INFO (默認)"] = asyncio.run(measure(get_current_user, token, args.calls))
+    app_logger.setLevel("DEBUG")
+    results["logging DEBUG (隊列)"] = asyncio.run(measure(get_current_user, token, args.calls))
+    shutdown_logging()
+
+    print(f"get_current_user 單次成本 ({args.calls:,} 次調用，令牌與用戶緩存命中):")
+    for label, micros in results.items():
+        print(f"  {label:<22} {micros:8.2f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""登入風暴基準測試: 大量並發登入時 /api/users/me 的延遲分布
+
+每個 PASSWORD_HASH_WORKERS 設定在獨立子進程中運行，0 表示在事件循環中直接計算bcrypt。
+用法: python benchmarks/bench_login_storm.py [--workers 0 4] [--logins 40] [--probes 200]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+PROBE_INTERVAL = 0.01
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def storm(logins, probes):
+    import httpx
+    from main import app
+    from app.database.db import add_user
+    from app.utils.auth import create_access_token, get_password_hash, password_pool_stats
+
+    password = "storm-password"
+    hashed = get_password_hash(password)
+    emails = []
+    for i in range(logins):
+        email = f"storm{i}-{uuid.uuid4().hex[:6]}@example.com"
+        add_user({
+            "user_id": str(uuid.uuid4()), "email": email, "name": f"storm{i}",
+            "hashed_password": hashed, "balance": 0, "created_at": datetime.now(),
+        })
+        emails.append(email)
+    probe_user = add_user({
+        "user_id": str(uuid.uuid4()), "email": f"probe-{uuid.uuid4().hex[:6]}@example.com", "name": "probe",
+        "hashed_password": hashed, "balance": 0, "created_at": datetime.now(),
+    })
+    headers = {"Authorization": "Bearer " + create_access_token({"sub": probe_user["user_id"], "email": probe_user["email"]})}
+
+    latencies = []
+    max_queue = 0
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        async def probe():
+            # 按固定間隔發送，延遲從計劃發送時間算起，事件循環被阻塞的時間也會計入
+            nonlocal max_queue
+            started = time.perf_counter()
+            for i in range(probes):
+                scheduled = started + i * PROBE_INTERVAL
+                await asyncio.sleep(max(scheduled - time.perf_counter(), 0))
+                await client.get("/api/users/me", headers=headers)
+                latencies.append((time.perf_counter() - scheduled) * 1000)
+                max_queue = max(max_queue, password_pool_stats()["queued"])
+
+        async def login(email):
+            await client.post("/api/auth/login", data={"username": email, "password": password})
+
+        began = time.perf_counter()
+        await asyncio.gather(probe(), *(login(email) for email in emails))
+        elapsed = time.perf_counter() - began
+
+    return {
+        "workers": int(os.environ.get("PASSWORD_HASH_WORKERS", "4")),
+        "logins": logins,
+        "elapsed_s": round(elapsed, 3),
+        "me_p50_ms": round(statistics.median(latencies), 2),
+        "me_p99_ms": round(percentile(latencies, 0.99), 2),
+        "me_max_ms": round(max(latencies), 2),
+        "max_queue_depth": max_queue,
+    }
+
+
+def run_single(args):
+    sys.path.insert(0, SRC)
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = asyncio.run(storm(args.logins, args.probes))
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 4])
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--probes", type=int, default=200)
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args)
+        return
+
+    print(f"{'workers':>8} {'elapsed s':>10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'max queue':>10}")
+    for workers in args.workers:
+        # 所有登入來自同一IP，關閉限流與並發上限以測量bcrypt線程池本身
+        env = dict(os.environ, PASSWORD_HASH_WORKERS=str(workers), RATE_LIMIT_ENABLED="false")
+        output = subprocess.run(
+            [sys.executable, __file__, "--single", "--logins", str(args.logins), "--probes", str(args.probes)],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{result['workers']:>8} {result['elapsed_s']:>10} {result['me_p50_ms']:>8} "
+            f"{result['me_p99_ms']:>8} {result['me_max_ms']:>8} {result['max_queue_depth']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
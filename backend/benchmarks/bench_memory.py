@@ -0,0 +1,91 @@
+"""內存佔用基準測試: 比較原始dict與 TransactionRecord 每筆交易的字節數 (含索引)
+
+每筆交易的用戶欄位都是獨立的字符串副本，模擬從請求或存儲中解碼得到的數據。
+
+用法: python benchmarks/bench_memory.py [--transactions 100000] [--users 1000]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from app.database import db
+from app.database.records import _parties
+
+
+def copy_str(value):
+    """構造內容相同但對象不同的字符串"""
+    return None if value is None else "".join(list(value))
+
+
+def make_transactions(user_count, count):
+    users = [(str(uuid.uuid4()), f"user{i}@example.com", f"用戶{i}") for i in range(user_count)]
+    start = datetime.now() - timedelta(days=30)
+    transactions = []
+    for i in range(count):
+        sender, receiver = random.sample(users, 2)
+        created_at = start + timedelta(seconds=i)
+        transactions.append({
+            "transaction_id": str(uuid.uuid4()),
+            "amount": random.randint(1, 100) * 100,
+            "note": None,
+            "sender_id": copy_str(sender[0]),
+            "sender_email": copy_str(sender[1]),
+            "sender_name": copy_str(sender[2]),
+            "receiver_id": copy_str(receiver[0]),
+            "receiver_email": copy_str(receiver[1]),
+            "receiver_name": copy_str(receiver[2]),
+            "status": "completed",
+            "created_at": created_at,
+            "expires_at": created_at + timedelta(minutes=30),
+            "completed_at": created_at + timedelta(minutes=1),
+        })
+    return transactions
+
+
+def reset_storage():
+    for store in (db.transactions_db, db.transactions_by_sender, db.transactions_by_receiver, db.transactions_by_status):
+        store.clear()
+    _parties.clear()
+    gc.collect()
+
+
+def measure(label, user_count, count, compact):
+    """只計算寫入存儲後仍存活的內存 (輸入數據在寫入後釋放)"""
+    random.seed(42)
+    reset_storage()
+    repository = db.MemoryRepository(compact=compact)
+    tracemalloc.start()
+    transactions = make_transactions(user_count, count)
+    for transaction in transactions:
+        repository.add_transaction(transaction)
+    del transactions, transaction
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    per_transaction = current / count
+    print(f"  {label:<22} {per_transaction:>8,.0f} bytes/transaction  ({current / 1024 / 1024:,.1f} MiB)")
+    reset_storage()
+    return per_transaction
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--transactions", type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f"{args.users:,} users, {args.transactions:,} transactions (incl. indexes)")
+    before = measure("dict", args.users, args.transactions, compact=False)
+    after = measure("TransactionRecord", args.users, args.transactions, compact=True)
+    print(f"  saved {1 - after / before:.0%}")
+
+
+if __name__ == "__main__":
+    main()
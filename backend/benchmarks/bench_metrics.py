@@ -0,0 +1,65 @@
+"""指標中間件開銷基準測試: 測量每個請求的記錄成本
+
+直接以ASGI調用一個最小的應用 (不經過網絡與路由)，比較有無 MetricsMiddleware 的耗時差。
+
+用法: python benchmarks/bench_metrics.py [--requests 200000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from main import app, root
+from app.utils.metrics import MetricsMiddleware, registry
+
+RESPONSE_START = {"type": "http.response.start", "status": 200, "headers": []}
+RESPONSE_BODY = {"type": "http.response.body", "body": b"{}"}
+
+
+async def endpoint_app(scope, receive, send):
+    """模擬路由匹配後的應用: 寫入 endpoint 並返回固定響應"""
+    scope["endpoint"] = root
+    await send(RESPONSE_START)
+    await send(RESPONSE_BODY)
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+async def run(handler, count):
+    scope = {"type": "http", "method": "GET", "path": "/", "app": app}
+    began = time.perf_counter()
+    for _ in range(count):
+        await handler(dict(scope), receive, send)
+    return time.perf_counter() - began
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200_000)
+    args = parser.parse_args()
+
+    instrumented = MetricsMiddleware(endpoint_app)
+    baseline = min(asyncio.run(run(endpoint_app, args.requests)) for _ in range(3))
+    measured = min(asyncio.run(run(instrumented, args.requests)) for _ in range(3))
+    overhead = (measured - baseline) / args.requests * 1_000_000
+    print(f"{args.requests:,} requests")
+    print(f"  without middleware  {baseline / args.requests * 1_000_000:6.2f} µs/request")
+    print(f"  with middleware     {measured / args.requests * 1_000_000:6.2f} µs/request")
+    print(f"  recording overhead  {overhead:6.2f} µs/request")
+
+    began = time.perf_counter()
+    text = registry.render()
+    print(f"  /metrics render     {(time.perf_counter() - began) * 1000:6.2f} ms ({len(text):,} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""剖析中間件開銷基準測試: 關閉、只捕獲慢請求、剖析全部請求時每個請求的耗時
+
+直接以ASGI調用一個模擬業務計算的應用 (不經過網絡與路由)。PROFILING_ENABLED 關閉時 main 不安裝
+中間件，即基線；開啟後被觀察的請求進行中時採樣線程每 --interval-ms 毫秒採樣一次調用棧，
+採樣本身與中間件的記賬都會計入請求耗時。
+
+用法: python benchmarks/bench_profiling.py [--requests 20000] [--work 200] [--interval-ms 5]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from app.utils import profiling
+from app.utils.profiling import ProfilingMiddleware, ProfileBuffer, StackSampler
+
+RESPONSE_START = {"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]}
+
+
+def make_app(work):
+    payload = [{"id": i, "amount": i * 100, "note": "x" * 16} for i in range(work)]
+
+    async def endpoint_app(scope, receive, send):
+        """模擬業務處理: 序列化 work 條記錄"""
+        body = json.dumps(payload).encode()
+        await send(RESPONSE_START)
+        await send({"type": "http.response.body", "body": body})
+
+    return endpoint_app
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+async def run(handler, count):
+    scope = {"type": "http", "method": "GET", "path": "/bench", "headers": []}
+    began = time.perf_counter()
+    for _ in range(count):
+        await handler(dict(scope), receive, send)
+    return time.perf_counter() - began
+
+
+def measure(handler, count):
+    return min(asyncio.run(run(handler, count)) for _ in range(5)) / count * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--work", type=int, default=200, help="每個請求序列化的記錄數")
+    parser.add_argument("--interval-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    endpoint_app = make_app(args.work)
+    baseline = measure(endpoint_app, args.requests)
+    print(f"{args.requests:,} requests, sampling every {args.interval_ms} ms")
+    print(f"  disabled (no middleware)   {baseline:8.2f} µs/request")
+
+    scenarios = (
+        ("slow capture only", 0.0, 1000.0),
+        ("profile every request", 1.0, 1000.0),
+    )
+    for name, sample_rate, slow_ms in scenarios:
+        profiling.PROFILE_SAMPLE_RATE, profiling.PROFILE_SLOW_MS = sample_rate, slow_ms
+        buffer = ProfileBuffer()
+        sampler = StackSampler(interval_ms=args.interval_ms)
+        elapsed = measure(ProfilingMiddleware(endpoint_app, sampler, buffer), args.requests)
+        print(f"  {name:<26} {elapsed:8.2f} µs/request  ({(elapsed - baseline) / baseline:+.1%}, "
+              f"{len(sampler.samples):,} stack samples retained)")
+
+
+if __name__ == "__main__":
+    main()
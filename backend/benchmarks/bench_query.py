@@ -0,0 +1,118 @@
+"""交易查詢基準測試: 百萬級交易上按條件查詢 (狀態、時間範圍、交易對方、金額) 的延遲與查詢計劃
+
+向內存存儲寫入 --transactions 筆交易 (--accounts 個賬戶，狀態按 待接收:已完成:已取消 = 1:8:1，
+已完成的交易在創建後0~10分鐘內結算)，對每種查詢取第一頁 (--limit 條) 重複 --repeat 次，
+報告計劃選中的索引、候選條數、實際檢查的交易數與延遲中位數；並與逐條檢查全部交易的全表掃描對比，
+結果必須一致。最後報告複合索引的內存佔用。
+
+用法: python benchmarks/bench_query.py [--transactions 1000000] [--accounts 10000] [--limit 50] [--repeat 200]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from itertools import islice
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from app.database import db
+from app.database.query import CompositeIndex, TransactionQuery, matches
+
+STATUSES = ("pending", "completed", "cancelled")
+
+
+def populate(repository, accounts, count, seed=1):
+    rng = random.Random(seed)
+    emails = [f"user{i}@example.com" for i in range(accounts)]
+    start = datetime.now() - timedelta(seconds=count)
+    for i in range(count):
+        sender, receiver = rng.randrange(accounts), rng.randrange(accounts)
+        status = rng.choices(STATUSES, (1, 8, 1))[0]
+        created_at = start + timedelta(seconds=i)
+        repository.add_transaction({
+            "transaction_id": str(uuid.uuid4()), "amount": rng.randrange(1, 100_000), "note": None,
+            "sender_id": f"u{sender}", "sender_email": emails[sender], "sender_name": f"用戶{sender}",
+            "receiver_id": f"u{receiver}", "receiver_email": emails[receiver], "receiver_name": f"用戶{receiver}",
+            "status": status, "created_at": created_at, "expires_at": None,
+            "completed_at": created_at + timedelta(seconds=rng.randrange(600)) if status == "completed" else None,
+        })
+    return emails, start
+
+
+def scenarios(emails, start, count):
+    hour = timedelta(hours=1)
+    middle = start + timedelta(seconds=count // 2)
+    return (
+        ("status", TransactionQuery(status="pending")),
+        ("status + created range (1h)", TransactionQuery(status="completed", created_from=middle, created_to=middle + hour)),
+        ("sender + status", TransactionQuery(sender_email=emails[1], status="completed")),
+        ("counterparty", TransactionQuery(counterparty=emails[2])),
+        ("counterparty + status + amount", TransactionQuery(counterparty=emails[3], status="completed", min_amount=50_000)),
+        ("completed range (1h)", TransactionQuery(completed_from=middle, completed_to=middle + hour)),
+        ("amount range (top 0.01%)", TransactionQuery(min_amount=99_990)),
+        ("status + amount + created range", TransactionQuery(
+            status="cancelled", min_amount=1_000, max_amount=2_000, created_from=middle, created_to=middle + 24 * hour)),
+    )
+
+
+def full_scan(transactions, query, limit):
+    """基線: 按時間倒序逐條檢查全部交易"""
+    ordered = sorted(transactions.values(), key=db.transaction_sort_key, reverse=True)
+    began = time.perf_counter()
+    result = list(islice((transaction for transaction in ordered if matches(query, transaction)), limit))
+    return result, time.perf_counter() - began
+
+
+def index_memory(transactions, indexes):
+    """以批量載入的方式重建同樣的複合索引，測量其內存佔用 (條目元組 + 列表)"""
+    tracemalloc.start()
+    rebuilt = [CompositeIndex(index.fields, index.order) for index in indexes]
+    for transaction in transactions.values():
+        for index in rebuilt:
+            index.append(transaction)
+    for index in rebuilt:
+        index.sort()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--accounts", type=int, default=10_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    repository = db.MemoryRepository()
+    began = time.perf_counter()
+    emails, start = populate(repository, args.accounts, args.transactions)
+    print(f"{args.transactions:,} transactions / {args.accounts:,} accounts loaded in {time.perf_counter() - began:.1f} s")
+    print(f"{'query':<34} {'plan':<44} {'candidates':>10} {'scanned':>8} {'rows':>5} {'median':>10} {'full scan':>10}")
+
+    for name, query in scenarios(emails, start, args.transactions):
+        timings = []
+        for _ in range(args.repeat):
+            began = time.perf_counter()
+            result, steps = repository.query_transactions(query, limit=args.limit)
+            timings.append(time.perf_counter() - began)
+        expected, scan_seconds = full_scan(repository.transactions, query, args.limit)
+        assert [t["transaction_id"] for t in result] == [t["transaction_id"] for t in expected], name
+        plan = " | ".join(step["index"] for step in steps)
+        candidates = sum(step["candidates"] for step in steps)
+        scanned = sum(step["scanned"] for step in steps)
+        print(f"{name:<34} {plan:<44} {candidates:>10,} {scanned:>8,} {len(result):>5} "
+              f"{statistics.median(timings) * 1_000_000:>8.1f}µs {scan_seconds * 1000:>8.1f}ms")
+
+    size = index_memory(repository.transactions, repository.composite_indexes)
+    print(f"composite indexes: {size / 2**20:.1f} MiB ({size / args.transactions:.0f} bytes/transaction)")
+
+
+if __name__ == "__main__":
+    main()
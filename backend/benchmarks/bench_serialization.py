@@ -0,0 +1,104 @@
+"""交易序列化基準測試: 比較 pydantic 兩次構建與直接編碼的每條記錄成本
+
+舊路徑: 路由返回 Transaction(**tx)，FastAPI 再按 response_model 校驗並序列化一次
+新路徑: 存儲中的字典直接編碼為 camelCase JSON
+
+用法: python benchmarks/bench_serialization.py [--transactions 10000] [--rounds 5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.models.transaction import Transaction
+from app.utils.serialization import encode_transaction, transactions_response
+
+LIST_FIELD = create_response_field(name="response", type_=List[Transaction])
+
+
+def make_history(count):
+    start = datetime.now() - timedelta(days=30)
+    sender_id, receiver_id = str(uuid.uuid4()), str(uuid.uuid4())
+    return [
+        {
+            "transaction_id": str(uuid.uuid4()),
+            "amount": (i % 100 + 1) * 100,
+            "note": "活動獎勵" if i % 3 == 0 else None,
+            "sender_id": sender_id,
+            "sender_email": "sender@example.com",
+            "sender_name": "發送者",
+            "receiver_id": receiver_id,
+            "receiver_email": "receiver@example.com",
+            "receiver_name": "接收者",
+            "status": "completed",
+            "created_at": start + timedelta(seconds=i),
+            "expires_at": start + timedelta(seconds=i, minutes=30),
+            "completed_at": start + timedelta(seconds=i, minutes=1),
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_list(history):
+    """舊的列表響應: 構建模型 -> response_model 校驗 -> JSONResponse"""
+    models = [Transaction(**tx) for tx in history]
+    content = asyncio.run(serialize_response(field=LIST_FIELD, response_content=models))
+    return JSONResponse(content).body
+
+
+def fast_list(history):
+    return transactions_response(history).body
+
+
+def legacy_ndjson(history):
+    return "".join(Transaction(**tx).model_dump_json(by_alias=True) + "\n" for tx in history)
+
+
+def fast_ndjson(history):
+    return "".join(encode_transaction(tx) + "\n" for tx in history)
+
+
+def measure(label, func, history, rounds):
+    best = float("inf")
+    for _ in range(rounds):
+        began = time.perf_counter()
+        func(history)
+        best = min(best, time.perf_counter() - began)
+    per_record = best / len(history) * 1_000_000
+    print(f"  {label:<28} {per_record:>8.2f} µs/record  ({best * 1000:,.1f} ms)")
+    return per_record
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--transactions", type=int, default=10_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    history = make_history(args.transactions)
+    assert legacy_ndjson(history) == fast_ndjson(history), "輸出不一致"
+    print(f"{args.transactions:,} transactions, best of {args.rounds} rounds")
+
+    print("[JSON list]")
+    before = measure("Transaction + response_model", legacy_list, history, args.rounds)
+    after = measure("direct encode", fast_list, history, args.rounds)
+    print(f"  speedup {before / after:.1f}x")
+
+    print("[NDJSON stream]")
+    before = measure("Transaction.model_dump_json", legacy_ndjson, history, args.rounds)
+    after = measure("direct encode", fast_ndjson, history, args.rounds)
+    print(f"  speedup {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""分片存儲基準測試: 多個客戶端進程通過分片後端執行轉賬 (open + close) 的總吞吐量
+
+每個客戶端進程模擬一個API worker，隨機選擇發送方與接收方；跨分片的轉賬走兩階段協議。
+結束後核對所有餘額與pending金額之和保持不變。吞吐量隨分片數增長的前提是機器有足夠的CPU核。
+
+用法: python benchmarks/bench_shards.py [--shards 1 2 4] [--workers 4] [--transfers 5000] [--users 1000]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from app.database.shard import ShardedRepository, start_shards
+
+SOCKET_DIR = "/tmp/bench-shards"
+BALANCE = 10 ** 9
+
+
+def email(i):
+    return f"user{i}@example.com"
+
+
+def new_transaction(sender):
+    now = datetime.now()
+    return {
+        "transaction_id": str(uuid.uuid4()),
+        "amount": 100,
+        "note": None,
+        "sender_id": sender,
+        "sender_email": sender,
+        "sender_name": sender,
+        "receiver_id": None,
+        "receiver_email": None,
+        "receiver_name": None,
+        "status": "pending",
+        "created_at": now,
+        "expires_at": now + timedelta(minutes=30),
+        "completed_at": None,
+    }
+
+
+def client(shards, users, transfers, seed):
+    repository = ShardedRepository(SOCKET_DIR, count=shards)
+    rng = random.Random(seed)
+    for _ in range(transfers):
+        sender, receiver = (email(i) for i in rng.sample(range(users), 2))
+        transaction = repository.open_transfer(new_transaction(sender))
+        repository.close_transfer(
+            transaction["transaction_id"], "completed", receiver,
+            receiver_id=receiver, receiver_email=receiver, receiver_name=receiver, completed_at=datetime.now(),
+        )
+    repository.close()
+
+
+def run(shards, workers, users, transfers):
+    processes = start_shards(shards, SOCKET_DIR)
+    repository = ShardedRepository(SOCKET_DIR, count=shards)
+    for i in range(users):
+        repository.add_user({
+            "email": email(i), "user_id": email(i), "name": email(i),
+            "hashed_password": "x", "balance": BALANCE, "created_at": datetime.now(),
+        })
+
+    context = multiprocessing.get_context("spawn")
+    clients = [context.Process(target=client, args=(shards, users, transfers, seed)) for seed in range(workers)]
+    began = time.perf_counter()
+    for process in clients:
+        process.start()
+    for process in clients:
+        process.join()
+    elapsed = time.perf_counter() - began
+
+    total = sum(repository.get_user(email(i))["balance"] for i in range(users))
+    assert total == users * BALANCE, f"餘額總和不一致: {total}"
+    repository.close()
+    for process in processes:
+        process.terminate()
+        process.wait()
+    return workers * transfers / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--transfers", type=int, default=5000, help="每個客戶端進程的轉賬數")
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.workers} client processes x {args.transfers:,} transfers, {args.users:,} users")
+    for shards in args.shards:
+        throughput = run(shards, args.workers, args.users, args.transfers)
+        print(f"  {shards} shard(s)  {throughput:>10,.0f} transfers/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""啟動時間基準測試: 比較 development 與 production 模式的冷啟動耗時
+
+每輪啟動一個新的 uvicorn 進程，測量從進程創建到首個請求成功的時間 (time-to-first-request)，
+以及首次請求 /openapi.json 的耗時 (production 模式讀取構建時導出的文檔)。
+另外單獨測量 import main 的耗時。
+
+用法: python benchmarks/bench_startup.py [--runs 5] [--port 5600]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+
+def environment(mode, schema_path):
+    env = dict(os.environ, APP_ENV=mode, OPENAPI_SCHEMA_PATH=schema_path, PYTHONPATH=SRC)
+    env.pop("DB_BACKEND", None)
+    return env
+
+
+def import_time(env):
+    code = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=SRC, env=env, check=True, capture_output=True, text=True)
+    return float(output.stdout.split()[-1])
+
+
+def fetch(url):
+    with urllib.request.urlopen(url, timeout=1) as response:
+        response.read()
+        return response.status
+
+
+def first_request(env, port):
+    """返回 (首個請求成功的耗時, 首次獲取OpenAPI文檔的耗時)"""
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=SRC, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                fetch(f"http://127.0.0.1:{port}/")
+                break
+            except OSError:
+                if server.poll() is not None:
+                    raise RuntimeError("服務啟動失敗")
+                time.sleep(0.005)
+        ready = time.perf_counter() - started
+        began = time.perf_counter()
+        fetch(f"http://127.0.0.1:{port}/openapi.json")
+        return ready, time.perf_counter() - began
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=5600)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        schema_path = os.path.join(directory, "openapi.json")
+        subprocess.run(
+            [sys.executable, "main.py", "--export-openapi", schema_path],
+            cwd=SRC, env=environment("development", schema_path), check=True, capture_output=True,
+        )
+
+        print(f"median of {args.runs} runs")
+        for mode in ("development", "production"):
+            env = environment(mode, schema_path)
+            imports = [import_time(env) for _ in range(args.runs)]
+            results = [first_request(env, args.port) for _ in range(args.runs)]
+            print(
+                f"  {mode:<12} import main {statistics.median(imports) * 1000:>6.0f} ms"
+                f"   first request {statistics.median(r[0] for r in results) * 1000:>6.0f} ms"
+                f"   first /openapi.json {statistics.median(r[1] for r in results) * 1000:>5.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
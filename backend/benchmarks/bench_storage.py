@@ -0,0 +1,102 @@
+"""存儲後端基準測試: 比較 memory 與 sqlite 後端的讀寫吞吐
+
+用法: python benchmarks/bench_storage.py [--transactions 100000] [--users 1000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from app.database.db import create_repository
+
+
+def make_users(count):
+    now = datetime.now()
+    return [
+        {
+            "user_id": str(uuid.uuid4()),
+            "email": f"user{i}@example.com",
+            "name": f"用戶{i}",
+            "hashed_password": "x",
+            "balance": 1_000_000,
+            "created_at": now,
+        }
+        for i in range(count)
+    ]
+
+
+def make_transactions(users, count):
+    start = datetime.now() - timedelta(days=30)
+    transactions = []
+    for i in range(count):
+        sender, receiver = random.sample(users, 2)
+        transactions.append({
+            "transaction_id": str(uuid.uuid4()),
+            "amount": random.randint(1, 100),
+            "note": None,
+            "sender_id": sender["user_id"],
+            "sender_email": sender["email"],
+            "sender_name": sender["name"],
+            "receiver_id": receiver["user_id"],
+            "receiver_email": receiver["email"],
+            "receiver_name": receiver["name"],
+            "status": "completed",
+            "created_at": start + timedelta(seconds=i),
+            "expires_at": None,
+            "completed_at": start + timedelta(seconds=i),
+        })
+    return transactions
+
+
+def timed(label, operations, func):
+    began = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - began
+    print(f"  {label:<28} {operations / elapsed:>12,.0f} ops/s  ({elapsed * 1000:,.1f} ms)")
+
+
+def run(backend, users, transactions, lookups, **options):
+    print(f"[{backend}]")
+    repository = create_repository(backend, **options)
+    timed("add_user", len(users), lambda: [repository.add_user(dict(user)) for user in users])
+    timed("add_transactions (batch)", len(transactions), lambda: repository.add_transactions([dict(tx) for tx in transactions]))
+
+    sample_users = random.choices(users, k=lookups)
+    sample_transactions = random.choices(transactions, k=lookups)
+    timed("get_user", lookups, lambda: [repository.get_user(user["email"]) for user in sample_users])
+    timed("get_transaction", lookups, lambda: [repository.get_transaction(tx["transaction_id"]) for tx in sample_transactions])
+    timed("adjust_balance", lookups, lambda: [repository.adjust_balance(user["email"], 1) for user in sample_users])
+    timed("history page (limit=50)", lookups, lambda: [repository.get_user_transactions(user["user_id"], limit=50) for user in sample_users])
+    timed(
+        "update_transaction status",
+        lookups,
+        lambda: [repository.update_transaction(tx["transaction_id"], status="cancelled") for tx in sample_transactions],
+    )
+    repository.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--transactions", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=5000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    users = make_users(args.users)
+    transactions = make_transactions(users, args.transactions)
+    print(f"{args.users:,} users, {args.transactions:,} transactions, {args.lookups:,} lookups")
+
+    run("memory", users, transactions, args.lookups)
+    with tempfile.TemporaryDirectory() as directory:
+        run("sqlite", users, transactions, args.lookups, path=os.path.join(directory, "bench.db"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""全流程壓測: register → login → prepare → public GET → confirm，以及不同歷史規模下的交易列表
+
+--transport asgi     在本進程內通過 ASGI 直接調用應用 (不經過網絡)
+--transport uvicorn  在子進程中啟動 uvicorn，通過本地HTTP調用
+
+結果 (每個端點的吞吐量與 p50/p95/p99) 寫入 --output 指定的JSON文件；
+指定 --baseline 時與基準比較，p95 變慢或吞吐量下降超過 --tolerance 即標記為退化並以狀態碼1退出。
+
+用法:
+  python benchmarks/loadtest.py [--transport asgi|uvicorn] [--backend memory|sqlite]
+      [--users 20] [--transfers 10] [--concurrency 20]
+      [--history 1000,100000,1000000] [--history-requests 200]
+      [--output loadtest.json] [--baseline baseline.json] [--save-baseline] [--tolerance 0.2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+sys.path.insert(0, SRC)
+
+PASSWORD = "loadtest-password"
+SEED_CHUNK = 50_000
+COUNTERPARTIES = 10
+
+
+def history_email(size):
+    return f"history-{size}@example.com"
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+# ---------- 服務端: 載入歷史數據 ----------
+
+def seed_history(sizes):
+    """為每個規模創建一個擁有對應數量交易的用戶 (需在導入 main 之後調用)"""
+    from app.database import db
+    from app.utils.auth import get_password_hash
+
+    hashed = get_password_hash(PASSWORD)
+    now = datetime.now()
+    for size in sizes:
+        owner = db.add_user({
+            "user_id": str(uuid.uuid4()), "email": history_email(size), "name": f"history{size}",
+            "hashed_password": hashed, "balance": 0, "created_at": now,
+        })
+        peers = [
+            db.add_user({
+                "user_id": str(uuid.uuid4()), "email": f"peer{i}-{size}@example.com", "name": f"peer{i}",
+                "hashed_password": hashed, "balance": 0, "created_at": now,
+            })
+            for i in range(COUNTERPARTIES)
+        ]
+        start = now - timedelta(seconds=size)
+        for offset in range(0, size, SEED_CHUNK):
+            chunk = []
+            for i in range(offset, min(offset + SEED_CHUNK, size)):
+                peer = peers[i % COUNTERPARTIES]
+                sender, receiver = (owner, peer) if i % 2 else (peer, owner)
+                created_at = start + timedelta(seconds=i)
+                chunk.append({
+                    "transaction_id": str(uuid.uuid4()), "amount": 100, "note": None,
+                    "sender_id": sender["user_id"], "sender_email": sender["email"], "sender_name": sender["name"],
+                    "receiver_id": receiver["user_id"], "receiver_email": receiver["email"],
+                    "receiver_name": receiver["name"],
+                    "status": "completed", "created_at": created_at, "expires_at": None, "completed_at": created_at,
+                })
+            db.repository.add_transactions(chunk)
+
+
+def serve(port, sizes):
+    import uvicorn
+    from main import app
+
+    seed_history(sizes)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+# ---------- 客戶端: 場景與統計 ----------
+
+class Recorder:
+    """按端點記錄延遲、錯誤數與首末請求時間"""
+
+    def __init__(self):
+        self.samples = {}
+
+    async def call(self, name, request, expected):
+        entry = self.samples.setdefault(name, {"latencies": [], "errors": 0, "first": None, "last": None})
+        started = time.perf_counter()
+        response = await request
+        finished = time.perf_counter()
+        entry["latencies"].append((finished - started) * 1000)
+        entry["first"] = started if entry["first"] is None else min(entry["first"], started)
+        entry["last"] = finished if entry["last"] is None else max(entry["last"], finished)
+        if response.status_code != expected:
+            entry["errors"] += 1
+        return response
+
+    def report(self):
+        results = {}
+        for name, entry in self.samples.items():
+            latencies = entry["latencies"]
+            elapsed = entry["last"] - entry["first"]
+            results[name] = {
+                "requests": len(latencies),
+                "errors": entry["errors"],
+                "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+                "p50_ms": round(percentile(latencies, 0.50), 3),
+                "p95_ms": round(percentile(latencies, 0.95), 3),
+                "p99_ms": round(percentile(latencies, 0.99), 3),
+            }
+        return results
+
+
+async def gather_limited(concurrency, coroutines):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(limited(coroutine) for coroutine in coroutines))
+
+
+async def run_scenarios(client, recorder, args, sizes):
+    run_id = uuid.uuid4().hex[:8]
+    emails = [f"load{i}-{run_id}@example.com" for i in range(args.users)]
+
+    # 1. 註冊
+    await gather_limited(args.concurrency, (
+        recorder.call("register", client.post("/api/auth/register", json={
+            "email": email, "name": f"load{i}", "password": PASSWORD,
+        }), 201)
+        for i, email in enumerate(emails)
+    ))
+
+    # 2. 登入
+    async def login(email):
+        response = await recorder.call(
+            "login", client.post("/api/auth/login", data={"username": email, "password": PASSWORD}), 200
+        )
+        return {"Authorization": "Bearer " + response.json()["access_token"]}
+
+    headers = await gather_limited(args.concurrency, (login(email) for email in emails))
+
+    # 3. 轉帳: 每個用戶向下一個用戶發送，接收方通過公共連結確認
+    async def transfer(sender, receiver_email):
+        for _ in range(args.transfers):
+            response = await recorder.call(
+                "prepare", client.post("/api/transactions/prepare", json={"amount": 1, "note": "load"}, headers=sender), 201
+            )
+            transaction_id = response.json()["transactionId"]
+            await recorder.call("public_get", client.get(f"/api/transactions/public/{transaction_id}"), 200)
+            await recorder.call("confirm", client.post(
+                f"/api/transactions/public/{transaction_id}/confirm",
+                json={"email": receiver_email, "name": "receiver"},
+            ), 200)
+
+    await gather_limited(args.concurrency, (
+        transfer(headers[i], emails[(i + 1) % len(emails)]) for i in range(len(emails))
+    ))
+
+    # 4. 不同歷史規模下的交易列表 (第一頁)
+    for size in sizes:
+        response = await client.post("/api/auth/login", data={"username": history_email(size), "password": PASSWORD})
+        history_headers = {"Authorization": "Bearer " + response.json()["access_token"]}
+        await gather_limited(args.concurrency, (
+            recorder.call(
+                f"history_{size}", client.get("/api/users/me/transactions", params={"limit": 50}, headers=history_headers), 200
+            )
+            for _ in range(args.history_requests)
+        ))
+
+
+async def run_asgi(args, sizes):
+    import httpx
+    from main import app
+
+    seed_history(sizes)
+    recorder = Recorder()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest") as client:
+        await run_scenarios(client, recorder, args, sizes)
+    return recorder.report()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_ready(client, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("uvicorn 子進程已退出")
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError("等待 uvicorn 啟動超時")
+
+
+async def run_uvicorn(args, sizes):
+    import httpx
+
+    port = free_port()
+    command = [sys.executable, __file__, "--serve", str(port), "--history", ",".join(map(str, sizes))]
+    process = subprocess.Popen(command, env=os.environ.copy())
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            await wait_until_ready(client, process, timeout=args.startup_timeout)
+            recorder = Recorder()
+            await run_scenarios(client, recorder, args, sizes)
+        return recorder.report()
+    finally:
+        process.terminate()
+        process.wait()
+
+
+# ---------- 基準比較 ----------
+
+def compare(results, baseline, tolerance):
+    """返回退化的端點列表"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if previous is None:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if previous["throughput_rps"] and current["throughput_rps"] is not None \
+                and current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} req/s")
+    return regressions
+
+
+def print_table(results):
+    print(f"  {'endpoint':<16} {'requests':>8} {'errors':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, row in results.items():
+        print(
+            f"  {name:<16} {row['requests']:>8} {row['errors']:>6} {row['throughput_rps'] or 0:>9,.1f} "
+            f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transport", choices=("asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--transfers", type=int, default=10, help="每個用戶的轉帳次數")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--history", default="1000,100000,1000000", help="歷史交易規模，逗號分隔，空字符串表示跳過")
+    parser.add_argument("--history-requests", type=int, default=200)
+    parser.add_argument("--output", default="loadtest.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="將本次結果寫入 --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.history.split(",") if size]
+
+    # 子進程已繼承父進程設定的環境變量
+    if args.serve:
+        serve(args.serve, sizes)
+        return
+
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # 壓測客戶端只有一個IP，關閉限流與並發上限
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DB_BACKEND"] = args.backend
+        os.environ["SQLITE_PATH"] = os.path.join(directory, "loadtest.db")
+        runner = run_asgi if args.transport == "asgi" else run_uvicorn
+        began = time.perf_counter()
+        results = asyncio.run(runner(args, sizes))
+        elapsed = time.perf_counter() - began
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "transport": args.transport,
+        "backend": args.backend,
+        "python": platform.python_version(),
+        "config": {
+            "users": args.users, "transfers": args.transfers, "concurrency": args.concurrency,
+            "history": sizes, "history_requests": args.history_requests,
+        },
+        "elapsed_s": round(elapsed, 2),
+        "endpoints": results,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2, ensure_ascii=False)
+    print(f"[{args.transport}/{args.backend}] {elapsed:.1f}s -> {args.output}")
+    print_table(results)
+
+    if not args.baseline:
+        return
+    if args.save_baseline:
+        with open(args.baseline, "w") as output:
+            json.dump(report, output, indent=2, ensure_ascii=False)
+        print(f"baseline saved: {args.baseline}")
+        return
+    with open(args.baseline) as source:
+        baseline = json.load(source)
+    for key in ("transport", "backend", "config"):
+        if baseline.get(key) != report[key]:
+            print(f"warning: baseline {key} differs ({baseline.get(key)} vs {report[key]})")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"REGRESSION (tolerance {args.tolerance:.0%}):")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"no regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
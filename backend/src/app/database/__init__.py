@@ -1,3 +1,23 @@
-from app.database.db import get_db, init_db, users_db, transactions_db
+from app.database.db import (
+    get_db, init_db, users_db, transactions_db,
+    Repository, MemoryRepository, create_repository, add_user_listener, add_transaction_listener,
+    get_user, add_user, adjust_balance, open_transfer, open_transfers, close_transfer,
+    get_transaction, add_transaction, update_transaction, iter_user_transactions,
+    get_user_transactions, get_transactions_by_status, get_transactions, get_ledger, Ledger,
+    might_contain_transaction, transaction_filter_stats, query_transactions, call_storage
+)
+from app.database.records import TransactionRecord
+from app.database.bloom import BloomFilter
+from app.database.query import TransactionQuery
+from app.database.journal import JournaledMemoryRepository, JournalError, GroupCommit, durable_commits
 
-__all__ = ["get_db", "init_db", "users_db", "transactions_db"]
+__all__ = [
+    "get_db", "init_db", "users_db", "transactions_db",
+    "Repository", "MemoryRepository", "create_repository", "add_user_listener", "add_transaction_listener",
+    "get_user", "add_user", "adjust_balance", "open_transfer", "open_transfers", "close_transfer",
+    "get_transaction", "add_transaction", "update_transaction", "iter_user_transactions",
+    "get_user_transactions", "get_transactions_by_status", "get_transactions", "get_ledger", "Ledger",
+    "might_contain_transaction", "transaction_filter_stats", "query_transactions", "call_storage",
+    "TransactionRecord", "TransactionQuery", "BloomFilter", "JournaledMemoryRepository",
+    "JournalError", "GroupCommit", "durable_commits"
+]
@@ -0,0 +1,145 @@
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+
+# 交易ID過濾器配置 - 容量為預計的交易總數，超出後假陽性率逐漸升高 (不會產生假陰性)
+# TRANSACTION_FILTER_CAPACITY=0 時關閉過濾器
+TRANSACTION_FILTER_CAPACITY = int(os.getenv("TRANSACTION_FILTER_CAPACITY", "1000000"))
+TRANSACTION_FILTER_ERROR_RATE = float(os.getenv("TRANSACTION_FILTER_ERROR_RATE", "0.001"))
+
+# 緩衝區頭部: 標記、位數、哈希函數個數、設計容量、是否已被新文件取代、已加入的key數
+_HEADER = struct.Struct("<8sQQQQQ")
+_FIELD = struct.Struct("<Q")
+_RETIRED_OFFSET = _HEADER.size - 2 * _FIELD.size
+_COUNT_OFFSET = _HEADER.size - _FIELD.size
+_MAGIC = b"PTXBLOOM"
+_MASK64 = (1 << 64) - 1
+
+def _positions(key, bits, hashes):
+    """雙重哈希: 由一次128位blake2b摘要生成 hashes 個位置 (各進程結果一致，不受哈希隨機化影響)"""
+    digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=16).digest(), "little")
+    first, step = digest & _MASK64, (digest >> 64) | 1
+    for i in range(hashes):
+        yield (first + i * step) % bits
+
+def _layout(capacity, error_rate):
+    """按容量與目標假陽性率計算位數 (按字節對齊) 與最優哈希函數個數"""
+    bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2 / 8) * 8)
+    hashes = max(1, round(bits / capacity * math.log(2)))
+    return bits, hashes
+
+class BloomFilter:
+    """布隆過濾器 - 判斷key是否一定不存在: 沒有假陰性，假陽性率由容量與位數決定
+
+    頭部與位數組保存在同一塊緩衝區中，可以是進程內的 bytearray，也可以是共享的 mmap 文件
+    (分片進程寫入，各worker只讀映射)。只增不刪: 已刪除的key仍判為可能存在，由存儲確認。
+    寫入方重建文件時先替換文件再標記舊文件已取代，讀者發現標記後重新打開。
+    """
+
+    def __init__(self, buffer):
+        magic, self.bits, self.hashes, self.capacity, _, _ = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC:
+            raise ValueError("不是布隆過濾器數據")
+        self.buffer = buffer
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, capacity, error_rate=TRANSACTION_FILTER_ERROR_RATE, path=None):
+        """創建空的過濾器；指定 path 時寫入文件並以可寫的共享 mmap 映射"""
+        bits, hashes = _layout(capacity, error_rate)
+        header = _HEADER.pack(_MAGIC, bits, hashes, capacity, 0, 0)
+        size = _HEADER.size + bits // 8
+        if path is None:
+            buffer = bytearray(size)
+            buffer[:_HEADER.size] = header
+            return cls(buffer)
+        # 先寫臨時文件再替換，讀者不會讀到寫了一半的文件；替換後才標記舊文件，讀者重新打開時已是新文件
+        temporary = f"{path}.tmp"
+        with open(temporary, "w+b") as target:
+            target.write(header)
+            target.truncate(size)
+            buffer = mmap.mmap(target.fileno(), size)
+        previous = _open_existing(path)
+        os.replace(temporary, path)
+        _retire(previous)
+        return cls(buffer)
+
+    @classmethod
+    def open(cls, path):
+        """只讀映射其他進程創建的過濾器文件，文件不存在時返回None"""
+        try:
+            with open(path, "rb") as source:
+                return cls(mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ))
+        except FileNotFoundError:
+            return None
+
+    @property
+    def count(self):
+        return _FIELD.unpack_from(self.buffer, _COUNT_OFFSET)[0]
+
+    @property
+    def retired(self):
+        """文件已被寫入方重建或刪除，映射中的數據不再更新"""
+        return _FIELD.unpack_from(self.buffer, _RETIRED_OFFSET)[0] != 0
+
+    def add(self, key):
+        buffer = self.buffer
+        # 逐字節的讀-改-寫不是原子的，並發寫入需要加鎖
+        with self._lock:
+            for position in _positions(key, self.bits, self.hashes):
+                buffer[_HEADER.size + (position >> 3)] |= 1 << (position & 7)
+            _FIELD.pack_into(buffer, _COUNT_OFFSET, self.count + 1)
+
+    def __contains__(self, key):
+        buffer = self.buffer
+        for position in _positions(key, self.bits, self.hashes):
+            if not buffer[_HEADER.size + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    def stats(self):
+        """容量、內存佔用與按當前key數估算的假陽性率"""
+        count = self.count
+        fill = 1 - math.exp(-self.hashes * count / self.bits)
+        return {
+            "capacity": self.capacity,
+            "count": count,
+            "bits": self.bits,
+            "hashes": self.hashes,
+            "bytes": len(self.buffer),
+            "false_positive_rate": fill ** self.hashes,
+        }
+
+def _open_existing(path):
+    try:
+        return open(path, "r+b")
+    except FileNotFoundError:
+        return None
+
+def _retire(source):
+    if source is None:
+        return
+    with source:
+        source.seek(_RETIRED_OFFSET)
+        source.write(_FIELD.pack(1))
+
+def remove_file(path):
+    """刪除過濾器文件並標記為已取代，仍映射著它的讀者不再據此判定"""
+    previous = _open_existing(path)
+    if previous is not None:
+        os.remove(path)
+        _retire(previous)
+
+def merge_stats(stats):
+    """合併多個過濾器 (如各分片) 的統計: key按哈希均勻分佈到各過濾器，假陽性率取平均"""
+    stats = list(stats)
+    if not stats:
+        return None
+    merged = {field: sum(item[field] for item in stats) for field in ("capacity", "count", "bits", "bytes")}
+    merged["hashes"] = max(item["hashes"] for item in stats)
+    merged["false_positive_rate"] = sum(item["false_positive_rate"] for item in stats) / len(stats)
+    merged["filters"] = len(stats)
+    return merged
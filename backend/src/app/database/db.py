@@ -1,41 +1,485 @@
+import os
 import uuid
+import logging
+import threading
+import heapq
+from bisect import insort, bisect_left
+from itertools import islice
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
 from fastapi import Depends
+from starlette.concurrency import run_in_threadpool
 
-# 密碼加密工具
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.database.records import INITIAL_VERSION, TransactionRecord, transaction_sort_key
+from app.database.query import CompositeIndex, execute as execute_query
+from app.database.ledger import Ledger, LedgerColumns
+from app.models.money import INITIAL_BALANCE, to_minor
+
+logger = logging.getLogger(__name__)
+
+# 測試用戶密碼 (password123) 的bcrypt哈希 - 預先計算，啟動時無需執行bcrypt
+TEST_USER_PASSWORD_HASH = "$2b$12$XTL2reZhsZWIo4/oPLbIpuxrTmCWzawp/6Vu0SpbacRkxNGQoO.YG"
+
+# 存儲後端配置: memory (默認)、journal (內存+追加日誌)、sharded (多進程分片) 或 sqlite
+DB_BACKEND = os.getenv("DB_BACKEND", "memory")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/points.db")
 
 # 內存數據庫 - 將users_db的key從user_id改為email
 users_db = {}
 transactions_db = {}
 
+# 對賬用的列式流水 - 交易寫入時追加，對賬快照直接複製
+ledger_columns = LedgerColumns()
+
+# 交易二級索引 - 每個key對應按 (created_at, transaction_id) 排序的列表
+transactions_by_sender = {}
+transactions_by_receiver = {}
+transactions_by_status = {}
+
+# 查詢用的複合索引 - 按email與狀態分組，或按狀態分組後以結算時間、金額排序
+transaction_query_indexes = (
+    CompositeIndex(("sender_email", "status")),
+    CompositeIndex(("receiver_email", "status")),
+    CompositeIndex(("status",), order="completed_at"),
+    CompositeIndex(("status",), order="amount"),
+)
+
+def _index_add(index, key, transaction):
+    """將交易加入索引 (按創建時間遞增，新交易通常直接追加在末尾)"""
+    if key is None:
+        return
+    insort(index.setdefault(key, []), transaction_sort_key(transaction))
+
+def _index_remove(index, key, transaction):
+    """從索引中移除交易"""
+    entries = index.get(key)
+    if not entries:
+        return
+    sort_key = transaction_sort_key(transaction)
+    position = bisect_left(entries, sort_key)
+    if position < len(entries) and entries[position] == sort_key:
+        del entries[position]
+    if not entries:
+        del index[key]
+
+def _iter_index_desc(entries, before=None):
+    """從索引末尾向前遍歷，可選從指定排序鍵之前開始"""
+    position = len(entries) if before is None else bisect_left(entries, before)
+    for i in range(position - 1, -1, -1):
+        yield entries[i]
+
+def change_balance(user, delta):
+    """增減內存中用戶記錄的餘額並遞增版本號 (調用方持有鎖)"""
+    user["balance"] += delta
+    user["version"] += 1
+
+class Repository:
+    """存儲後端接口
+
+    用戶與交易均以dict形式讀寫，欄位與 UserInDB / TransactionInDB 一致。
+    每次修改記錄 (餘額、交易狀態等) 時版本號 version 加1，新記錄的版本號為 INITIAL_VERSION。
+    列表查詢按 (created_at, transaction_id) 倒序返回，before 為游標排序鍵。
+    """
+
+    # 數據是否只在本進程內可變 (決定能否在進程內緩存用戶數據)
+    process_local = False
+
+    def get_user(self, email):
+        raise NotImplementedError
+
+    def add_user(self, user):
+        raise NotImplementedError
+
+    def adjust_balance(self, email, delta):
+        """增減用戶餘額，返回更新後的用戶"""
+        raise NotImplementedError
+
+    def get_transaction(self, transaction_id):
+        raise NotImplementedError
+
+    def add_transaction(self, transaction):
+        raise NotImplementedError
+
+    def add_transactions(self, transactions):
+        """批量寫入交易"""
+        for transaction in transactions:
+            self.add_transaction(transaction)
+
+    def update_transaction(self, transaction_id, **changes):
+        """更新交易欄位，返回更新後的交易"""
+        raise NotImplementedError
+
+    def open_transfer(self, transaction):
+        """扣除發送方餘額並存儲待處理交易 (原子操作)，餘額不足時返回None"""
+        raise NotImplementedError
+
+    def open_transfers(self, sender_email, transactions):
+        """按總額一次性扣除發送方餘額並存儲多筆待處理交易 (原子操作)，餘額不足時返回None"""
+        raise NotImplementedError
+
+    def close_transfer(self, transaction_id, status, credit_email, **changes):
+        """將pending交易轉為指定狀態，並把金額記入 credit_email 的餘額 (原子CAS)
+
+        交易已不是pending時返回None，保證同一筆交易只會被結算一次
+        """
+        raise NotImplementedError
+
+    def iter_user_transactions(self, user_id, before=None):
+        raise NotImplementedError
+
+    def get_user_transactions(self, user_id, before=None, limit=None):
+        return list(islice(self.iter_user_transactions(user_id, before), limit))
+
+    def get_transactions_by_status(self, status):
+        raise NotImplementedError
+
+    def get_transactions(self, before=None, limit=None):
+        """按排序鍵倒序返回全部交易，供分批導出"""
+        raise NotImplementedError
+
+    def get_ledger(self):
+        """返回全部賬戶餘額與交易的列式快照 (Ledger)，供對賬使用"""
+        raise NotImplementedError
+
+    def query_transactions(self, query, before=None, limit=None):
+        """按條件 (TransactionQuery) 查詢交易，按排序鍵倒序返回 (交易列表, 查詢計劃說明)"""
+        raise NotImplementedError
+
+    def might_contain_transaction(self, transaction_id):
+        """交易ID成員過濾: 返回False時交易一定不存在，無需訪問存儲；沒有過濾器的後端總是返回True"""
+        return True
+
+    def transaction_filter_stats(self):
+        """交易ID過濾器的容量、內存佔用與估算的假陽性率，沒有過濾器時返回None"""
+        return None
+
+    def close(self):
+        pass
+
+class MemoryRepository(Repository):
+    """內存存儲後端 - 數據保存在模塊級dict中，進程重啟後丟失
+
+    compact=True 時交易以 TransactionRecord 存儲 (索引與記錄共享排序鍵)，否則保存原始dict
+    """
+
+    process_local = True
+
+    def __init__(self, compact=True):
+        self.compact = compact
+        self.users = users_db
+        self.transactions = transactions_db
+        # 保護餘額與交易狀態的讀-檢查-修改
+        self._lock = threading.Lock()
+        # 交易欄位與其對應索引
+        self.indexes = {
+            "sender_id": transactions_by_sender,
+            "receiver_id": transactions_by_receiver,
+            "status": transactions_by_status,
+        }
+        # 複合索引在寫入與欄位變更時維護；查詢計劃另外可以使用按創建時間排序的狀態索引
+        self.composite_indexes = transaction_query_indexes
+        self.query_indexes = (CompositeIndex(("status",), entries=transactions_by_status), *self.composite_indexes)
+        self.ledger = ledger_columns
+
+    def get_user(self, email):
+        return self.users.get(email)
+
+    def add_user(self, user):
+        user.setdefault("version", INITIAL_VERSION)
+        # 與 get_ledger 的用戶快照互斥: 註冊不會在遍歷用戶表時改變其大小
+        with self._lock:
+            self.users[user["email"]] = user
+        return user
+
+    def adjust_balance(self, email, delta):
+        with self._lock:
+            user = self.users[email]
+            change_balance(user, delta)
+        return user
+
+    def get_transaction(self, transaction_id):
+        return self.transactions.get(transaction_id)
+
+    def might_contain_transaction(self, transaction_id):
+        # 交易表本身就是精確的成員集合，不需要額外的過濾器
+        return transaction_id in self.transactions
+
+    def add_transaction(self, transaction):
+        return self._store_transaction(transaction)
+
+    def update_transaction(self, transaction_id, **changes):
+        return self._update_fields(self.transactions[transaction_id], changes)
+
+    # 以下內部方法供組合操作調用，子類只需覆蓋公開方法即可攔截每個操作一次
+
+    def _store_transaction(self, transaction):
+        if self.compact and not isinstance(transaction, TransactionRecord):
+            transaction = TransactionRecord(transaction)
+        elif not self.compact:
+            transaction.setdefault("version", INITIAL_VERSION)
+        if transaction["transaction_id"] in self.transactions:
+            # 同一ID重新寫入時列式流水中的舊行無法定位，下次對賬時重建
+            self.ledger.invalidate()
+        else:
+            self.ledger.add(transaction)
+        self.transactions[transaction["transaction_id"]] = transaction
+        for field, index in self.indexes.items():
+            _index_add(index, transaction.get(field), transaction)
+        for index in self.composite_indexes:
+            index.add(transaction)
+        return transaction
+
+    def _update_fields(self, transaction, changes):
+        # 已索引的欄位變更時同步更新索引 (複合索引先按舊值移除，修改後重新加入)
+        affected = [index for index in self.composite_indexes if not index.columns.isdisjoint(changes)]
+        for index in affected:
+            index.remove(transaction)
+        for field, value in changes.items():
+            index = self.indexes.get(field)
+            old_value = transaction.get(field)
+            if index is not None and old_value != value:
+                _index_remove(index, old_value, transaction)
+                transaction[field] = value
+                _index_add(index, value, transaction)
+            else:
+                transaction[field] = value
+        for index in affected:
+            index.add(transaction)
+        if "sender_email" in changes or "amount" in changes:
+            self.ledger.invalidate()
+        elif "status" in changes or "receiver_email" in changes:
+            self.ledger.update(transaction)
+        transaction["version"] += 1
+        return transaction
+
+    def open_transfer(self, transaction):
+        with self._lock:
+            sender = self.users.get(transaction["sender_email"])
+            if sender is None or sender["balance"] < transaction["amount"]:
+                return None
+            change_balance(sender, -transaction["amount"])
+            return self._store_transaction(transaction)
+
+    def open_transfers(self, sender_email, transactions):
+        total = sum(transaction["amount"] for transaction in transactions)
+        with self._lock:
+            sender = self.users.get(sender_email)
+            if sender is None or sender["balance"] < total:
+                return None
+            change_balance(sender, -total)
+            return [self._store_transaction(transaction) for transaction in transactions]
+
+    def close_transfer(self, transaction_id, status, credit_email, **changes):
+        with self._lock:
+            transaction = self.transactions.get(transaction_id)
+            if transaction is None or transaction["status"] != "pending":
+                return None
+            self._update_fields(transaction, {"status": status, **changes})
+            account = self.users.get(credit_email)
+            if account is not None:
+                change_balance(account, transaction["amount"])
+            return transaction
+
+    def iter_user_transactions(self, user_id, before=None):
+        # 成本為 O(該用戶交易數)，無需掃描全部交易
+        sent = transactions_by_sender.get(user_id, [])
+        received = transactions_by_receiver.get(user_id, [])
+        last_key = None
+        merged = heapq.merge(_iter_index_desc(sent, before), _iter_index_desc(received, before), reverse=True)
+        for sort_key in merged:
+            # 自己發給自己的交易會同時出現在兩個索引中
+            if sort_key == last_key:
+                continue
+            last_key = sort_key
+            yield self.transactions[sort_key[1]]
+
+    def get_transactions_by_status(self, status):
+        entries = transactions_by_status.get(status, [])
+        return [self.transactions[transaction_id] for _, transaction_id in reversed(entries)]
+
+    def get_transactions(self, before=None, limit=None):
+        # 每筆交易都在且只在一個狀態索引中，合併各狀態索引即為全部交易的有序視圖
+        iterators = [_iter_index_desc(entries, before) for entries in transactions_by_status.values()]
+        merged = heapq.merge(*iterators, reverse=True)
+        return [self.transactions[transaction_id] for _, transaction_id in islice(merged, limit)]
+
+    def query_transactions(self, query, before=None, limit=None):
+        # 在鎖內執行: 結算會移動交易在複合索引中的位置
+        with self._lock:
+            return execute_query(self.query_indexes, self.transactions, query, before, limit)
+
+    def get_ledger(self):
+        # 餘額與交易列在鎖內讀取: 快照中沒有進行到一半的扣款或結算
+        with self._lock:
+            accounts = list(self.users.items())
+            balances = [user["balance"] for _, user in accounts]
+            columns = self.ledger.snapshot(self.transactions)
+        emails = [email for email, _ in accounts]
+        return Ledger(emails, balances, *columns)
+
+def create_repository(backend=None, **options):
+    """根據配置創建存儲後端"""
+    backend = backend or DB_BACKEND
+    if backend == "memory":
+        return MemoryRepository(compact=options.get("compact", True))
+    if backend == "sqlite":
+        from app.database.sqlite import SQLiteRepository
+        return SQLiteRepository(options.get("path", SQLITE_PATH), pool_size=options.get("pool_size", 4))
+    if backend == "journal":
+        from app.database.journal import JournaledMemoryRepository, JOURNAL_DIR
+        return JournaledMemoryRepository(options.get("path", JOURNAL_DIR), compact=options.get("compact", True))
+    if backend == "sharded":
+        from app.database.shard import ShardedRepository, SHARD_SOCKET_DIR, SHARD_COUNT
+        return ShardedRepository(options.get("path", SHARD_SOCKET_DIR), count=options.get("count", SHARD_COUNT))
+    raise ValueError(f"未知的存儲後端: {backend}")
+
+# 當前使用的存儲後端
+repository = create_repository()
+
+# 用戶數據變更監聽器 - 回調參數為用戶email
+_user_listeners = []
+# 交易狀態變更監聽器 - 回調參數為交易dict
+_transaction_listeners = []
+
+def add_user_listener(callback):
+    """註冊用戶數據(如餘額)變更時的回調"""
+    _user_listeners.append(callback)
+
+def add_transaction_listener(callback):
+    """註冊交易創建或結算時的回調"""
+    _transaction_listeners.append(callback)
+
+async def call_storage(function, *args, **kwargs):
+    """在異步路由中調用存儲操作 (本模塊的函數)
+
+    進程內存儲直接執行，不切換線程；分片與SQLite後端的調用要等待IPC或磁盤，
+    放到線程池執行，不阻塞事件循環。
+    """
+    if repository.process_local:
+        return function(*args, **kwargs)
+    return await run_in_threadpool(function, *args, **kwargs)
+
+def _notify_user_change(email):
+    for callback in _user_listeners:
+        callback(email)
+
+def _notify_transaction_change(transaction):
+    for callback in _transaction_listeners:
+        callback(transaction)
+
+def get_user(email):
+    """按email查找用戶"""
+    return repository.get_user(email)
+
+def add_user(user):
+    """存儲新用戶"""
+    return repository.add_user(user)
+
+def adjust_balance(email, delta):
+    """增減用戶餘額"""
+    user = repository.adjust_balance(email, delta)
+    _notify_user_change(email)
+    return user
+
+def get_transaction(transaction_id):
+    """按ID查找交易"""
+    return repository.get_transaction(transaction_id)
+
+def add_transaction(transaction):
+    """存儲新交易並更新索引"""
+    return repository.add_transaction(transaction)
+
+def update_transaction(transaction_id, **changes):
+    """更新交易欄位，已索引的欄位變更時同步更新索引"""
+    return repository.update_transaction(transaction_id, **changes)
+
+def open_transfer(transaction):
+    """扣除發送方餘額並創建待處理交易，餘額不足時返回None"""
+    result = repository.open_transfer(transaction)
+    if result is not None:
+        _notify_user_change(transaction["sender_email"])
+        _notify_transaction_change(result)
+    return result
+
+def open_transfers(sender_email, transactions):
+    """批量創建待處理交易，按總額一次性扣款，餘額不足時返回None"""
+    result = repository.open_transfers(sender_email, transactions)
+    if result is not None:
+        _notify_user_change(sender_email)
+        for transaction in result:
+            _notify_transaction_change(transaction)
+    return result
+
+def close_transfer(transaction_id, status, credit_email, **changes):
+    """結算pending交易並入賬，交易已被處理時返回None"""
+    result = repository.close_transfer(transaction_id, status, credit_email, **changes)
+    if result is not None:
+        _notify_user_change(credit_email)
+        _notify_transaction_change(result)
+    return result
+
+def iter_user_transactions(user_id, before=None):
+    """按時間倒序遍歷用戶作為發送方或接收方的交易
+
+    before 為 (created_at, transaction_id) 排序鍵，只返回排在其之前(更早)的交易
+    """
+    return repository.iter_user_transactions(user_id, before)
+
+def get_user_transactions(user_id, before=None, limit=None):
+    """獲取用戶交易列表，按時間倒序，支持游標分頁"""
+    return repository.get_user_transactions(user_id, before, limit)
+
+def get_transactions_by_status(status):
+    """獲取指定狀態的交易，按時間倒序"""
+    return repository.get_transactions_by_status(status)
+
+def get_transactions(before=None, limit=None):
+    """獲取全部交易，按時間倒序，支持游標分批讀取"""
+    return repository.get_transactions(before, limit)
+
+def get_ledger():
+    """獲取全部賬戶餘額與交易的列式快照，供對賬使用"""
+    return repository.get_ledger()
+
+def query_transactions(query, before=None, limit=None):
+    """按條件查詢交易 (TransactionQuery)，返回 (按時間倒序的交易列表, 查詢計劃說明)"""
+    return repository.query_transactions(query, before, limit)
+
+def might_contain_transaction(transaction_id):
+    """交易ID成員過濾，返回False時交易一定不存在"""
+    return repository.might_contain_transaction(transaction_id)
+
+def transaction_filter_stats():
+    """交易ID過濾器的統計，沒有過濾器時返回None"""
+    return repository.transaction_filter_stats()
+
 def init_db():
     """初始化測試數據"""
-    print("初始化数据库...")
-    if not users_db:
-        print("创建测试用户数据...")
+    logger.info("初始化数据库...")
+    test_email = "test@example.com"
+    if get_user(test_email) is None:
+        logger.info("创建测试用户数据...")
         # 創建一個測試用戶
         user_id = str(uuid.uuid4())
-        test_email = "test@example.com"
 
-        users_db[test_email] = {
+        # 兩筆測試交易 (待接收的暫扣與已完成的轉出) 都已從初始點數中扣除，賬目可以對平
+        amounts = (to_minor(100), to_minor(50))
+        add_user({
             "user_id": user_id,
             "email": test_email,
             "name": "測試用戶",
-            "hashed_password": pwd_context.hash("password123"),
-            "balance": 1000,
+            "hashed_password": TEST_USER_PASSWORD_HASH,
+            "balance": INITIAL_BALANCE - sum(amounts),
             "created_at": datetime.now()
-        }
-        print(f"测试用户已创建: {users_db[test_email]}")
+        })
+        logger.info("测试用户已创建", extra={"user_id": user_id, "email": test_email})
 
         # 創建一些測試交易
         transaction1_id = str(uuid.uuid4())
         transaction2_id = str(uuid.uuid4())
 
-        transactions_db[transaction1_id] = {
+        add_transaction({
             "transaction_id": transaction1_id,
-            "amount": 100,
+            "amount": amounts[0],
             "note": "測試交易1",
             "sender_id": user_id,
             "sender_email": test_email,  # 添加發送者email
@@ -47,11 +491,11 @@ def init_db():
             "created_at": datetime.now(),
             "expires_at": datetime.now() + timedelta(minutes=30),
             "completed_at": None
-        }
+        })
 
-        transactions_db[transaction2_id] = {
+        add_transaction({
             "transaction_id": transaction2_id,
-            "amount": 50,
+            "amount": amounts[1],
             "note": "測試交易2",
             "sender_id": user_id,
             "sender_email": test_email,  # 添加發送者email
@@ -63,9 +507,11 @@ def init_db():
             "created_at": datetime.now() - timedelta(hours=1),
             "expires_at": None,
             "completed_at": datetime.now() - timedelta(minutes=30)
-        }
+        })
 
 def get_db():
-    """獲取數據庫實例 (這裡僅用於保持與典型FastAPI應用一致的接口)"""
-    init_db()  # 確保測試數據已加載
-    return {"users": users_db, "transactions": transactions_db}
+    """獲取數據庫實例 (這裡僅用於保持與典型FastAPI應用一致的接口)
+
+    測試數據只在啟動時由 main 初始化一次，這裡不再重複檢查
+    """
+    return repository
@@ -0,0 +1,558 @@
+import asyncio
+import atexit
+import gc
+import glob
+import logging
+import marshal
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from app.database.db import MemoryRepository, transaction_sort_key
+from app.database.records import TRANSACTION_FIELDS, TransactionRecord, encode_time, decode_time
+
+logger = logging.getLogger(__name__)
+
+# 日誌配置
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", "data/journal")
+# 組提交間隔 (秒) - 修改操作在所屬批次fsync後才返回，最多增加這段延遲
+JOURNAL_FSYNC_INTERVAL = float(os.getenv("JOURNAL_FSYNC_INTERVAL", "0.01"))
+# 日誌超過此大小時壓縮為快照
+JOURNAL_COMPACT_BYTES = int(os.getenv("JOURNAL_COMPACT_BYTES", str(256 * 1024 * 1024)))
+# 快照中每幀保存的記錄數
+SNAPSHOT_CHUNK = 10000
+
+# 幀格式: 負載長度 + CRC32 + marshal 負載；讀取時遇到不完整或校驗失敗的幀即停止
+_FRAME = struct.Struct("<II")
+_FILE_PATTERN = re.compile(r"(journal|snapshot)-(\d+)\.(log|bin)$")
+
+USER_FIELDS = ("email", "user_id", "name", "hashed_password", "balance", "created_at", "version")
+
+# 數據格式版本 - 日誌以 ("F", 版本) 幀開頭、快照以 ("format", 版本) 幀開頭，載入其他版本的文件時報錯
+JOURNAL_FORMAT = 1
+
+def _frame(payload):
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+def _read_frames(buffer):
+    """遍歷有效的幀，返回 (負載, 幀結束位置)"""
+    offset, size = 0, len(buffer)
+    while offset + _FRAME.size <= size:
+        length, checksum = _FRAME.unpack_from(buffer, offset)
+        start, end = offset + _FRAME.size, offset + _FRAME.size + length
+        if end > size:
+            return
+        payload = buffer[start:end]
+        if zlib.crc32(payload) != checksum:
+            return
+        yield payload, end
+        offset = end
+
+def _user_values(user):
+    return tuple(encode_time(user[field]) if field == "created_at" else user[field] for field in USER_FIELDS)
+
+def _user_from_values(values):
+    user = dict(zip(USER_FIELDS, values))
+    user["created_at"] = decode_time(user["created_at"])
+    return user
+
+def _transaction_values(transaction):
+    if isinstance(transaction, TransactionRecord):
+        return transaction.to_tuple()
+    return tuple(
+        encode_time(transaction.get(field)) if field.endswith("_at") else transaction.get(field)
+        for field in TRANSACTION_FIELDS
+    )
+
+def _changes_values(changes):
+    return tuple((field, encode_time(value) if field.endswith("_at") else value) for field, value in changes.items())
+
+def _changes_from_values(values):
+    return {field: decode_time(value) if field.endswith("_at") else value for field, value in values}
+
+def _check_format(kind, version, path):
+    if version != JOURNAL_FORMAT:
+        raise ValueError(f"不支持的日誌格式: {path} ({kind}={version!r})")
+
+class JournalError(OSError):
+    """日誌寫入或fsync失敗後存儲停止接受修改 (fail-stop)，需重啟後從磁盤上完整的記錄恢復"""
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+class GroupCommit:
+    """一批日誌記錄的組提交結果
+
+    組提交線程寫入並fsync這一批之後 (或寫入失敗時) 調用 complete()，
+    喚醒同步等待的線程與異步等待的協程；寫入失敗時等待方收到該錯誤。
+    """
+
+    __slots__ = ("error", "_done", "_lock", "_waiters")
+
+    def __init__(self):
+        self.error = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._waiters = []
+
+    def complete(self, error=None):
+        with self._lock:
+            self.error = error
+            self._done.set()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                # 事件循環已關閉
+                pass
+
+    def wait(self):
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+
+    async def wait_async(self):
+        future = None
+        with self._lock:
+            if not self._done.is_set():
+                loop = asyncio.get_running_loop()
+                future = loop.create_future()
+                self._waiters.append((loop, future))
+        if future is not None:
+            await future
+        if self.error is not None:
+            raise self.error
+
+# 推遲等待的組提交批次 - 未設置時修改操作阻塞到所屬批次fsync後才返回 (後台線程、腳本)；
+# 在 durable_commits() 內 (如HTTP請求、過期清理) 修改操作只登記批次，由調用方在確認前異步等待，
+# 不阻塞事件循環，同時處理的請求仍共享同一次fsync
+deferred_commits = ContextVar("deferred_commits", default=None)
+
+async def wait_commits(commits):
+    """等待登記的批次全部fsync，之後清空列表"""
+    while commits:
+        await commits.pop().wait_async()
+
+class PendingCommits(list):
+    """durable_commits() 內登記的批次，以及這些批次fsync後 (或寫入失敗時) 執行的回調"""
+
+    def __init__(self):
+        super().__init__()
+        self.callbacks = []
+
+    async def wait(self):
+        try:
+            await wait_commits(self)
+        except BaseException:
+            callbacks, self.callbacks = self.callbacks, []
+            for _, on_failure in callbacks:
+                if on_failure is not None:
+                    await on_failure()
+            raise
+        callbacks, self.callbacks = self.callbacks, []
+        for on_durable, _ in callbacks:
+            await on_durable()
+
+async def after_commits(on_durable, on_failure=None):
+    """當前請求的修改操作fsync之後執行 on_durable (如記錄冪等響應)，寫入失敗時執行 on_failure
+
+    回調返回awaitable (存儲可能在其他進程中)。不在 durable_commits() 內或沒有待等待的批次時，
+    修改操作已經寫入磁盤，立即執行。
+    """
+    commits = deferred_commits.get()
+    if commits:
+        commits.callbacks.append((on_durable, on_failure))
+    else:
+        await on_durable()
+
+@asynccontextmanager
+async def durable_commits():
+    """在其中執行的修改操作推遲等待fsync，退出時等待尚未完成的批次"""
+    commits = PendingCommits()
+    token = deferred_commits.set(commits)
+    try:
+        yield commits
+    finally:
+        deferred_commits.reset(token)
+    await commits.wait()
+
+def _path(directory, kind, generation):
+    extension = "log" if kind == "journal" else "bin"
+    return os.path.join(directory, f"{kind}-{generation:08d}.{extension}")
+
+def _fsync_directory(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class JournaledMemoryRepository(MemoryRepository):
+    """帶追加日誌的內存存儲後端 - 重啟後數據不丟失
+
+    每個修改數據的操作 (註冊、扣款、入賬、退款等) 追加到二進制日誌，
+    後台線程按 fsync_interval 批量寫入並 fsync (組提交)，修改操作等到所屬批次fsync後才確認
+    (見 deferred_commits)，崩潰時不會丟失已確認的操作。日誌超過 compact_bytes 時
+    寫出完整快照並切換到新的日誌文件。啟動時以mmap載入最新快照，只重放其後的日誌。
+
+    文件: snapshot-{代}.bin 為該代開始時的完整狀態，journal-{代}.log 為之後的操作
+
+    寫入或fsync失敗時日誌末尾可能留下不完整的幀，重放會在此停止: 之後不再追加任何記錄，
+    未寫入的批次與新的修改操作都收到 JournalError，已執行的內存修改不回滾，重啟後按磁盤恢復。
+    """
+
+    def __init__(
+        self, directory=JOURNAL_DIR, fsync_interval=JOURNAL_FSYNC_INTERVAL,
+        compact_bytes=JOURNAL_COMPACT_BYTES, compact=True
+    ):
+        super().__init__(compact=compact)
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.compact_bytes = compact_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        # 修改數據與追加日誌在同一把鎖內完成，保證日誌順序與執行順序一致
+        self._mutation_lock = threading.Lock()
+        self._pending = []
+        self._batch = GroupCommit()
+        self.fsync_count = 0
+        self._flush_lock = threading.Lock()
+        self._compacting = threading.Lock()
+        self._closed = threading.Event()
+        # 第一次寫入失敗的錯誤，設置後拒絕所有修改操作
+        self.failure = None
+
+        self.generation = self._restore()
+        self._file = self._open_journal(self.generation)
+        self.journal_bytes = self._file.tell()
+
+        self._flusher = threading.Thread(target=self._run, name="journal", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    # ---------- 修改操作: 執行後追加日誌 ----------
+
+    def _open_journal(self, generation):
+        journal = open(_path(self.directory, "journal", generation), "ab")
+        if journal.tell() == 0:
+            journal.write(_frame(marshal.dumps(("F", JOURNAL_FORMAT))))
+        return journal
+
+    @contextmanager
+    def _mutation(self):
+        """持有 _mutation_lock 執行修改操作，日誌寫入失敗後直接拒絕"""
+        with self._mutation_lock:
+            if self.failure is not None:
+                raise JournalError("日誌寫入失敗，存儲已停止接受修改") from self.failure
+            yield
+
+    def _log(self, operation):
+        """追加日誌記錄 (在 _mutation_lock 內調用)，返回其所屬的批次"""
+        self._pending.append(operation)
+        return self._batch
+
+    def _durable(self, batch):
+        """等待批次fsync；在 durable_commits() 內只登記批次，由調用方異步等待"""
+        if batch is None:
+            return
+        if self._closed.is_set():
+            # 組提交線程已停止，直接寫入
+            self.flush()
+        commits = deferred_commits.get()
+        if commits is None:
+            batch.wait()
+        elif batch not in commits:
+            commits.append(batch)
+
+    def add_user(self, user):
+        with self._mutation():
+            result = super().add_user(user)
+            batch = self._log(("U", _user_values(user)))
+        self._durable(batch)
+        return result
+
+    def adjust_balance(self, email, delta):
+        with self._mutation():
+            result = super().adjust_balance(email, delta)
+            batch = self._log(("B", email, delta))
+        self._durable(batch)
+        return result
+
+    def add_transaction(self, transaction):
+        with self._mutation():
+            result = super().add_transaction(transaction)
+            batch = self._log(("T", _transaction_values(result)))
+        self._durable(batch)
+        return result
+
+    def add_transactions(self, transactions):
+        with self._mutation():
+            records = [self._store_transaction(transaction) for transaction in transactions]
+            batch = self._log(("X", [_transaction_values(record) for record in records]))
+        self._durable(batch)
+
+    def update_transaction(self, transaction_id, **changes):
+        with self._mutation():
+            result = super().update_transaction(transaction_id, **changes)
+            batch = self._log(("M", transaction_id, _changes_values(changes)))
+        self._durable(batch)
+        return result
+
+    def open_transfer(self, transaction):
+        batch = None
+        with self._mutation():
+            result = super().open_transfer(transaction)
+            if result is not None:
+                batch = self._log(("O", _transaction_values(result)))
+        self._durable(batch)
+        return result
+
+    def open_transfers(self, sender_email, transactions):
+        batch = None
+        with self._mutation():
+            result = super().open_transfers(sender_email, transactions)
+            if result is not None:
+                batch = self._log(("N", sender_email, [_transaction_values(record) for record in result]))
+        self._durable(batch)
+        return result
+
+    def close_transfer(self, transaction_id, status, credit_email, **changes):
+        batch = None
+        with self._mutation():
+            result = super().close_transfer(transaction_id, status, credit_email, **changes)
+            if result is not None:
+                batch = self._log(("C", transaction_id, status, credit_email, _changes_values(changes)))
+        self._durable(batch)
+        return result
+
+    # ---------- 重放 ----------
+
+    def _apply(self, operation):
+        """重放一條日誌記錄 (不再寫日誌)"""
+        kind = operation[0]
+        if kind == "U":
+            MemoryRepository.add_user(self, _user_from_values(operation[1]))
+        elif kind == "B":
+            MemoryRepository.adjust_balance(self, operation[1], operation[2])
+        elif kind == "T":
+            self._store_transaction(self._decode_transaction(operation[1]))
+        elif kind == "X":
+            for values in operation[1]:
+                self._store_transaction(self._decode_transaction(values))
+        elif kind == "M":
+            MemoryRepository.update_transaction(self, operation[1], **_changes_from_values(operation[2]))
+        elif kind == "O":
+            MemoryRepository.open_transfer(self, self._decode_transaction(operation[1]))
+        elif kind == "N":
+            MemoryRepository.open_transfers(self, operation[1], [self._decode_transaction(v) for v in operation[2]])
+        elif kind == "C":
+            _, transaction_id, status, credit_email, changes = operation
+            MemoryRepository.close_transfer(self, transaction_id, status, credit_email, **_changes_from_values(changes))
+        else:
+            raise ValueError(f"未知的日誌記錄: {kind}")
+
+    def _decode_transaction(self, values):
+        record = TransactionRecord.from_tuple(values)
+        return record if self.compact else record.to_dict()
+
+    def _generations(self):
+        files = {"journal": [], "snapshot": []}
+        for path in glob.glob(os.path.join(self.directory, "*")):
+            match = _FILE_PATTERN.search(os.path.basename(path))
+            if match:
+                files[match.group(1)].append(int(match.group(2)))
+        return sorted(files["snapshot"]), sorted(files["journal"])
+
+    def _restore(self):
+        """載入最新快照並重放其後的日誌，返回當前日誌的代號"""
+        snapshots, journals = self._generations()
+        generation = snapshots[-1] if snapshots else 0
+        # 載入期間只創建不釋放對象，暫停循環垃圾回收避免反覆掃描已載入的數據
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            if snapshots:
+                self._load_snapshot(_path(self.directory, "snapshot", generation))
+            replayed = 0
+            for journal in journals:
+                if journal >= generation:
+                    replayed += self._replay(_path(self.directory, "journal", journal))
+        finally:
+            if collecting:
+                gc.enable()
+        if journals:
+            generation = max(generation, journals[-1])
+        logger.info(
+            "日誌已載入",
+            extra={"generation": generation, "transactions": len(self.transactions), "replayed": replayed},
+        )
+        return generation
+
+    def _load_snapshot(self, path):
+        with open(path, "rb") as source:
+            if os.fstat(source.fileno()).st_size == 0:
+                return
+            with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                version = None
+                try:
+                    for payload, _ in _read_frames(view):
+                        kind, values = marshal.loads(payload)
+                        payload.release()
+                        if version is None:
+                            _check_format(kind, values, path)
+                            version = values
+                        elif kind == "users":
+                            for user in values:
+                                MemoryRepository.add_user(self, _user_from_values(user))
+                        elif kind == "transactions":
+                            self._load_transactions(values)
+                finally:
+                    view.release()
+        # 快照中的交易按插入順序寫出，載入後統一排序索引
+        for index in self.indexes.values():
+            for entries in index.values():
+                entries.sort()
+        for index in self.composite_indexes:
+            index.sort()
+
+    def _load_transactions(self, values):
+        # 直接追加到索引末尾，全部載入後再排序，避免逐條二分插入；索引鍵直接取自元組
+        positions = [(TRANSACTION_FIELDS.index(field), index) for field, index in self.indexes.items()]
+        transactions = self.transactions
+        for transaction_values in values:
+            transaction = self._decode_transaction(transaction_values)
+            sort_key = transaction_sort_key(transaction)
+            transactions[sort_key[1]] = transaction
+            for position, index in positions:
+                key = transaction_values[position]
+                if key is not None:
+                    index.setdefault(key, []).append(sort_key)
+            for index in self.composite_indexes:
+                index.append(transaction)
+            self.ledger.add(transaction)
+
+    def _replay(self, path):
+        """重放日誌文件，截斷末尾不完整的記錄"""
+        with open(path, "rb") as source:
+            data = source.read()
+        count, valid = 0, 0
+        for payload, end in _read_frames(data):
+            operation = marshal.loads(payload)
+            if valid == 0:
+                _check_format(*operation, path)
+            else:
+                self._apply(operation)
+                count += 1
+            valid = end
+        if valid < len(data):
+            logger.warning("日誌末尾有不完整的記錄，已截斷", extra={"path": path, "bytes": len(data) - valid})
+            with open(path, "r+b") as target:
+                target.truncate(valid)
+        return count
+
+    # ---------- 組提交與壓縮 ----------
+
+    def _take_batch(self):
+        """取出待寫入的記錄與其批次 (在 _mutation_lock 內調用)，之後的記錄進入新批次"""
+        operations, self._pending = self._pending, []
+        batch, self._batch = self._batch, GroupCommit()
+        return operations, batch
+
+    def _commit(self, operations, batch):
+        """寫入一批記錄並fsync，之後喚醒等待該批的修改操作"""
+        data = b"".join(_frame(marshal.dumps(operation)) for operation in operations)
+        try:
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except (OSError, ValueError) as error:
+            # 文件末尾可能已有不完整的幀，之後追加的記錄重放時會被丟棄: 停止寫入
+            if self.failure is None:
+                self.failure = error
+                logger.critical("日誌寫入失敗，存儲已停止接受修改，需重啟恢復", exc_info=error)
+            batch.complete(error)
+            raise
+        self.journal_bytes += len(data)
+        self.fsync_count += 1
+        batch.complete()
+
+    def flush(self):
+        """寫出並fsync待寫入的日誌記錄"""
+        with self._flush_lock:
+            with self._mutation_lock:
+                if not self._pending:
+                    return
+                operations, batch = self._take_batch()
+            if self.failure is not None:
+                batch.complete(JournalError("日誌寫入失敗，操作未寫入磁盤"))
+                return
+            self._commit(operations, batch)
+
+    def _run(self):
+        while not self._closed.wait(self.fsync_interval):
+            try:
+                self.flush()
+            except OSError:
+                # 等待該批的修改操作已收到錯誤；之後的批次在 flush() 中直接以錯誤完成
+                pass
+            if self.failure is None and self.journal_bytes >= self.compact_bytes and not self._compacting.locked():
+                threading.Thread(target=self.compact_journal, name="journal-compact", daemon=True).start()
+
+    def compact_journal(self):
+        """寫出完整快照並切換到新一代日誌，完成後刪除舊文件"""
+        if self.failure is not None or not self._compacting.acquire(blocking=False):
+            return
+        try:
+            with self._flush_lock:
+                with self._mutation_lock:
+                    # 在鎖內切換日誌並複製狀態，快照與新日誌之間沒有遺漏或重複
+                    self._commit(*self._take_batch())
+                    self._file.close()
+                    self.generation += 1
+                    generation = self.generation
+                    self._file = self._open_journal(generation)
+                    self.journal_bytes = self._file.tell()
+                    users = [_user_values(user) for user in self.users.values()]
+                    transactions = [_transaction_values(transaction) for transaction in self.transactions.values()]
+            self._write_snapshot(generation, users, transactions)
+        finally:
+            self._compacting.release()
+
+    def _write_snapshot(self, generation, users, transactions):
+        path = _path(self.directory, "snapshot", generation)
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as target:
+            target.write(_frame(marshal.dumps(("format", JOURNAL_FORMAT))))
+            for start in range(0, len(users), SNAPSHOT_CHUNK):
+                target.write(_frame(marshal.dumps(("users", users[start:start + SNAPSHOT_CHUNK]))))
+            for start in range(0, len(transactions), SNAPSHOT_CHUNK):
+                target.write(_frame(marshal.dumps(("transactions", transactions[start:start + SNAPSHOT_CHUNK]))))
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(temporary, path)
+        _fsync_directory(self.directory)
+
+        snapshots, journals = self._generations()
+        for old in snapshots:
+            if old < generation:
+                os.remove(_path(self.directory, "snapshot", old))
+        for old in journals:
+            if old < generation:
+                os.remove(_path(self.directory, "journal", old))
+        logger.info("日誌已壓縮為快照", extra={"generation": generation, "transactions": len(transactions)})
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._flusher.join()
+        self.flush()
+        self._file.close()
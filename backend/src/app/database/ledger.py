@@ -0,0 +1,99 @@
+import threading
+from array import array
+from collections import namedtuple
+
+# 對賬用的列式快照
+# 賬戶列 (emails, balances) 按位置對應；交易列 (senders, receivers, statuses, amounts) 按位置對應，
+# senders / receivers 為參與方編號 (parties 中的下標，沒有接收方時為 -1)，statuses 為 LEDGER_STATUSES 中的下標 (未知狀態為 -1)
+# 交易列為整數序列 (array 或 list)，對賬時可以直接轉為numpy數組，不需要逐行處理字符串
+Ledger = namedtuple("Ledger", ("emails", "balances", "parties", "senders", "receivers", "statuses", "amounts"))
+
+LEDGER_STATUSES = ("pending", "completed", "cancelled")
+LEDGER_STATUS_CODES = {status: code for code, status in enumerate(LEDGER_STATUSES)}
+NO_PARTY = -1
+UNKNOWN_STATUS = -1
+
+class PartyCodes(dict):
+    """email → 參與方編號，首次出現時分配新編號並追加到 parties"""
+
+    def __init__(self, parties=None):
+        super().__init__({None: NO_PARTY})
+        self.parties = [] if parties is None else parties
+        self.update((email, code) for code, email in enumerate(self.parties))
+
+    def __missing__(self, email):
+        code = self[email] = len(self.parties)
+        self.parties.append(email)
+        return code
+
+def status_code(status):
+    return LEDGER_STATUS_CODES.get(status, UNKNOWN_STATUS)
+
+class LedgerColumns:
+    """內存存儲的列式流水 - 交易寫入時追加一行，對賬快照只需複製各列
+
+    發送方與金額寫入後不再變化；接收方 (公開交易確認時寫入) 與狀態只在待接收期間變化，
+    因此只記錄待接收交易所在的行。非待接收交易的這些欄位被修改時 (正常流程不會發生)，
+    標記為過期，下次取快照時按交易表重建。
+    """
+
+    def __init__(self):
+        self.codes = PartyCodes()
+        self.senders = array("q")
+        self.receivers = array("q")
+        self.statuses = array("b")
+        self.amounts = array("q")
+        # 待接收交易ID → 行號
+        self._pending = {}
+        self._stale = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def add(self, transaction):
+        codes = self.codes
+        status = transaction["status"]
+        with self._lock:
+            if status == "pending":
+                self._pending[transaction["transaction_id"]] = len(self.amounts)
+            self.senders.append(codes[transaction["sender_email"]])
+            self.receivers.append(codes[transaction.get("receiver_email")])
+            self.statuses.append(status_code(status))
+            self.amounts.append(transaction["amount"])
+
+    def update(self, transaction):
+        """交易的接收方或狀態變更後同步對應的行"""
+        status = transaction["status"]
+        with self._lock:
+            position = self._pending.get(transaction["transaction_id"])
+            if position is None:
+                self._stale = True
+                return
+            if status != "pending":
+                del self._pending[transaction["transaction_id"]]
+            self.receivers[position] = self.codes[transaction.get("receiver_email")]
+            self.statuses[position] = status_code(status)
+
+    def invalidate(self):
+        """同一ID的交易被重新寫入等無法按行同步的情況，下次取快照時重建"""
+        self._stale = True
+
+    def _rebuild(self, transactions):
+        self.codes = PartyCodes()
+        for column in (self.senders, self.receivers, self.statuses, self.amounts):
+            del column[:]
+        self._pending.clear()
+        self._stale = False
+        for transaction in transactions:
+            self.add(transaction)
+
+    def snapshot(self, transactions):
+        """返回 (parties, senders, receivers, statuses, amounts) 的副本 (在存儲鎖內調用，與餘額一致)"""
+        if self._stale:
+            self._rebuild(list(transactions.values()))
+        with self._lock:
+            return (
+                list(self.codes.parties), array("q", self.senders), array("q", self.receivers),
+                array("b", self.statuses), array("q", self.amounts),
+            )
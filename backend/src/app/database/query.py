@@ -0,0 +1,336 @@
+import heapq
+from bisect import bisect_left, insort
+from collections import namedtuple
+from itertools import islice, product
+
+from app.database.records import transaction_sort_key
+
+# 分塊有序列表的塊大小 (超過兩倍時拆分)
+SORTED_CHUNK_SIZE = 1000
+
+# 交易狀態 - 查詢未限定狀態時，按狀態分組的索引需要合併各組
+TRANSACTION_STATUSES = ("pending", "completed", "cancelled")
+
+# 交易查詢條件，未指定的條件為None
+# counterparty 匹配發送方或接收方；時間範圍為 [from, to)；金額範圍為 [min, max]，單位為整數最小單位
+TransactionQuery = namedtuple("TransactionQuery", (
+    "status", "sender_email", "receiver_email", "counterparty",
+    "created_from", "created_to", "completed_from", "completed_to", "min_amount", "max_amount",
+), defaults=(None,) * 10)
+
+def matches(query, transaction):
+    """交易是否滿足查詢的全部條件"""
+    if query.status is not None and transaction["status"] != query.status:
+        return False
+    sender, receiver = transaction["sender_email"], transaction.get("receiver_email")
+    if query.sender_email is not None and sender != query.sender_email:
+        return False
+    if query.receiver_email is not None and receiver != query.receiver_email:
+        return False
+    if query.counterparty is not None and query.counterparty not in (sender, receiver):
+        return False
+    created_at = transaction["created_at"]
+    if query.created_from is not None and created_at < query.created_from:
+        return False
+    if query.created_to is not None and created_at >= query.created_to:
+        return False
+    if query.completed_from is not None or query.completed_to is not None:
+        completed_at = transaction.get("completed_at")
+        if completed_at is None:
+            return False
+        if query.completed_from is not None and completed_at < query.completed_from:
+            return False
+        if query.completed_to is not None and completed_at >= query.completed_to:
+            return False
+    amount = transaction["amount"]
+    if query.min_amount is not None and amount < query.min_amount:
+        return False
+    if query.max_amount is not None and amount > query.max_amount:
+        return False
+    return True
+
+class SortedEntries:
+    """分塊的有序列表 - 條目按大小分散在多個有序小塊中，插入與刪除只移動一個塊內的元素
+
+    按金額、結算時間排序的索引插入位置隨機，單個大列表每次插入都要搬移其後的全部元素。
+    """
+
+    def __init__(self, load=SORTED_CHUNK_SIZE):
+        self._load = load
+        self._chunks = []
+        # 每塊的最大條目，用於二分查找所在的塊
+        self._maxes = []
+
+    def __len__(self):
+        return sum(map(len, self._chunks))
+
+    def __bool__(self):
+        return bool(self._chunks)
+
+    def add(self, entry):
+        chunks, maxes = self._chunks, self._maxes
+        if not chunks:
+            chunks.append([entry])
+            maxes.append(entry)
+            return
+        position = bisect_left(maxes, entry)
+        if position == len(maxes):
+            position -= 1
+            chunks[position].append(entry)
+            maxes[position] = entry
+        else:
+            insort(chunks[position], entry)
+        chunk = chunks[position]
+        if len(chunk) > 2 * self._load:
+            chunks[position:position + 1] = chunk[:self._load], chunk[self._load:]
+            maxes[position:position + 1] = chunk[self._load - 1], chunk[-1]
+
+    def remove(self, entry):
+        position = bisect_left(self._maxes, entry)
+        if position == len(self._maxes):
+            return
+        chunk = self._chunks[position]
+        offset = bisect_left(chunk, entry)
+        if offset < len(chunk) and chunk[offset] == entry:
+            del chunk[offset]
+            if chunk:
+                self._maxes[position] = chunk[-1]
+            else:
+                del self._chunks[position], self._maxes[position]
+
+    def append(self, entry):
+        """批量載入時直接追加，全部載入後調用 sort()"""
+        if not self._chunks:
+            self._chunks.append([])
+            self._maxes.append(None)
+        self._chunks[-1].append(entry)
+
+    def sort(self):
+        entries = sorted(entry for chunk in self._chunks for entry in chunk)
+        self._chunks = [entries[i:i + self._load] for i in range(0, len(entries), self._load)]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+
+    def _locate(self, probe):
+        """第一個不小於 probe 的條目位置 (塊號, 塊內偏移)，probe 為None時返回末尾"""
+        if probe is None:
+            return len(self._chunks), 0
+        position = bisect_left(self._maxes, probe)
+        if position == len(self._maxes):
+            return position, 0
+        return position, bisect_left(self._chunks[position], probe)
+
+    def span(self, low, high):
+        """[low, high) 範圍的 (起, 止) 位置與條數，計數只遍歷範圍內的塊"""
+        start = (0, 0) if low is None else self._locate(low)
+        end = self._locate(high)
+        if start >= end:
+            return start, end, 0
+        count = sum(map(len, self._chunks[start[0]:end[0]])) - start[1] + end[1]
+        return start, end, count
+
+    def between(self, start, end):
+        """按 span() 返回的位置遍歷條目 (遞增)"""
+        chunks = self._chunks
+        for position in range(start[0], min(end[0] + 1, len(chunks))):
+            chunk = chunks[position]
+            yield from chunk[start[1] if position == start[0] else 0:end[1] if position == end[0] else len(chunk)]
+
+class CompositeIndex:
+    """複合索引 - 按 fields 的值分組 (單欄位時key為值本身，多欄位時為元組)，組內按 order 欄位排序
+
+    order 為創建時間時條目即排序鍵 (created_at, transaction_id)，新交易直接追加在列表末尾；
+    否則條目為 (order值, created_at, transaction_id)，存放在分塊有序列表 (SortedEntries) 中，
+    order 值為None的交易 (如尚未結算的 completed_at) 不進入索引。
+    entries 可傳入已由其他代碼維護的按創建時間排序的索引dict (如狀態索引)，此時只用於查詢。
+    """
+
+    def __init__(self, fields, order="created_at", entries=None):
+        self.fields = fields
+        self.order = order
+        self.name = f"{'+'.join(fields)}/{order}"
+        self.entries = {} if entries is None else entries
+        self.columns = frozenset((*fields, order))
+        self._group = list if order == "created_at" else SortedEntries
+
+    def _key(self, transaction):
+        if len(self.fields) == 1:
+            return transaction.get(self.fields[0])
+        return tuple(transaction.get(field) for field in self.fields)
+
+    def _entry(self, transaction):
+        sort_key = transaction_sort_key(transaction)
+        if self.order == "created_at":
+            return sort_key
+        value = transaction.get(self.order)
+        return None if value is None else (value, *sort_key)
+
+    def add(self, transaction):
+        entry = self._entry(transaction)
+        if entry is None:
+            return
+        entries = self.entries.get(self._key(transaction))
+        if entries is None:
+            entries = self.entries[self._key(transaction)] = self._group()
+        if self._group is list:
+            insort(entries, entry)
+        else:
+            entries.add(entry)
+
+    def append(self, transaction):
+        """批量載入時直接追加，全部載入後調用 sort()"""
+        entry = self._entry(transaction)
+        if entry is not None:
+            entries = self.entries.get(self._key(transaction))
+            if entries is None:
+                entries = self.entries[self._key(transaction)] = self._group()
+            entries.append(entry)
+
+    def sort(self):
+        for entries in self.entries.values():
+            entries.sort()
+
+    def remove(self, transaction):
+        key, entry = self._key(transaction), self._entry(transaction)
+        entries = self.entries.get(key)
+        if entry is None or not entries:
+            return
+        if self._group is list:
+            position = bisect_left(entries, entry)
+            if position < len(entries) and entries[position] == entry:
+                del entries[position]
+        else:
+            entries.remove(entry)
+        if not entries:
+            del self.entries[key]
+
+    def _keys(self, query):
+        """查詢可確定的分組key，有分組欄位未被限定時索引不適用，返回None (狀態未限定時合併所有狀態)"""
+        values = []
+        for field in self.fields:
+            value = getattr(query, field)
+            if value is not None:
+                values.append((value,))
+            elif field == "status":
+                values.append(TRANSACTION_STATUSES)
+            else:
+                return None
+        if len(self.fields) == 1:
+            return values[0]
+        return product(*values)
+
+    def _bounds(self, query):
+        """order 欄位上的範圍，返回用於二分查找的 (下界, 上界) 探針，上界不含"""
+        if self.order == "created_at":
+            low, high = query.created_from, query.created_to
+        elif self.order == "completed_at":
+            low, high = query.completed_from, query.completed_to
+        else:
+            # 金額為整數，閉區間上界 max 等價於開區間 max + 1
+            low = query.min_amount
+            high = None if query.max_amount is None else query.max_amount + 1
+        return (None if low is None else (low,)), (None if high is None else (high,))
+
+    def ranges(self, query, before=None):
+        """查詢在本索引中的候選條目範圍 [(條目, 起, 止, 條數)]，索引不適用時返回None"""
+        keys = self._keys(query)
+        if keys is None:
+            return None
+        low, high = self._bounds(query)
+        ranges = []
+        if self.order != "created_at":
+            # 索引不含 order 值為None的交易，查詢沒有限定 order 範圍時會漏掉它們
+            if low is None and high is None:
+                return None
+            for key in keys:
+                entries = self.entries.get(key)
+                if entries:
+                    start, end, count = entries.span(low, high)
+                    if count:
+                        ranges.append((entries, start, end, count))
+            return ranges
+        for key in keys:
+            entries = self.entries.get(key)
+            if not entries:
+                continue
+            start = 0 if low is None else bisect_left(entries, low)
+            end = len(entries) if high is None else bisect_left(entries, high)
+            # 按創建時間排序的索引可以直接用游標收窄範圍
+            if before is not None:
+                end = min(end, bisect_left(entries, before))
+            if start < end:
+                ranges.append((entries, start, end, end - start))
+        return ranges
+
+    def scan(self, ranges, before=None):
+        """按排序鍵倒序遍歷候選交易的排序鍵"""
+        if self.order == "created_at":
+            return heapq.merge(*(_descending(entries, start, end) for entries, start, end, _ in ranges), reverse=True)
+        # 其他順序的索引需要取出全部候選再按創建時間排序
+        sort_keys = [entry[1:] for entries, start, end, _ in ranges for entry in entries.between(start, end)]
+        if before is not None:
+            sort_keys = [sort_key for sort_key in sort_keys if sort_key < before]
+        sort_keys.sort(reverse=True)
+        return iter(sort_keys)
+
+def _descending(entries, start, end):
+    for position in range(end - 1, start - 1, -1):
+        yield entries[position]
+
+def plan(indexes, query, before=None):
+    """查詢計劃: 選擇候選條數最少的索引 (按二分查找得到的範圍精確計數)，返回 (索引, 範圍, 候選條數)"""
+    best = None
+    for index in indexes:
+        ranges = index.ranges(query, before)
+        if ranges is None:
+            continue
+        candidates = sum(count for *_, count in ranges)
+        if best is None or candidates < best[2]:
+            best = (index, ranges, candidates)
+            if candidates == 0:
+                break
+    return best
+
+def _branches(query):
+    """counterparty 拆成「發送方是」與「接收方是」兩個分支，各自可以使用按email分組的索引"""
+    counterparty = query.counterparty
+    if counterparty is None:
+        return [query]
+    branches = []
+    if query.sender_email in (None, counterparty):
+        branches.append(query._replace(sender_email=counterparty))
+    if query.receiver_email in (None, counterparty):
+        branches.append(query._replace(receiver_email=counterparty))
+    return branches
+
+def execute(indexes, transactions, query, before=None, limit=None):
+    """按查詢計劃讀取交易，按排序鍵倒序返回 (交易列表, 計劃說明)
+
+    計劃說明包含每個分支使用的索引、候選條數，以及實際讀取並檢查條件的交易數。
+    """
+    steps = []
+    iterators = []
+    for branch in _branches(query):
+        index, ranges, candidates = plan(indexes, branch, before)
+        step = {"index": index.name, "candidates": candidates, "scanned": 0}
+        steps.append(step)
+        iterators.append(_filter(index.scan(ranges, before), transactions, branch, step))
+    merged = heapq.merge(*iterators, key=_pair_key, reverse=True)
+    return [transaction for _, transaction in islice(_unique(merged), limit)], steps
+
+def _pair_key(pair):
+    return pair[0]
+
+def _filter(sort_keys, transactions, query, step):
+    for sort_key in sort_keys:
+        transaction = transactions[sort_key[1]]
+        step["scanned"] += 1
+        if matches(query, transaction):
+            yield sort_key, transaction
+
+def _unique(pairs):
+    """合併的分支中，自己發給自己的交易會出現兩次"""
+    last_key = None
+    for sort_key, transaction in pairs:
+        if sort_key != last_key:
+            last_key = sort_key
+            yield sort_key, transaction
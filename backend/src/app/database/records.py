@@ -0,0 +1,180 @@
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+
+# 交易欄位，順序與 TransactionInDB 一致
+TRANSACTION_FIELDS = (
+    "transaction_id", "amount", "note",
+    "sender_id", "sender_email", "sender_name",
+    "receiver_id", "receiver_email", "receiver_name",
+    "status", "created_at", "expires_at", "completed_at", "version",
+)
+
+# 新記錄的版本號，每次修改加1 (用於ETag)
+INITIAL_VERSION = 1
+
+# 時間戳編碼為距紀元的整數微秒
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+def encode_time(value):
+    return None if value is None else (value - _EPOCH) // _MICROSECOND
+
+def decode_time(value):
+    return None if value is None else _EPOCH + timedelta(microseconds=value)
+
+# 用戶引用 (user_id, email, name) 的駐留表 - 同一用戶的所有交易共享同一個元組
+_parties = {}
+
+def intern_party(user_id, email, name):
+    """返回共享的用戶引用元組，三個欄位均為None時返回None"""
+    if user_id is None and email is None and name is None:
+        return None
+    key = (user_id, email, name)
+    return _parties.setdefault(key, key)
+
+def _party_field(party, position):
+    return None if party is None else party[position]
+
+_PARTY_FIELDS = {
+    "sender_id": ("sender", 0), "sender_email": ("sender", 1), "sender_name": ("sender", 2),
+    "receiver_id": ("receiver", 0), "receiver_email": ("receiver", 1), "receiver_name": ("receiver", 2),
+}
+
+class TransactionRecord(Mapping):
+    """緊湊的交易記錄
+
+    以 __slots__ 取代13個鍵的dict：發送方/接收方為駐留的用戶引用，
+    排序鍵 (created_at, transaction_id) 只構建一次並與索引共享，
+    expires_at / completed_at 存為整數微秒。對外仍按dict方式讀寫。
+    """
+
+    __slots__ = (
+        "sort_key", "amount", "note", "sender", "receiver", "status", "_expires_at", "_completed_at", "version"
+    )
+
+    def __init__(self, transaction):
+        self.sort_key = (transaction["created_at"], transaction["transaction_id"])
+        self.amount = transaction["amount"]
+        self.note = transaction.get("note")
+        self.sender = intern_party(transaction["sender_id"], transaction["sender_email"], transaction["sender_name"])
+        self.receiver = intern_party(
+            transaction.get("receiver_id"), transaction.get("receiver_email"), transaction.get("receiver_name")
+        )
+        self.status = transaction["status"]
+        self._expires_at = encode_time(transaction.get("expires_at"))
+        self._completed_at = encode_time(transaction.get("completed_at"))
+        self.version = transaction.get("version", INITIAL_VERSION)
+
+    @classmethod
+    def from_tuple(cls, values):
+        """由 to_tuple() 的結果重建記錄"""
+        (transaction_id, amount, note, sender_id, sender_email, sender_name,
+         receiver_id, receiver_email, receiver_name, status, created_at, expires_at, completed_at, version) = values
+        record = cls.__new__(cls)
+        record.sort_key = (decode_time(created_at), transaction_id)
+        record.amount = amount
+        record.note = note
+        record.sender = intern_party(sender_id, sender_email, sender_name)
+        record.receiver = intern_party(receiver_id, receiver_email, receiver_name)
+        record.status = status
+        record._expires_at = expires_at
+        record._completed_at = completed_at
+        record.version = version
+        return record
+
+    def to_tuple(self):
+        """按 TRANSACTION_FIELDS 順序返回欄位值，時間為整數微秒 (可直接用 marshal 序列化)"""
+        created_at, transaction_id = self.sort_key
+        sender = self.sender
+        receiver = self.receiver or (None, None, None)
+        return (
+            transaction_id, self.amount, self.note, *sender, *receiver,
+            self.status, encode_time(created_at), self._expires_at, self._completed_at, self.version,
+        )
+
+    @property
+    def transaction_id(self):
+        return self.sort_key[1]
+
+    @property
+    def created_at(self):
+        return self.sort_key[0]
+
+    @property
+    def expires_at(self):
+        return decode_time(self._expires_at)
+
+    @property
+    def completed_at(self):
+        return decode_time(self._completed_at)
+
+    def __getitem__(self, field):
+        party = _PARTY_FIELDS.get(field)
+        if party is not None:
+            return _party_field(getattr(self, party[0]), party[1])
+        if field not in TRANSACTION_FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def __setitem__(self, field, value):
+        party = _PARTY_FIELDS.get(field)
+        if party is not None:
+            attribute, position = party
+            values = list(getattr(self, attribute) or (None, None, None))
+            values[position] = value
+            setattr(self, attribute, intern_party(*values))
+        elif field == "transaction_id":
+            self.sort_key = (self.sort_key[0], value)
+        elif field == "created_at":
+            self.sort_key = (value, self.sort_key[1])
+        elif field == "expires_at":
+            self._expires_at = encode_time(value)
+        elif field == "completed_at":
+            self._completed_at = encode_time(value)
+        elif field in ("amount", "note", "status", "version"):
+            setattr(self, field, value)
+        else:
+            raise KeyError(field)
+
+    def to_dict(self):
+        """一次性展開為普通dict (比逐個欄位讀取快)"""
+        created_at, transaction_id = self.sort_key
+        sender = self.sender
+        receiver = self.receiver or (None, None, None)
+        return {
+            "transaction_id": transaction_id,
+            "amount": self.amount,
+            "note": self.note,
+            "sender_id": sender[0],
+            "sender_email": sender[1],
+            "sender_name": sender[2],
+            "receiver_id": receiver[0],
+            "receiver_email": receiver[1],
+            "receiver_name": receiver[2],
+            "status": self.status,
+            "created_at": created_at,
+            "expires_at": decode_time(self._expires_at),
+            "completed_at": decode_time(self._completed_at),
+            "version": self.version,
+        }
+
+    def __iter__(self):
+        return iter(TRANSACTION_FIELDS)
+
+    def __len__(self):
+        return len(TRANSACTION_FIELDS)
+
+    def __repr__(self):
+        return f"TransactionRecord({self.to_dict()!r})"
+
+def transaction_sort_key(transaction):
+    """索引排序鍵"""
+    if isinstance(transaction, TransactionRecord):
+        return transaction.sort_key
+    return (transaction["created_at"], transaction["transaction_id"])
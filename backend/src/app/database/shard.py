@@ -0,0 +1,666 @@
+import argparse
+import atexit
+import heapq
+import logging
+import math
+import os
+import queue
+import secrets
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import zlib
+from array import array
+from collections import deque
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener, answer_challenge, deliver_challenge
+
+from app.database.bloom import (
+    BloomFilter, TRANSACTION_FILTER_CAPACITY, TRANSACTION_FILTER_ERROR_RATE, merge_stats, remove_file
+)
+from app.database.db import MemoryRepository, Repository, change_balance, transaction_sort_key
+from app.database.ledger import NO_PARTY, Ledger, PartyCodes
+from app.database.records import TransactionRecord
+
+logger = logging.getLogger(__name__)
+
+# 分片配置 - 分片數默認等於CPU核數，每個分片進程監聽一個Unix socket
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", str(os.cpu_count() or 1)))
+SHARD_SOCKET_DIR = os.getenv("SHARD_SOCKET_DIR", "data/shards")
+# 兩階段操作超過此時間仍未完成時，由任意worker接手恢復 (秒)
+SHARD_RECOVERY_SECONDS = float(os.getenv("SHARD_RECOVERY_SECONDS", "30"))
+# 已入賬記錄與作廢標記的保留時間 (秒)，需遠大於恢復間隔
+SHARD_RETENTION_SECONDS = 3600
+# 遍歷用戶交易時每次從單個分片讀取的條數
+SHARD_PAGE_SIZE = 100
+# 每個分片保留的最近事件數 (多個worker共享SSE推送時，worker落後超過此數量的事件會丟失)
+SHARD_EVENT_BUFFER = 10000
+# 長輪詢事件時單次等待的上限 (秒)
+SHARD_EVENT_POLL_SECONDS = 30
+# 分片連接的認證密鑰 (HMAC質詢，連接上傳輸的是pickle) - 未設置時由 start_shards 隨機生成，
+# 經環境變量傳給分片進程與之後啟動的worker；單獨運行分片時分片與API進程需設置相同的值
+SHARD_AUTHKEY_ENV = "SHARD_AUTHKEY"
+
+class ShardError(Exception):
+    """分片進程返回錯誤或兩階段操作未能完成"""
+
+def shard_authkey():
+    key = os.getenv(SHARD_AUTHKEY_ENV)
+    if not key:
+        raise ShardError(f"未設置 {SHARD_AUTHKEY_ENV}，無法連接分片")
+    return key.encode()
+
+def shard_of(key, count):
+    """按key (email或交易ID) 的CRC32選擇分片，所有進程結果一致"""
+    return zlib.crc32(key.encode()) % count
+
+def socket_path(directory, index):
+    return os.path.join(directory, f"shard-{index}.sock")
+
+def filter_path(path):
+    """分片socket對應的交易ID過濾器文件"""
+    return os.path.splitext(path)[0] + ".bloom"
+
+def _plain(value):
+    """TransactionRecord 轉為dict後再跨進程傳輸"""
+    if isinstance(value, TransactionRecord):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+def _prune(entries, cutoff):
+    """按插入順序刪除早於 cutoff 的條目 (值的最後一項為時間戳)"""
+    while entries:
+        key = next(iter(entries))
+        if entries[key][-1] >= cutoff:
+            break
+        del entries[key]
+
+class ShardStore(MemoryRepository):
+    """單個分片進程持有的數據 - 在內存存儲之上增加兩階段轉賬所需的狀態
+
+    holds: 已從發送方扣款、交易尚未確認寫入的預留 (key → email, 金額, [(交易ID, 金額)], 時間)
+    outbox: 已結算、金額尚未記入其他分片賬戶的交易 (交易ID → email, 金額, 時間)
+    credited: 已入賬的交易ID，重試入賬時保證只記一次
+    fenced: 恢復流程判定為未寫入的交易ID，之後遲到的寫入會被拒絕
+    transaction_filter: 寫入共享文件的交易ID過濾器，worker只讀映射後無需往返分片即可排除不存在的ID
+
+    多個worker共享的狀態 (按key選擇分片):
+    buckets: 限流令牌桶
+    idempotency: 冪等響應與處理中標記
+    watched/events: 有worker訂閱的SSE主題 (主題 → 訂閱數)，以及這些主題上按序號排列的最近事件
+    """
+
+    def __init__(self, filter_path=None, filter_capacity=TRANSACTION_FILTER_CAPACITY):
+        super().__init__()
+        self.holds = {}
+        self.outbox = {}
+        self.credited = {}
+        self.fenced = {}
+        # app.utils 依賴已初始化的 db 模塊 (本模塊在 db 導入過程中被導入)，創建分片數據時再導入
+        from app.utils.ratelimit import TokenBuckets
+        from app.utils.idempotency import IdempotencyEntries
+        self.buckets = TokenBuckets()
+        self.idempotency = IdempotencyEntries()
+        self.watched = {}
+        self.events = deque(maxlen=SHARD_EVENT_BUFFER)
+        self.event_seq = 0
+        self._events_changed = threading.Condition()
+        self.transaction_filter = None
+        if filter_path and filter_capacity > 0:
+            self.transaction_filter = BloomFilter.create(filter_capacity, TRANSACTION_FILTER_ERROR_RATE, filter_path)
+        elif filter_path:
+            # 過濾器已關閉: 刪除上次運行留下的文件，避免worker按過期的過濾器拒絕請求
+            remove_file(filter_path)
+
+    def _store_transaction(self, transaction):
+        transaction = super()._store_transaction(transaction)
+        # 在返回給worker之前寫入過濾器，任何得知交易ID的請求都能在過濾器中找到它
+        if self.transaction_filter is not None:
+            self.transaction_filter.add(transaction["transaction_id"])
+        return transaction
+
+    def get_user_transactions(self, user_id, before=None, limit=None):
+        return _plain(super().get_user_transactions(user_id, before, limit))
+
+    def get_transactions_by_status(self, status):
+        return _plain(super().get_transactions_by_status(status))
+
+    def query_transactions(self, query, before=None, limit=None):
+        transactions, steps = super().query_transactions(query, before, limit)
+        return _plain(transactions), steps
+
+    # ---------- 發起轉賬: 扣款預留 → 寫入交易 → 確認 ----------
+
+    def reserve(self, key, email, parts):
+        """扣除發送方餘額並記錄預留，餘額不足時返回False"""
+        amount = sum(part_amount for _, part_amount in parts)
+        with self._lock:
+            user = self.users.get(email)
+            if user is None or user["balance"] < amount:
+                return False
+            change_balance(user, -amount)
+            self.holds[key] = (email, amount, parts, time.time())
+            return True
+
+    def store(self, transactions):
+        """寫入交易，任何一筆已被恢復流程作廢時全部拒絕並返回False"""
+        with self._lock:
+            if any(transaction["transaction_id"] in self.fenced for transaction in transactions):
+                return False
+            for transaction in transactions:
+                self._store_transaction(transaction)
+            return True
+
+    def settle(self, key):
+        """交易已寫入，刪除預留；預留已被恢復流程處理時返回False"""
+        with self._lock:
+            return self.holds.pop(key, None) is not None
+
+    def release(self, key, refund):
+        """恢復流程: 刪除預留並退還未寫入部分的金額"""
+        with self._lock:
+            hold = self.holds.pop(key, None)
+            if hold is None:
+                return False
+            user = self.users.get(hold[0])
+            if user is not None:
+                change_balance(user, refund)
+            return True
+
+    def fence(self, transaction_ids):
+        """恢復流程: 返回已存在的交易ID，其餘標記為作廢"""
+        now = time.time()
+        with self._lock:
+            _prune(self.fenced, now - SHARD_RETENTION_SECONDS)
+            existing = []
+            for transaction_id in transaction_ids:
+                if transaction_id in self.transactions:
+                    existing.append(transaction_id)
+                else:
+                    self.fenced[transaction_id] = (now,)
+            return existing
+
+    # ---------- 結算: 狀態CAS並登記待入賬 → 入賬 → 確認 ----------
+
+    def close_to_outbox(self, transaction_id, status, credit_email, **changes):
+        """CAS結算交易，金額登記到 outbox 等待記入其他分片的賬戶"""
+        with self._lock:
+            transaction = self.transactions.get(transaction_id)
+            if transaction is None or transaction["status"] != "pending":
+                return None
+            self._update_fields(transaction, {"status": status, **changes})
+            self.outbox[transaction_id] = (credit_email, transaction["amount"], time.time())
+            return _plain(transaction)
+
+    def credit(self, transaction_id, email, amount):
+        """為交易入賬，同一交易重複調用只記一次"""
+        now = time.time()
+        with self._lock:
+            _prune(self.credited, now - SHARD_RETENTION_SECONDS)
+            if transaction_id in self.credited:
+                return False
+            user = self.users.get(email)
+            if user is not None:
+                change_balance(user, amount)
+            self.credited[transaction_id] = (now,)
+            return True
+
+    def acknowledge(self, transaction_id):
+        with self._lock:
+            return self.outbox.pop(transaction_id, None) is not None
+
+    def in_doubt(self, older_than):
+        """返回早於指定時間仍未完成的預留與待入賬記錄"""
+        with self._lock:
+            holds = [(key, hold[1], hold[2]) for key, hold in self.holds.items() if hold[-1] < older_than]
+            outbox = [(key, entry[0], entry[1]) for key, entry in self.outbox.items() if entry[-1] < older_than]
+        return holds, outbox
+
+    # ---------- 多個worker共享的限流、冪等與事件狀態 ----------
+
+    def consume_tokens(self, key, rate, burst, cost=1):
+        return self.buckets.consume(key, rate, burst, cost)
+
+    def claim_idempotency(self, key, marker):
+        return self.idempotency.claim(key, marker)
+
+    def put_idempotency(self, key, entry):
+        self.idempotency.put(key, entry)
+
+    def release_idempotency(self, key, marker):
+        self.idempotency.release(key, marker)
+
+    def watch(self, topic):
+        with self._events_changed:
+            self.watched[topic] = self.watched.get(topic, 0) + 1
+
+    def unwatch(self, topic):
+        with self._events_changed:
+            count = self.watched.pop(topic, 0) - 1
+            if count > 0:
+                self.watched[topic] = count
+
+    def publish(self, topic, kind, key):
+        """主題有worker訂閱時追加事件，內容為本分片中的最新數據 (kind 為 balance 時key是email，否則是交易ID)"""
+        with self._events_changed:
+            if topic not in self.watched:
+                return False
+        if kind == "balance":
+            user = self.get_user(key)
+            payload = None if user is None else {"balance": user["balance"]}
+        else:
+            payload = _plain(self.get_transaction(key))
+        if payload is None:
+            return False
+        with self._events_changed:
+            self.event_seq += 1
+            self.events.append((self.event_seq, topic, kind, payload))
+            self._events_changed.notify_all()
+        return True
+
+    def events_since(self, after, timeout):
+        """返回 (當前序號, 序號大於 after 的事件)，沒有新事件時最多等待 timeout 秒
+
+        after 為None或大於當前序號 (分片已重啟) 時從當前序號開始。
+        """
+        with self._events_changed:
+            if after is None or after > self.event_seq:
+                return self.event_seq, []
+            self._events_changed.wait_for(lambda: self.event_seq > after, min(timeout, SHARD_EVENT_POLL_SECONDS))
+            return self.event_seq, [event[1:] for event in self.events if event[0] > after]
+
+    # worker可以調用的操作，其他屬性與方法 (含基類的內部方法) 一律拒絕
+    METHODS = frozenset({
+        "get_user", "add_user", "adjust_balance",
+        "get_transaction", "add_transaction", "add_transactions", "update_transaction",
+        "open_transfer", "open_transfers", "close_transfer",
+        "get_user_transactions", "get_transactions", "get_transactions_by_status", "query_transactions", "get_ledger",
+        "reserve", "store", "settle", "release", "fence",
+        "close_to_outbox", "credit", "acknowledge", "in_doubt",
+        "consume_tokens", "claim_idempotency", "put_idempotency", "release_idempotency",
+        "watch", "unwatch", "publish", "events_since",
+    })
+
+    def dispatch(self, method, args, kwargs):
+        if method not in self.METHODS:
+            raise ShardError(f"不支持的分片操作: {method}")
+        return _plain(getattr(self, method)(*args, **kwargs))
+
+class ShardServer:
+    """分片進程 - 在Unix socket上接受各worker的連接，每個連接一個線程"""
+
+    def __init__(self, path, filter_capacity=TRANSACTION_FILTER_CAPACITY):
+        self.path = path
+        self.authkey = shard_authkey()
+        # 過濾器在開始監聽之前創建，分片重啟後worker通過舊文件上的標記發現新的過濾器
+        self.store = ShardStore(filter_path(path), filter_capacity)
+
+    def _handle(self, conn):
+        with conn:
+            # 在連接自己的線程中完成雙向認證，握手慢的連接不阻塞 accept
+            try:
+                deliver_challenge(conn, self.authkey)
+                answer_challenge(conn, self.authkey)
+            except (AuthenticationError, EOFError, OSError):
+                logger.warning("拒絕未認證的分片連接", extra={"path": self.path})
+                return
+            while True:
+                try:
+                    method, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    conn.send(("ok", self.store.dispatch(method, args, kwargs)))
+                except Exception as e:
+                    conn.send(("error", f"{type(e).__name__}: {e}"))
+
+    def serve_forever(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        with Listener(self.path, family="AF_UNIX") as listener:
+            logger.info("分片已啟動", extra={"path": self.path})
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+def _watch_parent(parent):
+    """父進程退出後分片進程隨之退出"""
+    while os.getppid() == parent:
+        time.sleep(1)
+    os._exit(0)
+
+def start_shards(count=SHARD_COUNT, directory=SHARD_SOCKET_DIR, timeout=10):
+    """啟動分片進程並等待socket就緒，返回進程列表
+
+    以獨立的解釋器運行 (而非multiprocessing)，避免子進程重新導入 main 模塊。
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = [socket_path(directory, index) for index in range(count)]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+        remove_file(filter_path(path))
+    # 交易按ID哈希均勻分佈，每個分片的過濾器只需容納總容量的一份
+    filter_capacity = math.ceil(TRANSACTION_FILTER_CAPACITY / count) if TRANSACTION_FILTER_CAPACITY > 0 else 0
+    source_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.setdefault(SHARD_AUTHKEY_ENV, secrets.token_hex(32))
+    # 分片進程自身不需要默認存儲後端，避免導入時再創建一個 ShardedRepository
+    env = dict(os.environ, DB_BACKEND="memory")
+    processes = [
+        subprocess.Popen(
+            [
+                sys.executable, "-m", "app.database.shard", "--serve", path,
+                "--parent", str(os.getpid()), "--filter-capacity", str(filter_capacity),
+            ],
+            cwd=source_root, env=env,
+        )
+        for path in paths
+    ]
+    atexit.register(_stop, processes)
+    deadline = time.monotonic() + timeout
+    while not all(os.path.exists(path) for path in paths):
+        if time.monotonic() > deadline or any(process.poll() is not None for process in processes):
+            _stop(processes)
+            raise ShardError("分片進程啟動失敗")
+        time.sleep(0.01)
+    return processes
+
+def _stop(processes):
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        process.wait()
+
+class ShardedRepository(Repository):
+    """分片存儲後端 - 數據分佈在多個分片進程中，可供多個worker進程共享
+
+    用戶按email、交易按交易ID的哈希分配到分片。發送方與交易在同一分片時
+    直接執行原子操作；跨分片的轉賬分兩階段: 先在發送方分片扣款預留，
+    寫入交易後再確認；結算時先在交易分片CAS並登記待入賬，入賬後再確認。
+    中途失敗的操作由後台恢復線程在 recovery_seconds 之後補完。
+    """
+
+    def __init__(self, directory=SHARD_SOCKET_DIR, count=SHARD_COUNT, recovery_seconds=SHARD_RECOVERY_SECONDS):
+        self.directory = directory
+        self.count = count
+        self.recovery_seconds = recovery_seconds
+        self._pools = [queue.SimpleQueue() for _ in range(count)]
+        # 各分片交易ID過濾器的只讀映射，首次使用時打開
+        self._filters = [None] * count
+        self._recovery = None
+        self._closed = threading.Event()
+
+    # ---------- 連接與調用 ----------
+
+    def _acquire(self, shard):
+        try:
+            return self._pools[shard].get_nowait()
+        except queue.Empty:
+            # 分片可能晚於worker啟動，首次使用時才建立連接並啟動恢復線程
+            if self._recovery is None:
+                self._recovery = threading.Thread(target=self._run_recovery, name="shard-recovery", daemon=True)
+                self._recovery.start()
+            return Client(socket_path(self.directory, shard), family="AF_UNIX", authkey=shard_authkey())
+
+    def _send(self, shard, method, args=(), kwargs=None):
+        conn = self._acquire(shard)
+        try:
+            conn.send((method, args, kwargs or {}))
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def _receive(self, shard, conn):
+        try:
+            status, result = conn.recv()
+        except BaseException:
+            conn.close()
+            raise
+        self._pools[shard].put(conn)
+        if status == "error":
+            raise ShardError(result)
+        return result
+
+    def _call(self, shard, method, *args, **kwargs):
+        return self._receive(shard, self._send(shard, method, args, kwargs))
+
+    def _broadcast(self, method, *args):
+        """在所有分片上並行執行同一操作 (先全部發送再依次接收)"""
+        conns = [self._send(shard, method, args) for shard in range(self.count)]
+        return [self._receive(shard, conn) for shard, conn in enumerate(conns)]
+
+    def _user_shard(self, email):
+        return shard_of(email, self.count)
+
+    def _transaction_shard(self, transaction_id):
+        return shard_of(transaction_id, self.count)
+
+    # ---------- 單分片操作 ----------
+
+    def get_user(self, email):
+        return self._call(self._user_shard(email), "get_user", email)
+
+    def add_user(self, user):
+        return self._call(self._user_shard(user["email"]), "add_user", user)
+
+    def adjust_balance(self, email, delta):
+        return self._call(self._user_shard(email), "adjust_balance", email, delta)
+
+    def get_transaction(self, transaction_id):
+        return self._call(self._transaction_shard(transaction_id), "get_transaction", transaction_id)
+
+    def add_transaction(self, transaction):
+        return self._call(self._transaction_shard(transaction["transaction_id"]), "add_transaction", transaction)
+
+    def _filter(self, shard):
+        """分片的交易ID過濾器 (只讀映射)，分片重啟重建過濾器後重新打開"""
+        current = self._filters[shard]
+        if current is None or current.retired:
+            # 舊的映射可能仍在被其他線程讀取，不主動關閉
+            current = self._filters[shard] = BloomFilter.open(filter_path(socket_path(self.directory, shard)))
+        return current
+
+    def might_contain_transaction(self, transaction_id):
+        if TRANSACTION_FILTER_CAPACITY <= 0:
+            return True
+        transaction_filter = self._filter(self._transaction_shard(transaction_id))
+        return transaction_filter is None or transaction_id in transaction_filter
+
+    def transaction_filter_stats(self):
+        filters = (self._filter(shard) for shard in range(self.count))
+        return merge_stats(transaction_filter.stats() for transaction_filter in filters if transaction_filter is not None)
+
+    def add_transactions(self, transactions):
+        for shard, group in self._group(transactions).items():
+            self._call(shard, "add_transactions", group)
+
+    def update_transaction(self, transaction_id, **changes):
+        return self._call(self._transaction_shard(transaction_id), "update_transaction", transaction_id, **changes)
+
+    def _group(self, transactions):
+        groups = {}
+        for transaction in transactions:
+            groups.setdefault(self._transaction_shard(transaction["transaction_id"]), []).append(transaction)
+        return groups
+
+    # ---------- 轉賬 ----------
+
+    def open_transfer(self, transaction):
+        sender_shard = self._user_shard(transaction["sender_email"])
+        if self._transaction_shard(transaction["transaction_id"]) == sender_shard:
+            return self._call(sender_shard, "open_transfer", transaction)
+        result = self._open_two_phase(transaction["sender_email"], [transaction])
+        return None if result is None else result[0]
+
+    def open_transfers(self, sender_email, transactions):
+        sender_shard = self._user_shard(sender_email)
+        groups = self._group(transactions)
+        if list(groups) == [sender_shard]:
+            return self._call(sender_shard, "open_transfers", sender_email, transactions)
+        return self._open_two_phase(sender_email, transactions)
+
+    def _open_two_phase(self, sender_email, transactions):
+        sender_shard = self._user_shard(sender_email)
+        key = str(uuid.uuid4())
+        parts = [(transaction["transaction_id"], transaction["amount"]) for transaction in transactions]
+        if not self._call(sender_shard, "reserve", key, sender_email, parts):
+            return None
+        # 寫入失敗或結果未知時保留預留，由恢復流程根據交易是否存在決定退款
+        for shard, group in self._group(transactions).items():
+            if not self._call(shard, "store", group):
+                raise ShardError("交易寫入已被恢復流程作廢")
+        if not self._call(sender_shard, "settle", key):
+            raise ShardError("扣款預留已被恢復流程處理")
+        return transactions
+
+    def close_transfer(self, transaction_id, status, credit_email, **changes):
+        transaction_shard = self._transaction_shard(transaction_id)
+        credit_shard = self._user_shard(credit_email)
+        if credit_shard == transaction_shard:
+            return self._call(transaction_shard, "close_transfer", transaction_id, status, credit_email, **changes)
+        transaction = self._call(transaction_shard, "close_to_outbox", transaction_id, status, credit_email, **changes)
+        if transaction is None:
+            return None
+        self._call(credit_shard, "credit", transaction_id, credit_email, transaction["amount"])
+        self._call(transaction_shard, "acknowledge", transaction_id)
+        return transaction
+
+    # ---------- 查詢: 各分片結果按排序鍵合併 ----------
+
+    def _iter_shard(self, shard, user_id, before):
+        while True:
+            page = self._call(shard, "get_user_transactions", user_id, before, SHARD_PAGE_SIZE)
+            yield from page
+            if len(page) < SHARD_PAGE_SIZE:
+                return
+            before = transaction_sort_key(page[-1])
+
+    def iter_user_transactions(self, user_id, before=None):
+        iterators = [self._iter_shard(shard, user_id, before) for shard in range(self.count)]
+        return heapq.merge(*iterators, key=transaction_sort_key, reverse=True)
+
+    def get_user_transactions(self, user_id, before=None, limit=None):
+        if limit is None:
+            return list(self.iter_user_transactions(user_id, before))
+        pages = self._broadcast("get_user_transactions", user_id, before, limit)
+        return list(heapq.merge(*pages, key=transaction_sort_key, reverse=True))[:limit]
+
+    def get_transactions_by_status(self, status):
+        pages = self._broadcast("get_transactions_by_status", status)
+        return list(heapq.merge(*pages, key=transaction_sort_key, reverse=True))
+
+    def get_transactions(self, before=None, limit=None):
+        pages = self._broadcast("get_transactions", before, limit)
+        return list(heapq.merge(*pages, key=transaction_sort_key, reverse=True))[:limit]
+
+    def query_transactions(self, query, before=None, limit=None):
+        # 每個分片按自己的索引規劃查詢，各取前 limit 條後合併；計劃說明標上分片號
+        results = self._broadcast("query_transactions", query, before, limit)
+        pages = [transactions for transactions, _ in results]
+        steps = [dict(step, shard=shard) for shard, (_, shard_steps) in enumerate(results) for step in shard_steps]
+        return list(heapq.merge(*pages, key=transaction_sort_key, reverse=True))[:limit], steps
+
+    def get_ledger(self):
+        # 每個分片的快照各自一致；進行中的跨分片轉賬 (已扣款未寫入、已結算未入賬) 會表現為暫時的差額
+        parts = self._broadcast("get_ledger")
+        codes = PartyCodes()
+        emails, balances = [], []
+        senders, receivers, statuses, amounts = array("q"), array("q"), array("b"), array("q")
+        for part in parts:
+            emails += part.emails
+            balances += part.balances
+            # 分片內的參與方編號轉為全局編號，表尾的 NO_PARTY 對應分片內的 -1
+            table = [codes[email] for email in part.parties] + [NO_PARTY]
+            senders.extend(map(table.__getitem__, part.senders))
+            receivers.extend(map(table.__getitem__, part.receivers))
+            statuses.extend(part.statuses)
+            amounts.extend(part.amounts)
+        return Ledger(emails, balances, codes.parties, senders, receivers, statuses, amounts)
+
+    # ---------- 多個worker共享的狀態 ----------
+
+    def shared(self, key, method, *args):
+        """在key所在的分片上執行共享狀態操作 (限流令牌桶、冪等響應)"""
+        return self._call(shard_of(key, self.count), method, *args)
+
+    def _topic_shard(self, topic):
+        # 主題 "transaction:<交易ID>" 與 "user:<email>" 和對應的數據在同一分片
+        return shard_of(topic.partition(":")[2], self.count)
+
+    def watch(self, topic):
+        self._call(self._topic_shard(topic), "watch", topic)
+
+    def unwatch(self, topic):
+        self._call(self._topic_shard(topic), "unwatch", topic)
+
+    def publish(self, topic, kind, key):
+        return self._call(self._topic_shard(topic), "publish", topic, kind, key)
+
+    def events_since(self, shard, after, timeout=SHARD_EVENT_POLL_SECONDS):
+        return self._call(shard, "events_since", after, timeout)
+
+    # ---------- 恢復 ----------
+
+    def recover(self, older_than=None):
+        """補完超時未完成的兩階段操作，返回處理的條目數"""
+        older_than = time.time() - self.recovery_seconds if older_than is None else older_than
+        handled = 0
+        for shard, (holds, outbox) in enumerate(self._broadcast("in_doubt", older_than)):
+            for key, _, parts in holds:
+                # 先作廢未寫入的交易，之後遲到的寫入會被拒絕，退款金額不會再變化
+                amounts = dict(parts)
+                by_shard = {}
+                for transaction_id in amounts:
+                    by_shard.setdefault(self._transaction_shard(transaction_id), []).append(transaction_id)
+                existing = set()
+                for transaction_shard, transaction_ids in by_shard.items():
+                    existing.update(self._call(transaction_shard, "fence", transaction_ids))
+                refund = sum(amount for transaction_id, amount in amounts.items() if transaction_id not in existing)
+                self._call(shard, "release", key, refund)
+                handled += 1
+            for transaction_id, credit_email, amount in outbox:
+                self._call(self._user_shard(credit_email), "credit", transaction_id, credit_email, amount)
+                self._call(shard, "acknowledge", transaction_id)
+                handled += 1
+        if handled:
+            logger.warning("已恢復未完成的跨分片轉賬", extra={"count": handled})
+        return handled
+
+    def _run_recovery(self):
+        while not self._closed.wait(self.recovery_seconds):
+            try:
+                self.recover()
+            except Exception:
+                logger.exception("跨分片轉賬恢復失敗")
+
+    def close(self):
+        self._closed.set()
+        for pool in self._pools:
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except queue.Empty:
+                    break
+
+if __name__ == "__main__":
+    # 單獨運行所有分片: python -m app.database.shard
+    parser = argparse.ArgumentParser(description="分片存儲進程")
+    parser.add_argument("--serve", help="只運行一個分片並監聽指定socket")
+    parser.add_argument("--parent", type=int, help="父進程PID，父進程退出時隨之退出")
+    parser.add_argument("--filter-capacity", type=int, default=TRANSACTION_FILTER_CAPACITY, help="交易ID過濾器容量，0為關閉")
+    args = parser.parse_args()
+    if args.serve:
+        if args.parent:
+            threading.Thread(target=_watch_parent, args=(args.parent,), daemon=True).start()
+        ShardServer(args.serve, args.filter_capacity).serve_forever()
+    else:
+        if not os.getenv(SHARD_AUTHKEY_ENV):
+            raise SystemExit(f"單獨運行分片時需設置 {SHARD_AUTHKEY_ENV}，API進程使用相同的值")
+        for process in start_shards():
+            process.wait()
@@ -0,0 +1,364 @@
+import os
+import queue
+import sqlite3
+from array import array
+from contextlib import contextmanager
+from datetime import datetime
+
+from app.database.db import Repository
+from app.database.ledger import Ledger, PartyCodes, status_code
+from app.database.records import INITIAL_VERSION
+
+# 表結構 - 時間統一存為固定到微秒的ISO字符串，保證字典序與時間序一致；點數為整數最小單位
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    hashed_password TEXT NOT NULL,
+    balance INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    transaction_id TEXT PRIMARY KEY,
+    amount INTEGER NOT NULL,
+    note TEXT,
+    sender_id TEXT NOT NULL,
+    sender_email TEXT NOT NULL,
+    sender_name TEXT NOT NULL,
+    receiver_id TEXT,
+    receiver_email TEXT,
+    receiver_name TEXT,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    expires_at TEXT,
+    completed_at TEXT,
+    version INTEGER NOT NULL DEFAULT 1
+);
+
+CREATE INDEX IF NOT EXISTS idx_transactions_sender ON transactions (sender_id, created_at, transaction_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_receiver ON transactions (receiver_id, created_at, transaction_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_status ON transactions (status, created_at, transaction_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_created ON transactions (created_at, transaction_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_sender_status ON transactions (sender_email, status, created_at, transaction_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_receiver_status ON transactions (receiver_email, status, created_at, transaction_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_status_completed ON transactions (status, completed_at);
+CREATE INDEX IF NOT EXISTS idx_transactions_status_amount ON transactions (status, amount);
+"""
+
+# 表結構版本 (PRAGMA user_version)，打開其他版本的數據庫時報錯
+SCHEMA_VERSION = 1
+
+USER_FIELDS = ("email", "user_id", "name", "hashed_password", "balance", "created_at", "version")
+TRANSACTION_FIELDS = (
+    "transaction_id", "amount", "note",
+    "sender_id", "sender_email", "sender_name",
+    "receiver_id", "receiver_email", "receiver_name",
+    "status", "created_at", "expires_at", "completed_at", "version",
+)
+DATETIME_FIELDS = {"created_at", "expires_at", "completed_at"}
+
+# 預先構建的SQL語句 - sqlite3 按語句文本緩存已編譯的語句
+INSERT_USER = f"INSERT INTO users ({', '.join(USER_FIELDS)}) VALUES ({', '.join('?' * len(USER_FIELDS))})"
+SELECT_USER = "SELECT * FROM users WHERE email = ?"
+ADJUST_BALANCE = "UPDATE users SET balance = balance + ?, version = version + 1 WHERE email = ?"
+DEBIT_BALANCE = "UPDATE users SET balance = balance - ?, version = version + 1 WHERE email = ? AND balance >= ?"
+INSERT_TRANSACTION = (
+    f"INSERT INTO transactions ({', '.join(TRANSACTION_FIELDS)}) "
+    f"VALUES ({', '.join('?' * len(TRANSACTION_FIELDS))})"
+)
+SELECT_TRANSACTION = "SELECT * FROM transactions WHERE transaction_id = ?"
+# 兩個分支各自沿索引倒序取前N條再合併，避免讀出用戶全部歷史
+SELECT_USER_TRANSACTIONS = """
+SELECT * FROM (
+    SELECT * FROM transactions WHERE sender_id = ? AND (created_at, transaction_id) < (?, ?)
+    ORDER BY created_at DESC, transaction_id DESC LIMIT ?
+)
+UNION
+SELECT * FROM (
+    SELECT * FROM transactions WHERE receiver_id = ? AND (created_at, transaction_id) < (?, ?)
+    ORDER BY created_at DESC, transaction_id DESC LIMIT ?
+)
+ORDER BY created_at DESC, transaction_id DESC
+LIMIT ?
+"""
+SELECT_TRANSACTIONS = """
+SELECT * FROM transactions WHERE (created_at, transaction_id) < (?, ?)
+ORDER BY created_at DESC, transaction_id DESC
+LIMIT ?
+"""
+SELECT_TRANSACTIONS_BY_STATUS = (
+    "SELECT * FROM transactions WHERE status = ? ORDER BY created_at DESC, transaction_id DESC"
+)
+SELECT_BALANCES = "SELECT email, balance FROM users"
+SELECT_LEDGER = "SELECT sender_email, receiver_email, status, amount FROM transactions"
+
+# 交易查詢條件 → SQL條件 (counterparty 另外處理)；時間範圍為 [from, to)，金額範圍為 [min, max]
+QUERY_CONDITIONS = (
+    ("status", "status", "="),
+    ("sender_email", "sender_email", "="),
+    ("receiver_email", "receiver_email", "="),
+    ("created_from", "created_at", ">="),
+    ("created_to", "created_at", "<"),
+    ("completed_from", "completed_at", ">="),
+    ("completed_to", "completed_at", "<"),
+    ("min_amount", "amount", ">="),
+    ("max_amount", "amount", "<="),
+)
+
+# 比任何ISO時間都大的游標上界
+_MAX_CURSOR = ("9999-12-31T23:59:59.999999", "")
+
+def _to_db(field, value):
+    if field in DATETIME_FIELDS and isinstance(value, datetime):
+        return value.isoformat(timespec="microseconds")
+    if field == "version" and value is None:
+        return INITIAL_VERSION
+    return value
+
+def _from_row(row):
+    record = dict(row)
+    for field in DATETIME_FIELDS:
+        if record.get(field) is not None:
+            record[field] = datetime.fromisoformat(record[field])
+    return record
+
+def _statements(script):
+    return [statement for statement in script.split(";") if statement.strip()]
+
+def _cursor_params(before):
+    if before is None:
+        return _MAX_CURSOR
+    created_at, transaction_id = before
+    return _to_db("created_at", created_at), transaction_id
+
+class SQLiteRepository(Repository):
+    """SQLite存儲後端 - WAL模式，可供多個worker進程共享同一數據文件"""
+
+    batch_size = 500
+
+    def __init__(self, path, pool_size=4):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._pool = queue.Queue(maxsize=pool_size)
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+
+        with self._transaction() as conn:
+            self._create_schema(conn)
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            isolation_level=None,  # 自動提交，需要時顯式 BEGIN
+            cached_statements=256,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA cache_size=-65536")  # 每個連接64MB頁緩存
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def _create_schema(self, conn):
+        """建表並記錄表結構版本 (在寫事務內執行，多個worker同時啟動時互不衝突)"""
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            raise ValueError(f"不支持的數據庫表結構版本: {self.path} (user_version={version})")
+        # 每次啟動都執行 (IF NOT EXISTS)，新增的索引會在已有數據庫上補建
+        for statement in _statements(SCHEMA):
+            conn.execute(statement)
+        if version == 0:
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @contextmanager
+    def _connection(self):
+        """從連接池借出連接"""
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def _transaction(self):
+        """借出連接並開啟寫事務 (BEGIN IMMEDIATE 立即取得寫鎖，跨進程同樣有效)"""
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def get_user(self, email):
+        with self._connection() as conn:
+            row = conn.execute(SELECT_USER, (email,)).fetchone()
+        return _from_row(row) if row else None
+
+    def add_user(self, user):
+        with self._connection() as conn:
+            conn.execute(INSERT_USER, [_to_db(field, user.get(field)) for field in USER_FIELDS])
+        return user
+
+    def adjust_balance(self, email, delta):
+        with self._connection() as conn:
+            conn.execute(ADJUST_BALANCE, (delta, email))
+            row = conn.execute(SELECT_USER, (email,)).fetchone()
+        return _from_row(row) if row else None
+
+    def get_transaction(self, transaction_id):
+        with self._connection() as conn:
+            row = conn.execute(SELECT_TRANSACTION, (transaction_id,)).fetchone()
+        return _from_row(row) if row else None
+
+    def add_transaction(self, transaction):
+        with self._connection() as conn:
+            conn.execute(INSERT_TRANSACTION, [_to_db(field, transaction.get(field)) for field in TRANSACTION_FIELDS])
+        return transaction
+
+    def add_transactions(self, transactions):
+        """批量寫入交易 (單個事務)"""
+        rows = [[_to_db(field, tx.get(field)) for field in TRANSACTION_FIELDS] for tx in transactions]
+        with self._connection() as conn:
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(INSERT_TRANSACTION, rows)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _update_statement(self, changes, condition):
+        fields = [field for field in changes if field in TRANSACTION_FIELDS and field not in ("transaction_id", "version")]
+        assignments = ", ".join([*(f"{field} = ?" for field in fields), "version = version + 1"])
+        params = [_to_db(field, changes[field]) for field in fields]
+        return f"UPDATE transactions SET {assignments} WHERE {condition}", params
+
+    def update_transaction(self, transaction_id, **changes):
+        with self._connection() as conn:
+            if changes:
+                sql, params = self._update_statement(changes, "transaction_id = ?")
+                conn.execute(sql, (*params, transaction_id))
+            row = conn.execute(SELECT_TRANSACTION, (transaction_id,)).fetchone()
+        if row is None:
+            raise KeyError(transaction_id)
+        return _from_row(row)
+
+    def open_transfer(self, transaction):
+        amount = transaction["amount"]
+        row = [_to_db(field, transaction.get(field)) for field in TRANSACTION_FIELDS]
+        with self._transaction() as conn:
+            # 條件扣款: 餘額不足時不會更新任何行
+            if conn.execute(DEBIT_BALANCE, (amount, transaction["sender_email"], amount)).rowcount == 0:
+                return None
+            conn.execute(INSERT_TRANSACTION, row)
+        return transaction
+
+    def open_transfers(self, sender_email, transactions):
+        total = sum(transaction["amount"] for transaction in transactions)
+        rows = [[_to_db(field, tx.get(field)) for field in TRANSACTION_FIELDS] for tx in transactions]
+        with self._transaction() as conn:
+            if conn.execute(DEBIT_BALANCE, (total, sender_email, total)).rowcount == 0:
+                return None
+            conn.executemany(INSERT_TRANSACTION, rows)
+        return transactions
+
+    def close_transfer(self, transaction_id, status, credit_email, **changes):
+        sql, params = self._update_statement({"status": status, **changes}, "transaction_id = ? AND status = 'pending'")
+        with self._transaction() as conn:
+            # 狀態CAS: 只有仍為pending的交易會被更新
+            if conn.execute(sql, (*params, transaction_id)).rowcount == 0:
+                return None
+            row = conn.execute(SELECT_TRANSACTION, (transaction_id,)).fetchone()
+            conn.execute(ADJUST_BALANCE, (row["amount"], credit_email))
+        return _from_row(row)
+
+    def _select_user_transactions(self, user_id, before, limit):
+        created_at, transaction_id = _cursor_params(before)
+        params = (user_id, created_at, transaction_id, limit, user_id, created_at, transaction_id, limit, limit)
+        with self._connection() as conn:
+            rows = conn.execute(SELECT_USER_TRANSACTIONS, params).fetchall()
+        return [_from_row(row) for row in rows]
+
+    def iter_user_transactions(self, user_id, before=None):
+        # 按批次做鍵集分頁，避免一次讀入全部歷史
+        while True:
+            batch = self._select_user_transactions(user_id, before, self.batch_size)
+            yield from batch
+            if len(batch) < self.batch_size:
+                return
+            before = (batch[-1]["created_at"], batch[-1]["transaction_id"])
+
+    def get_user_transactions(self, user_id, before=None, limit=None):
+        if limit is None:
+            return list(self.iter_user_transactions(user_id, before))
+        return self._select_user_transactions(user_id, before, limit)
+
+    def get_transactions_by_status(self, status):
+        with self._connection() as conn:
+            rows = conn.execute(SELECT_TRANSACTIONS_BY_STATUS, (status,)).fetchall()
+        return [_from_row(row) for row in rows]
+
+    def get_transactions(self, before=None, limit=None):
+        # LIMIT -1 表示不限制條數
+        params = (*_cursor_params(before), -1 if limit is None else limit)
+        with self._connection() as conn:
+            rows = conn.execute(SELECT_TRANSACTIONS, params).fetchall()
+        return [_from_row(row) for row in rows]
+
+    def query_transactions(self, query, before=None, limit=None):
+        conditions, params = ["(created_at, transaction_id) < (?, ?)"], list(_cursor_params(before))
+        for field, column, operator in QUERY_CONDITIONS:
+            value = getattr(query, field)
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.append(_to_db(column, value))
+        if query.counterparty is not None:
+            conditions.append("(sender_email = ? OR receiver_email = ?)")
+            params += [query.counterparty, query.counterparty]
+        # 索引由SQLite的查詢規劃器選擇，計劃說明取自 EXPLAIN QUERY PLAN
+        statement = (
+            f"SELECT * FROM transactions WHERE {' AND '.join(conditions)} "
+            "ORDER BY created_at DESC, transaction_id DESC LIMIT ?"
+        )
+        params.append(-1 if limit is None else limit)
+        with self._connection() as conn:
+            steps = [{"index": row["detail"]} for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}", params)]
+            rows = conn.execute(statement, params).fetchall()
+        return [_from_row(row) for row in rows], steps
+
+    def get_ledger(self):
+        with self._connection() as conn:
+            # 兩次查詢在同一個讀事務中，看到的是同一個WAL快照
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            conn.execute("BEGIN")
+            try:
+                users = cursor.execute(SELECT_BALANCES).fetchall()
+                transactions = cursor.execute(SELECT_LEDGER).fetchall()
+            finally:
+                conn.execute("COMMIT")
+        emails, balances = map(list, zip(*users)) if users else ([], [])
+        senders, receivers, statuses, amounts = map(list, zip(*transactions)) if transactions else ([], [], [], [])
+        # email 轉為參與方編號、狀態轉為編碼，與內存存儲的列式流水格式一致
+        codes = PartyCodes()
+        return Ledger(
+            emails, balances, codes.parties,
+            array("q", map(codes.__getitem__, senders)), array("q", map(codes.__getitem__, receivers)),
+            array("b", map(status_code, statuses)), array("q", amounts),
+        )
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
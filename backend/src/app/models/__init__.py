@@ -1,7 +1,15 @@
+from app.models.money import MINOR_UNITS, INITIAL_BALANCE, to_minor, from_minor, format_minor
 from app.models.user import User, UserCreate, UserInDB, Token, TokenData
-from app.models.transaction import Transaction, TransactionCreate, TransactionInDB, TransactionResponse
+from app.models.transaction import (
+    Transaction, TransactionCreate, TransactionInDB, TransactionResponse,
+    BatchTransactionItem, BatchTransactionCreate, BatchItemResult, BatchTransactionResponse
+)
+from app.models.audit import AuditDiscrepancy, AuditReport
 
 __all__ = [
+    "MINOR_UNITS", "INITIAL_BALANCE", "to_minor", "from_minor", "format_minor",
     "User", "UserCreate", "UserInDB", "Token", "TokenData",
-    "Transaction", "TransactionCreate", "TransactionInDB", "TransactionResponse"
+    "Transaction", "TransactionCreate", "TransactionInDB", "TransactionResponse",
+    "BatchTransactionItem", "BatchTransactionCreate", "BatchItemResult", "BatchTransactionResponse",
+    "AuditDiscrepancy", "AuditReport"
 ]
@@ -0,0 +1,24 @@
+from typing import List
+from fastapi_camelcase import CamelModel
+
+class AuditDiscrepancy(CamelModel):
+    email: str
+    balance: float
+    expected: float  # 初始點數 - 轉出 (待接收與已完成) + 轉入 (已完成)
+    difference: float
+    pending: float  # 該賬戶被待接收交易暫扣的點數
+
+class AuditReport(CamelModel):
+    balanced: bool
+    accounts: int
+    transactions: int
+    granted: float  # 全部賬戶的初始點數
+    balances: float  # 全部賬戶當前餘額之和
+    pending: float  # 待接收交易暫扣的點數
+    outflow: float  # 已完成、接收方不在賬戶表中的點數 (轉出系統)
+    inflow: float  # 發送方不在賬戶表中的交易點數 (來源不明)
+    unknown_statuses: int
+    discrepancy_count: int
+    discrepancies: List[AuditDiscrepancy]
+    load_ms: float
+    reconcile_ms: float
@@ -0,0 +1,30 @@
+from decimal import Decimal, InvalidOperation
+
+# 點數以整數最小單位 (1點 = 100) 存儲與計算，只在API邊界與小數互轉
+# 整數加減沒有浮點舍入誤差，餘額與流水可以精確對賬
+MINOR_UNITS = 100
+AMOUNT_DECIMALS = 2
+
+# 新用戶的初始點數 (最小單位)
+INITIAL_BALANCE = 1000 * MINOR_UNITS
+
+def to_minor(amount) -> int:
+    """API輸入的點數 (最多兩位小數) 轉為整數最小單位，位數過多時拋出 ValueError"""
+    try:
+        # 經由 str 轉換，0.1 之類的浮點輸入得到的是 Decimal("0.1") 而非其二進制近似值
+        value = Decimal(str(amount)) * MINOR_UNITS
+    except InvalidOperation:
+        raise ValueError(f"無效的點數: {amount!r}") from None
+    if not value.is_finite() or value != value.to_integral_value():
+        raise ValueError(f"點數最多{AMOUNT_DECIMALS}位小數")
+    return int(value)
+
+def from_minor(amount: int) -> float:
+    """整數最小單位轉為API輸出的點數"""
+    return amount / MINOR_UNITS
+
+def format_minor(amount: int) -> str:
+    """整數最小單位格式化為固定兩位小數的字符串 (用於導出)"""
+    sign = "-" if amount < 0 else ""
+    whole, fraction = divmod(abs(amount), MINOR_UNITS)
+    return f"{sign}{whole}.{fraction:0{AMOUNT_DECIMALS}d}"
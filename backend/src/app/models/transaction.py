@@ -1,12 +1,21 @@
-from pydantic import Field, EmailStr
-from typing import Optional
+from pydantic import Field, EmailStr, field_validator
+from typing import List, Optional
 from datetime import datetime
 from fastapi_camelcase import CamelModel
 
+from app.models.money import to_minor
+
 class TransactionBase(CamelModel):
     amount: float
     note: Optional[str] = None
 
+    @field_validator("amount")
+    @classmethod
+    def check_minor_units(cls, value):
+        # 存儲使用整數最小單位，超過兩位小數的點數無法精確表示
+        to_minor(value)
+        return value
+
 class TransactionCreate(TransactionBase):
     receiver_email: Optional[EmailStr] = None
 
@@ -22,6 +31,7 @@ class TransactionInDB(TransactionBase):
     created_at: datetime = Field(default_factory=datetime.now)
     expires_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
+    version: int = 1  # 每次修改加1，用於ETag
 
 class Transaction(TransactionInDB):
     class Config:
@@ -29,3 +39,25 @@ class Transaction(TransactionInDB):
 
 class TransactionResponse(Transaction):
     pass
+
+# 批量發放 - 單次請求的最大條目數
+MAX_BATCH_ITEMS = 50000
+
+class BatchTransactionItem(TransactionBase):
+    receiver_email: EmailStr
+
+class BatchTransactionCreate(CamelModel):
+    items: List[BatchTransactionItem] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
+class BatchItemResult(CamelModel):
+    index: int
+    receiver_email: str
+    status: str  # created, failed
+    transaction_id: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchTransactionResponse(CamelModel):
+    created: int
+    failed: int
+    total_amount: float
+    results: List[BatchItemResult]
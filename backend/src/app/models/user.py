@@ -14,11 +14,13 @@ class User(UserBase):
     user_id: str
     balance: float = 0
     created_at: datetime = Field(default_factory=datetime.now)
+    version: int = 1  # 每次修改加1，用於ETag
 
     class Config:
         from_attributes = True
 
 class UserInDB(User):
+    balance: int = 0  # 存儲使用整數最小單位
     hashed_password: str
 
 class Token(CamelModel):
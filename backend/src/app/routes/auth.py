@@ -1,14 +1,20 @@
 import uuid
+import logging
 from datetime import timedelta, datetime
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
 
+from app.models.money import INITIAL_BALANCE
 from app.models.user import User, UserCreate, UserInDB, Token
-from app.database.db import get_db, users_db
-from app.utils.auth import verify_password, get_password_hash, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.database.db import get_db, get_user, add_user, call_storage
+from app.utils.auth import verify_password_async, get_password_hash_async, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.utils.serialization import user_to_model
+from app.utils.ratelimit import login_ip_limiter, login_email_limiter, register_ip_limiter, password_admission
 
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 # 為 Swagger UI 認證創建的簡化令牌模型
@@ -16,11 +22,16 @@ class OAuth2Token(BaseModel):
     access_token: str
     token_type: str
 
-@router.post("/register", response_model=User, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/register",
+    response_model=User,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(password_admission), Depends(register_ip_limiter)]
+)
 async def register(user_data: UserCreate):
     """Register a new user"""
     # Check if email already exists
-    if user_data.email in users_db:
+    if await call_storage(get_user, user_data.email) is not None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="This email has already been registered"
@@ -28,34 +39,42 @@ async def register(user_data: UserCreate):
 
     # Create new user
     user_id = str(uuid.uuid4())
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
+
+    # 哈希計算期間可能有相同email的註冊請求先完成
+    if await call_storage(get_user, user_data.email) is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="This email has already been registered"
+        )
 
     user_in_db = UserInDB(
         user_id=user_id,
         email=user_data.email,
         name=user_data.name,
         hashed_password=hashed_password,
-        balance=1000  # New users get 1000 points initial balance
+        balance=INITIAL_BALANCE  # New users get 1000 points initial balance
     )
 
     # Store user data using email as key
-    users_db[user_data.email] = user_in_db.dict()
+    user = await call_storage(add_user, user_in_db.model_dump())
 
-    return User(**users_db[user_data.email])
+    return user_to_model(user)
 
-@router.post("/login", response_model=OAuth2Token)
+@router.post("/login", response_model=OAuth2Token, dependencies=[Depends(password_admission), Depends(login_ip_limiter)])
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """用戶登錄 - 符合 OAuth2 規範的令牌返回"""
     email = form_data.username
+    # 在bcrypt驗證之前按email限流，防止針對單個帳號的暴力破解
+    await login_email_limiter.check(email)
     # 直接使用email作為key查找用戶
-    user = users_db.get(email)
+    user = await call_storage(get_user, email)
 
-    # 输出调试信息
-    print(f"Login attempt: {email}, {form_data.password}")
-    print(f"Found user: {user}")
+    # 输出调试信息 (不記錄密碼與用戶完整數據)
+    logger.debug("Login attempt", extra={"email": email, "found": user is not None})
 
     # Validate user and password
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    if not user or not await verify_password_async(form_data.password, user["hashed_password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email or password is incorrect",
@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from typing import Literal
+
+from app.models.user import User
+from app.utils.auth import get_current_admin
+from app.utils.profiling import PROFILING_ENABLED, profile_buffer, folded
+
+router = APIRouter()
+
+@router.get("/")
+async def list_profiles(current_user: User = Depends(get_current_admin)):
+    """列出本worker最近捕獲的請求剖析 (僅管理員)，最新的在前"""
+    return {"enabled": PROFILING_ENABLED, "profiles": profile_buffer.summaries()}
+
+@router.get("/{profile_id}")
+async def download_profile(
+    profile_id: int,
+    format: Literal["folded", "json"] = "folded",
+    current_user: User = Depends(get_current_admin)
+):
+    """下載剖析結果 (僅管理員): folded 為折疊棧文本，可生成火焰圖；json 含請求信息與棧計數"""
+    profile = profile_buffer.get(profile_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="剖析結果不存在或已被覆蓋"
+        )
+    if format == "json":
+        return profile
+    return Response(
+        folded(profile),
+        media_type="text/plain",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'},
+    )
+
+@router.delete("/", status_code=status.HTTP_204_NO_CONTENT)
+async def clear_profiles(current_user: User = Depends(get_current_admin)):
+    """清空本worker的剖析結果 (僅管理員)"""
+    profile_buffer.clear()
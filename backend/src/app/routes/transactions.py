@@ -1,119 +1,316 @@
+import json
 import uuid
 from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from typing import List, Literal, Optional
 
+from app.models.money import to_minor, from_minor
 from app.models.user import User
-from app.models.transaction import Transaction, TransactionCreate, TransactionResponse
-from app.database.db import get_db, users_db, transactions_db
-from app.utils.auth import get_current_user, get_password_hash
+from app.models.audit import AuditReport
+from app.models.transaction import (
+    Transaction, TransactionCreate, TransactionResponse,
+    BatchTransactionCreate, BatchItemResult, BatchTransactionResponse
+)
+from app.database.records import INITIAL_VERSION
+from app.database.query import TransactionQuery
+from app.database.db import (
+    get_db, get_user, get_transactions as get_all_transactions, query_transactions as run_query,
+    get_transaction as find_transaction, open_transfer, open_transfers, close_transfer, call_storage
+)
+from app.utils.auth import get_current_user, get_current_admin, get_password_hash
+from app.utils.pagination import (
+    list_user_transactions, decode_cursor, encode_cursor, DEFAULT_PAGE_LIMIT, MAX_PAGE_LIMIT, NEXT_CURSOR_HEADER
+)
+from app.utils.expiry import expiry_sweeper
+from app.utils.events import sse_response, transaction_topic, serialize_transaction, is_final_transaction_event
+from app.utils.serialization import transaction_response, transactions_response
+from app.utils.etag import transaction_etag, not_modified, set_etag
+from app.utils.idempotency import idempotency_key, replay_response, remember_response
+from app.utils.export import export_response, local_naive
+from app.utils.audit import run_audit
+from app.utils.probes import known_transaction
+from app.utils.ratelimit import (
+    public_ip_limiter, public_transaction_limiter, public_email_limiter, public_admission, event_stream_admission
+)
 
 router = APIRouter()
 
+# 待接收交易的有效期
+TRANSACTION_EXPIRE_MINUTES = 30
+# 查詢計劃說明的響應頭 (每個分支使用的索引、候選條數與實際檢查的交易數)
+QUERY_PLAN_HEADER = "X-Query-Plan"
+
+def _new_transaction(sender: User, amount, note, receiver=None):
+    """構建待接收的交易記錄"""
+    now = datetime.now()
+    return {
+        "transaction_id": str(uuid.uuid4()),
+        "amount": amount,
+        "note": note,
+        "sender_id": sender.user_id,
+        "sender_email": sender.email,
+        "sender_name": sender.name,
+        "receiver_id": receiver["user_id"] if receiver else None,
+        "receiver_email": receiver["email"] if receiver else None,
+        "receiver_name": receiver["name"] if receiver else None,
+        "status": "pending",
+        "created_at": now,
+        "expires_at": now + timedelta(minutes=TRANSACTION_EXPIRE_MINUTES),
+        "completed_at": None,
+        "version": INITIAL_VERSION
+    }
+
 @router.get("/", response_model=List[Transaction])
-async def get_transactions(current_user: User = Depends(get_current_user)):
-    """獲取交易列表"""
-    user_transactions = []
+async def get_transactions(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """獲取交易列表 (按時間倒序，支持游標分頁與NDJSON流式輸出)"""
+    return await list_user_transactions(current_user.user_id, limit, cursor, stream)
+
+@router.get("/export")
+async def export_transactions(
+    format: Literal["csv", "columnar"] = "csv",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """流式導出所有用戶的交易 (僅管理員)，可按創建時間 [start, end) 篩選"""
+    return export_response(get_all_transactions, format, start, end, "transactions")
+
+def _amount_bound(value: Optional[float]):
+    try:
+        return None if value is None else to_minor(value)
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(error)
+        )
 
-    for tx in transactions_db.values():
-        if tx.get("sender_id") == current_user.user_id or tx.get("receiver_id") == current_user.user_id:
-            user_transactions.append(Transaction(**tx))
+def _check_range(low, high, detail):
+    if low is not None and high is not None and low > high:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=detail
+        )
 
-    return user_transactions
+@router.get("/query", response_model=List[Transaction])
+async def query_transactions(
+    status_filter: Optional[Literal["pending", "completed", "cancelled"]] = Query(None, alias="status"),
+    sender: Optional[str] = None,
+    receiver: Optional[str] = None,
+    counterparty: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    completed_from: Optional[datetime] = None,
+    completed_to: Optional[datetime] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """按條件查詢所有用戶的交易 (僅管理員)，按創建時間倒序分頁
+
+    - counterparty 匹配發送方或接收方；時間範圍為 [from, to)，金額範圍為 [min, max]
+    - 存儲層按查詢計劃選擇候選最少的複合索引，計劃說明放在 X-Query-Plan 響應頭中
+    """
+    query = TransactionQuery(
+        status=status_filter,
+        sender_email=sender,
+        receiver_email=receiver,
+        counterparty=counterparty,
+        created_from=local_naive(created_from),
+        created_to=local_naive(created_to),
+        completed_from=local_naive(completed_from),
+        completed_to=local_naive(completed_to),
+        min_amount=_amount_bound(min_amount),
+        max_amount=_amount_bound(max_amount),
+    )
+    _check_range(query.created_from, query.created_to, "創建時間的開始必須早於結束")
+    _check_range(query.completed_from, query.completed_to, "結算時間的開始必須早於結束")
+    _check_range(query.min_amount, query.max_amount, "最小金額不能大於最大金額")
+
+    # 多取一條以判斷是否還有下一頁
+    page, plan = await call_storage(run_query, query, decode_cursor(cursor) if cursor else None, limit + 1)
+    response = transactions_response(page[:limit])
+    if len(page) > limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(page[limit - 1])
+    response.headers[QUERY_PLAN_HEADER] = json.dumps(plan, separators=(",", ":"))
+    return response
+
+@router.get("/audit", response_model=AuditReport)
+def audit_transactions(current_user: User = Depends(get_current_admin)):
+    """對賬 (僅管理員): 檢查每個賬戶的餘額是否等於初始點數減轉出加轉入
+
+    計算密集，定義為同步路由，由線程池執行，不阻塞事件循環
+    """
+    try:
+        return run_audit()
+    except RuntimeError as error:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(error)
+        )
 
-@router.get("/{transaction_id}", response_model=Transaction)
-async def get_transaction(transaction_id: str):
-    """獲取指定交易詳情"""
-    if transaction_id not in transactions_db:
+@router.get("/{transaction_id}", response_model=Transaction, dependencies=[Depends(known_transaction)])
+async def get_transaction(transaction_id: str, if_none_match: Optional[str] = Header(None)):
+    """獲取指定交易詳情，If-None-Match 與當前版本一致時返回304"""
+    transaction = await call_storage(find_transaction, transaction_id)
+    if transaction is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="交易不存在"
         )
 
-    return Transaction(**transactions_db[transaction_id])
+    etag = transaction_etag(transaction)
+    return not_modified(if_none_match, etag) or set_etag(transaction_response(transaction), etag)
 
 @router.post("/prepare", response_model=Transaction, status_code=status.HTTP_201_CREATED)
 async def prepare_transaction(
     transaction_data: TransactionCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    key: Optional[str] = Depends(idempotency_key)
 ):
-    """準備交易 (創建待接收的交易)"""
-    # 檢查餘額是否充足
-    user = users_db.get(current_user.email)
-    if not user or user["balance"] < transaction_data.amount:
+    """準備交易 (創建待接收的交易)，帶 Idempotency-Key 的重試直接返回首次的響應"""
+    scope = ("prepare", current_user.email)
+    fingerprint = transaction_data.model_dump_json()
+    replayed = await replay_response(scope, key, fingerprint)
+    if replayed is not None:
+        return replayed
+
+    # 檢查餘額是否充足 (存儲中的點數為整數最小單位)
+    amount = to_minor(transaction_data.amount)
+    user = await call_storage(get_user, current_user.email)
+    if not user or user["balance"] < amount:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="餘額不足"
         )
 
     # 檢查交易金額是否有效
-    if transaction_data.amount <= 0:
+    if amount <= 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="交易金額必須大於0"
         )
 
     # 如果提供了接收方email，則檢查接收方用戶是否存在
-    receiver_id = None
-    receiver_name = None
+    receiver = None
     receiver_email = transaction_data.receiver_email
 
     if receiver_email:
         # 直接使用email作為key查找接收方用戶
-        receiver = users_db.get(receiver_email)
+        receiver = await call_storage(get_user, receiver_email)
         if not receiver:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"未找到接收方用戶: {receiver_email}"
             )
-        receiver_id = receiver["user_id"]
-        receiver_name = receiver["name"]
-
-    # 創建交易
-    transaction_id = str(uuid.uuid4())
-
-    # 設置過期時間（30分鐘）
-    expires_at = datetime.now() + timedelta(minutes=30)
-
-    new_transaction = {
-        "transaction_id": transaction_id,
-        "amount": transaction_data.amount,
-        "note": transaction_data.note,
-        "sender_id": current_user.user_id,
-        "sender_email": current_user.email,
-        "sender_name": current_user.name,
-        "receiver_id": receiver_id,
-        "receiver_email": receiver_email,
-        "receiver_name": receiver_name,
-        "status": "pending",
-        "created_at": datetime.now(),
-        "expires_at": expires_at,
-        "completed_at": None
-    }
 
-    # 暫時扣除用戶餘額
-    user["balance"] -= transaction_data.amount
+    # 創建交易 (30分鐘後過期)
+    new_transaction = _new_transaction(current_user, amount, transaction_data.note, receiver)
+
+    # 暫時扣除用戶餘額並存儲交易 (原子操作，並發請求不會透支)
+    if await call_storage(open_transfer, new_transaction) is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="餘額不足"
+        )
+
+    # 登記過期時間，到期由後台任務自動取消並退款
+    expiry_sweeper.schedule(new_transaction)
+
+    return await remember_response(scope, key, transaction_response(new_transaction, status.HTTP_201_CREATED), fingerprint)
+
+@router.post("/prepare/batch", response_model=BatchTransactionResponse, status_code=status.HTTP_201_CREATED)
+async def prepare_batch_transactions(
+    batch: BatchTransactionCreate,
+    current_user: User = Depends(get_current_user),
+    key: Optional[str] = Depends(idempotency_key)
+):
+    """批量準備交易 (活動獎勵等批量發放)
+
+    無效條目(金額不正確、接收方不存在)單獨標記為失敗；
+    其餘條目按總額一次性檢查並扣款，全部創建或在餘額不足時全部不創建。
+    """
+    scope = ("prepare_batch", current_user.email)
+    fingerprint = batch.model_dump_json()
+    replayed = await replay_response(scope, key, fingerprint)
+    if replayed is not None:
+        return replayed
+
+    results = []
+    transactions = []
+    receivers = {}
+
+    for index, item in enumerate(batch.items):
+        result = BatchItemResult(index=index, receiver_email=item.receiver_email, status="failed")
+        results.append(result)
+
+        amount = to_minor(item.amount)
+        if amount <= 0:
+            result.error = "交易金額必須大於0"
+            continue
+
+        # 同一批次中重複的接收方只查找一次
+        receiver = receivers.get(item.receiver_email)
+        if receiver is None:
+            receiver = receivers[item.receiver_email] = await call_storage(get_user, item.receiver_email)
+        if receiver is None:
+            result.error = "未找到接收方用戶"
+            continue
+
+        transaction = _new_transaction(current_user, amount, item.note, receiver)
+        transactions.append(transaction)
+        result.status = "created"
+        result.transaction_id = transaction["transaction_id"]
+
+    total_amount = sum(transaction["amount"] for transaction in transactions)
+
+    # 按總額一次性扣款並存儲全部交易
+    if transactions and await call_storage(open_transfers, current_user.email, transactions) is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="餘額不足"
+        )
 
-    # 存儲交易
-    transactions_db[transaction_id] = new_transaction
+    for transaction in transactions:
+        expiry_sweeper.schedule(transaction)
 
-    return Transaction(**new_transaction)
+    summary = BatchTransactionResponse(
+        created=len(transactions),
+        failed=len(results) - len(transactions),
+        total_amount=from_minor(total_amount),
+        results=results
+    )
+    response = Response(
+        summary.model_dump_json(by_alias=True), status_code=status.HTTP_201_CREATED, media_type="application/json"
+    )
+    return await remember_response(scope, key, response, fingerprint)
 
 @router.post("/{transaction_id}/confirm", response_model=Transaction)
 async def confirm_transaction(
     transaction_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    key: Optional[str] = Depends(idempotency_key)
 ):
     """確認接收交易"""
+    scope = ("confirm", current_user.email, transaction_id)
+    replayed = await replay_response(scope, key)
+    if replayed is not None:
+        return replayed
+
     # 檢查交易是否存在
-    if transaction_id not in transactions_db:
+    transaction = await call_storage(find_transaction, transaction_id)
+    if transaction is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="交易不存在"
         )
 
-    transaction = transactions_db[transaction_id]
-
     # 檢查交易狀態
     if transaction["status"] != "pending":
         raise HTTPException(
@@ -123,12 +320,8 @@ async def confirm_transaction(
 
     # 檢查交易是否過期
     if transaction["expires_at"] and datetime.now() > transaction["expires_at"]:
-        transaction["status"] = "cancelled"
-        # 退還發送者餘額
-        sender_email = transaction["sender_email"]
-        sender = users_db.get(sender_email)
-        if sender:
-            sender["balance"] += transaction["amount"]
+        # 取消交易並退還發送者餘額
+        await call_storage(close_transfer, transaction_id, "cancelled", transaction["sender_email"])
 
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -142,43 +335,52 @@ async def confirm_transaction(
             detail="您不是該交易的指定接收方"
         )
 
-    # 更新交易接收者信息
-    transaction["receiver_id"] = current_user.user_id
-    transaction["receiver_email"] = current_user.email
-    transaction["receiver_name"] = current_user.name
-    transaction["status"] = "completed"
-    transaction["completed_at"] = datetime.now()
-
-    # 更新接收者餘額
-    receiver = users_db.get(current_user.email)
+    receiver = await call_storage(get_user, current_user.email)
     if not receiver:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="用戶不存在"
         )
 
-    receiver["balance"] += transaction["amount"]
-
-    # 更新交易記錄
-    transactions_db[transaction_id] = transaction
+    # 更新交易接收者信息並入賬 - 狀態CAS保證重複確認不會重複入賬
+    transaction = await call_storage(
+        close_transfer,
+        transaction_id,
+        "completed",
+        receiver["email"],
+        receiver_id=current_user.user_id,
+        receiver_email=current_user.email,
+        receiver_name=current_user.name,
+        completed_at=datetime.now()
+    )
+    if transaction is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="交易已處理"
+        )
 
-    return Transaction(**transaction)
+    return await remember_response(scope, key, transaction_response(transaction))
 
 @router.post("/{transaction_id}/cancel", response_model=Transaction)
 async def cancel_transaction(
     transaction_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    key: Optional[str] = Depends(idempotency_key)
 ):
     """取消交易"""
+    scope = ("cancel", current_user.email, transaction_id)
+    replayed = await replay_response(scope, key)
+    if replayed is not None:
+        return replayed
+
     # 檢查交易是否存在
-    if transaction_id not in transactions_db:
+    transaction = await call_storage(find_transaction, transaction_id)
+    if transaction is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="交易不存在"
         )
 
-    transaction = transactions_db[transaction_id]
-
     # 檢查是否是發送者 - 使用email比較
     if transaction["sender_email"] != current_user.email:
         raise HTTPException(
@@ -193,32 +395,33 @@ async def cancel_transaction(
             detail="只能取消待處理的交易"
         )
 
-    # 更新交易狀態
-    transaction["status"] = "cancelled"
-    transaction["completed_at"] = datetime.now()
-
-    # 退還發送者餘額
-    sender = users_db.get(current_user.email)
-    if sender:
-        sender["balance"] += transaction["amount"]
-
-    # 更新交易記錄
-    transactions_db[transaction_id] = transaction
+    # 更新交易狀態並退還發送者餘額
+    transaction = await call_storage(
+        close_transfer, transaction_id, "cancelled", current_user.email, completed_at=datetime.now()
+    )
+    if transaction is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="只能取消待處理的交易"
+        )
 
-    return Transaction(**transaction)
+    return await remember_response(scope, key, transaction_response(transaction))
 
 # 添加公共交易路由
-@router.get("/public/{transaction_id}", response_model=Transaction)
-async def get_public_transaction(transaction_id: str):
-    """公共API: 獲取指定交易詳情，無需認證"""
-    if transaction_id not in transactions_db:
+@router.get(
+    "/public/{transaction_id}",
+    response_model=Transaction,
+    dependencies=[Depends(known_transaction), Depends(public_admission), Depends(public_ip_limiter)]
+)
+async def get_public_transaction(transaction_id: str, if_none_match: Optional[str] = Header(None)):
+    """公共API: 獲取指定交易詳情，無需認證；If-None-Match 與當前版本一致時返回304"""
+    transaction = await call_storage(find_transaction, transaction_id)
+    if transaction is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="交易不存在"
         )
 
-    transaction = transactions_db[transaction_id]
-
     # 檢查交易是否過期
     if transaction["expires_at"] and datetime.now() > transaction["expires_at"]:
         raise HTTPException(
@@ -226,14 +429,26 @@ async def get_public_transaction(transaction_id: str):
             detail="交易已過期"
         )
 
-    return Transaction(**transaction)
+    etag = transaction_etag(transaction)
+    return not_modified(if_none_match, etag) or set_etag(transaction_response(transaction), etag)
 
-@router.post("/public/{transaction_id}/confirm", response_model=Transaction)
+@router.post(
+    "/public/{transaction_id}/confirm",
+    response_model=Transaction,
+    dependencies=[Depends(known_transaction), Depends(public_admission), Depends(public_ip_limiter)]
+)
 async def confirm_public_transaction(
     transaction_id: str,
-    request: dict
+    request: dict,
+    key: Optional[str] = Depends(idempotency_key)
 ):
     """公共API: 確認接收交易，無需認證"""
+    scope = ("public_confirm", transaction_id)
+    fingerprint = json.dumps(request, sort_keys=True)
+    replayed = await replay_response(scope, key, fingerprint)
+    if replayed is not None:
+        return replayed
+
     # 從請求體中獲取接收者email和用戶名
     receiver_email = request.get("email")
     receiver_name = request.get("name")
@@ -244,15 +459,18 @@ async def confirm_public_transaction(
             detail="缺少接收者email"
         )
 
+    # 按交易ID與接收方email限流，避免單筆交易或單個帳號被大量請求
+    await public_transaction_limiter.check(transaction_id)
+    await public_email_limiter.check(receiver_email)
+
     # 檢查交易是否存在
-    if transaction_id not in transactions_db:
+    transaction = await call_storage(find_transaction, transaction_id)
+    if transaction is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="交易不存在"
         )
 
-    transaction = transactions_db[transaction_id]
-
     # 檢查交易狀態
     if transaction["status"] != "pending":
         raise HTTPException(
@@ -262,12 +480,8 @@ async def confirm_public_transaction(
 
     # 檢查交易是否過期
     if transaction["expires_at"] and datetime.now() > transaction["expires_at"]:
-        transaction["status"] = "cancelled"
-        # 退還發送者餘額
-        sender_email = transaction["sender_email"]
-        sender = users_db.get(sender_email)
-        if sender:
-            sender["balance"] += transaction["amount"]
+        # 取消交易並退還發送者餘額
+        await call_storage(close_transfer, transaction_id, "cancelled", transaction["sender_email"])
 
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -282,7 +496,7 @@ async def confirm_public_transaction(
         )
 
     # 查找接收方用戶
-    receiver = users_db.get(receiver_email)
+    receiver = await call_storage(get_user, receiver_email)
 
     # 如果沒有找到用戶，返回錯誤
     if not receiver:
@@ -291,17 +505,39 @@ async def confirm_public_transaction(
             detail="user_not_found"
         )
 
-    # 更新交易信息
-    transaction["status"] = "completed"
-    transaction["receiver_id"] = receiver["user_id"]
-    transaction["receiver_email"] = receiver_email
-    transaction["receiver_name"] = receiver_name
-    transaction["completed_at"] = datetime.now()
+    # 更新交易信息並入賬 - 狀態CAS保證重複確認不會重複入賬
+    transaction = await call_storage(
+        close_transfer,
+        transaction_id,
+        "completed",
+        receiver["email"],
+        receiver_id=receiver["user_id"],
+        receiver_email=receiver_email,
+        receiver_name=receiver_name,
+        completed_at=datetime.now()
+    )
+    if transaction is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="交易已處理"
+        )
 
-    # 更新接收者餘額
-    receiver["balance"] += transaction["amount"]
+    return await remember_response(scope, key, transaction_response(transaction), fingerprint)
+
+@router.get(
+    "/{transaction_id}/events",
+    dependencies=[Depends(known_transaction), Depends(event_stream_admission), Depends(public_ip_limiter)]
+)
+async def get_transaction_events(transaction_id: str):
+    """訂閱交易狀態變更 (Server-Sent Events)，交易完成或取消後結束"""
+    if await call_storage(find_transaction, transaction_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="交易不存在"
+        )
 
-    # 更新交易記錄
-    transactions_db[transaction_id] = transaction
+    def snapshot():
+        transaction = find_transaction(transaction_id)
+        return ("transaction", serialize_transaction(transaction)) if transaction else None
 
-    return Transaction(**transaction)
+    return sse_response(transaction_topic(transaction_id), snapshot, is_final_transaction_event)
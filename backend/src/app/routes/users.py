@@ -1,29 +1,61 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from datetime import datetime
+from fastapi import APIRouter, Depends, Header, Query, Response
+from typing import List, Literal, Optional
 
 from app.models.user import User
 from app.models.transaction import Transaction
-from app.database.db import get_db, users_db, transactions_db
+from app.database.db import get_db, get_user, get_user_transactions
 from app.utils.auth import get_current_user
+from app.utils.pagination import list_user_transactions, MAX_PAGE_LIMIT
+from app.utils.events import sse_response, user_topic, serialize_balance
+from app.utils.export import export_response
+from app.utils.etag import entity_tag, not_modified, set_etag
+from app.utils.ratelimit import event_stream_admission
 
 router = APIRouter()
 
 @router.get("/me", response_model=User)
-async def get_current_user_info(current_user: User = Depends(get_current_user)):
-    """獲取當前用戶信息"""
+async def get_current_user_info(
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    if_none_match: Optional[str] = Header(None)
+):
+    """獲取當前用戶信息，If-None-Match 與當前版本一致時返回304"""
+    etag = entity_tag(current_user.user_id, current_user.version)
+    cached = not_modified(if_none_match, etag)
+    if cached is not None:
+        return cached
+    set_etag(response, etag)
     return current_user
 
-@router.get("/me/transactions", response_model=List[Transaction])
-async def get_current_user_transactions(current_user: User = Depends(get_current_user)):
-    """獲取當前用戶的交易歷史"""
-    user_transactions = []
+@router.get("/me/events", dependencies=[Depends(event_stream_admission)])
+async def get_current_user_events(current_user: User = Depends(get_current_user)):
+    """訂閱當前用戶的餘額變更 (Server-Sent Events)"""
+    def snapshot():
+        user = get_user(current_user.email)
+        return ("balance", serialize_balance(user)) if user else None
+
+    return sse_response(user_topic(current_user.email), snapshot)
 
-    # 查找所有與當前用戶相關的交易
-    for tx in transactions_db.values():
-        if tx["sender_id"] == current_user.user_id or tx["receiver_id"] == current_user.user_id:
-            user_transactions.append(Transaction(**tx))
+@router.get("/me/transactions", response_model=List[Transaction])
+async def get_current_user_transactions(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """獲取當前用戶的交易歷史 (按時間倒序，支持游標分頁與NDJSON流式輸出)"""
+    return await list_user_transactions(current_user.user_id, limit, cursor, stream)
 
-    # 按時間倒序排序
-    user_transactions.sort(key=lambda x: x.created_at, reverse=True)
+@router.get("/me/transactions/export")
+async def export_current_user_transactions(
+    format: Literal["csv", "columnar"] = "csv",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """流式導出當前用戶的交易 (CSV 或列式二進制)，可按創建時間 [start, end) 篩選"""
+    def fetch(before, limit):
+        return get_user_transactions(current_user.user_id, before=before, limit=limit)
 
-    return user_transactions
+    return export_response(fetch, format, start, end, "statement")
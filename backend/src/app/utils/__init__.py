@@ -1,11 +1,31 @@
 from app.utils.auth import (
     verify_password, get_password_hash,
+    verify_password_async, get_password_hash_async, password_pool_stats,
     create_access_token, decode_access_token,
-    get_current_user
+    get_current_user, get_current_admin, auth_cache_stats
 )
+from app.utils.cache import TTLCache
+from app.utils.serialization import encode_transaction, transaction_response, transactions_response
+from app.utils.idempotency import idempotency_key, replay_response, remember_response
+from app.utils.pagination import encode_cursor, decode_cursor, list_user_transactions
+from app.utils.expiry import ExpirySweeper, expiry_sweeper
+from app.utils.events import EventHub, event_hub, sse_response
+from app.utils.export import export_response, read_columnar
+from app.utils.etag import entity_tag, transaction_etag, not_modified, set_etag
+from app.utils.probes import known_transaction
+from app.utils.durability import DurableCommitMiddleware
 
 __all__ = [
     "verify_password", "get_password_hash",
+    "verify_password_async", "get_password_hash_async", "password_pool_stats",
     "create_access_token", "decode_access_token",
-    "get_current_user"
+    "get_current_user", "get_current_admin", "auth_cache_stats", "TTLCache",
+    "encode_transaction", "transaction_response", "transactions_response",
+    "idempotency_key", "replay_response", "remember_response",
+    "encode_cursor", "decode_cursor", "list_user_transactions",
+    "ExpirySweeper", "expiry_sweeper",
+    "EventHub", "event_hub", "sse_response",
+    "export_response", "read_columnar",
+    "entity_tag", "transaction_etag", "not_modified", "set_etag",
+    "known_transaction", "DurableCommitMiddleware"
 ]
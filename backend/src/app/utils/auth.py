@@ -1,30 +1,109 @@
+import os
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 
-from app.database.db import get_db, users_db
+from app.database import db
+from app.database.db import get_db, get_user, add_user_listener, call_storage
 from app.models.user import User, TokenData
+from app.utils.cache import TTLCache
+from app.utils.metrics import registry
+from app.utils.serialization import user_to_model
+
+logger = logging.getLogger(__name__)
 
 # 認證配置
 SECRET_KEY = "your-secret-key-for-jwt-please-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24小時
+# 管理員email (逗號分隔) - 可導出所有用戶的交易
+ADMIN_EMAILS = frozenset(email.strip() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip())
 
 # 密碼處理
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt 計算在線程池中執行 (bcrypt 會釋放GIL)，避免阻塞事件循環
+# PASSWORD_HASH_WORKERS 為並發上限，設為0時在事件循環中直接計算
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+_password_executor = (
+    ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+    if PASSWORD_HASH_WORKERS > 0 else None
+)
+# 任務計數由事件循環與線程池線程同時修改，讀寫都在鎖內進行
+_password_jobs = {"queued": 0, "running": 0, "completed": 0}
+_password_jobs_lock = threading.Lock()
 # 使用 login 端點進行 Swagger UI 認證
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# 已驗證令牌的緩存 - key為令牌的SHA-256摘要，條目在令牌的exp時間過期
+token_cache = TTLCache(maxsize=10000)
+# 已解析用戶的緩存 - 餘額等數據變更時失效
+user_cache = TTLCache(maxsize=10000, ttl=300)
+add_user_listener(user_cache.pop)
+
+# 認證指標
+password_hash_duration = registry.histogram(
+    "password_hash_duration_seconds", "bcrypt hash/verify time (excluding pool queueing)", ("operation",)
+)
+jwt_decode_duration = registry.histogram(
+    "jwt_decode_duration_seconds", "JWT signature verification and decode time (token cache misses only)",
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01),
+)
+
 def verify_password(plain_password, hashed_password):
     """驗證密碼"""
-    return pwd_context.verify(plain_password, hashed_password)
+    started = time.perf_counter()
+    try:
+        return pwd_context.verify(plain_password, hashed_password)
+    finally:
+        password_hash_duration.observe(time.perf_counter() - started, labels=("verify",))
 
 def get_password_hash(password):
     """生成密碼哈希"""
-    return pwd_context.hash(password)
+    started = time.perf_counter()
+    try:
+        return pwd_context.hash(password)
+    finally:
+        password_hash_duration.observe(time.perf_counter() - started, labels=("hash",))
+
+def _count_password_jobs(**deltas):
+    with _password_jobs_lock:
+        for state, delta in deltas.items():
+            _password_jobs[state] += delta
+
+def _run_password_job(func, *args):
+    _count_password_jobs(queued=-1, running=1)
+    try:
+        return func(*args)
+    finally:
+        _count_password_jobs(running=-1, completed=1)
+
+async def _offload_password_job(func, *args):
+    if _password_executor is None:
+        return func(*args)
+    _count_password_jobs(queued=1)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, _run_password_job, func, *args)
+
+async def verify_password_async(plain_password, hashed_password):
+    """在bcrypt線程池中驗證密碼"""
+    return await _offload_password_job(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    """在bcrypt線程池中生成密碼哈希"""
+    return await _offload_password_job(get_password_hash, password)
+
+def password_pool_stats():
+    """bcrypt線程池狀態 - queued為等待中的任務數(隊列深度)"""
+    with _password_jobs_lock:
+        return {"workers": PASSWORD_HASH_WORKERS, **_password_jobs}
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """創建JWT訪問令牌"""
@@ -36,57 +115,117 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
     to_encode.update({"exp": expire})
+    # python-jose 導入時會載入 cryptography 後端，延遲到首次使用以縮短啟動時間
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
     return encoded_jwt
 
+def _token_key(token: str):
+    return hashlib.sha256(token.encode()).digest()
+
 def decode_access_token(token: str):
     """解碼JWT訪問令牌"""
+    from jose import JWTError, jwt
     try:
-        print(f"解析令牌: {token[:10]}...（已截断）")
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        logger.debug("解析令牌")
+        started = time.perf_counter()
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        finally:
+            jwt_decode_duration.observe(time.perf_counter() - started)
 
         # 從JWT中獲取用戶標識和數據
         user_id: str = payload.get("sub")
         user_email: str = payload.get("email")  # 添加獲取email
 
-        print(f"解析到用戶ID: {user_id}, Email: {user_email}")
+        logger.debug("解析到用戶ID: %s, Email: %s", user_id, user_email)
 
         if user_id is None or user_email is None:
-            print("缺少用戶ID或Email")
+            logger.debug("缺少用戶ID或Email")
             return None, None, None
 
         # 檢查是否有用戶數據
         user_data = payload.get("user")
         if user_data:
-            print(f"從令牌中找到用戶數據")
+            logger.debug("從令牌中找到用戶數據")
             return TokenData(user_id=user_id), user_email, user_data
 
         return TokenData(user_id=user_id), user_email, None
     except JWTError as e:
-        print(f"JWT解析錯誤: {str(e)}")
+        logger.info("JWT解析錯誤: %s", e)
         return None, None, None
 
+def token_email(token: str) -> Optional[str]:
+    """返回有效令牌所屬用戶的email，令牌無效時返回None
+
+    先查令牌緩存，命中時跳過簽名驗證與JSON解碼
+    """
+    token_key = _token_key(token)
+    user_email = token_cache.get(token_key)
+    if user_email is None:
+        token_data, user_email, _ = decode_access_token(token)
+        if token_data is None or user_email is None:
+            return None
+        token_cache.set(token_key, user_email, expires_at=_token_expiry(token))
+    return user_email
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     """獲取當前已認證用戶"""
-    print(f"嘗試獲取當前用戶，令牌長度: {len(token) if token else 0}")
+    logger.debug("嘗試獲取當前用戶")
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="認證失敗",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    token_data, user_email, user_data = decode_access_token(token)
-    if token_data is None or user_email is None:
-        print("令牌解析失敗，認證失敗")
+    user_email = token_email(token)
+    if user_email is None:
+        logger.info("令牌解析失敗，認證失敗")
         raise credentials_exception
 
+    # 內存存儲下用戶數據只會在本進程內變更，可以安全緩存
+    if db.repository.process_local:
+        cached_user = user_cache.get(user_email)
+        if cached_user is not None:
+            return cached_user
+
     # 從數據庫中獲取用戶數據
-    user = users_db.get(user_email)
-    print(f"通過Email查找用戶: {user_email}, 結果: {'找到' if user else '未找到'}")
+    user = await call_storage(get_user, user_email)
+    logger.debug("通過Email查找用戶: %s, 結果: %s", user_email, "找到" if user else "未找到")
     if user is None:
-        print("未找到用戶，認證失敗")
+        logger.info("未找到用戶，認證失敗", extra={"email": user_email})
         raise credentials_exception
 
-    print(f"獲取到最新的用戶餘額: {user.get('balance', 0)}")
-    return User(**user)
+    logger.debug("獲取到最新的用戶餘額: %s", user.get("balance", 0))
+    current_user = user_to_model(user)
+    if db.repository.process_local:
+        user_cache.set(user_email, current_user)
+    return current_user
+
+async def get_current_admin(current_user: User = Depends(get_current_user)):
+    """要求當前用戶為管理員"""
+    if current_user.email not in ADMIN_EMAILS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="需要管理員權限"
+        )
+    return current_user
+
+def _token_expiry(token: str):
+    """讀取已驗證令牌的過期時間"""
+    from jose import jwt
+    return jwt.get_unverified_claims(token).get("exp")
+
+def auth_cache_stats():
+    """令牌與用戶緩存的命中率統計"""
+    return {"token": token_cache.stats(), "user": user_cache.stats()}
+
+registry.gauge(
+    "auth_cache_hit_ratio", "Token/user cache hit ratio", ("cache",),
+    function=lambda: {(name,): stats["hit_rate"] for name, stats in auth_cache_stats().items()},
+)
+registry.gauge(
+    "password_pool_jobs", "bcrypt pool jobs by state (queued = queue depth)", ("state",),
+    function=lambda: {(state,): count for state, count in password_pool_stats().items() if state in ("queued", "running")},
+)
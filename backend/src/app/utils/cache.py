@@ -0,0 +1,76 @@
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """有容量上限的LRU緩存，每個條目可帶過期時間 (epoch秒)
+
+    maxsize 限制條目數；另指定 maxbytes 時按 sizeof(value) 累計條目大小，
+    超出任一上限時淘汰最久未使用的條目。
+    """
+
+    def __init__(self, maxsize=10000, ttl=None, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        # key → (value, expires_at, 大小)
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+        return entry
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at, _ = entry
+        if expires_at is not None and expires_at <= time.time():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, expires_at=None):
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.time() + self.ttl
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        self._remove(key)
+        self._data[key] = (value, expires_at, size)
+        self.bytes += size
+        while len(self._data) > self.maxsize or (self.maxbytes is not None and self.bytes > self.maxbytes):
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
+
+    def pop(self, key):
+        entry = self._remove(key)
+        return entry[0] if entry else None
+
+    def clear(self):
+        self._data.clear()
+        self.bytes = 0
+
+    def stats(self):
+        """命中率統計"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,24 @@
+from app.database.journal import durable_commits
+
+class DurableCommitMiddleware:
+    """響應在請求內的修改操作fsync之後才發出 (純ASGI中間件，journal 後端時安裝)
+
+    請求處理期間修改操作只登記所屬的組提交批次，不阻塞事件循環；
+    發出響應頭之前等待這些批次並執行登記的回調 (見 after_commits)，客戶端收到成功響應時操作已寫入磁盤。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async with durable_commits() as commits:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start" and commits:
+                    await commits.wait()
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
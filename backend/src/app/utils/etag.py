@@ -0,0 +1,41 @@
+from typing import Optional
+from fastapi import Response, status
+
+# 條件請求 - ETag 由記錄鍵與版本號組成 (每次修改版本號加1)，
+# 比較 If-None-Match 時無需構建模型或序列化響應
+# 數據屬於當前用戶: 只允許瀏覽器私有緩存，且每次使用前都要重新驗證
+CACHE_CONTROL = "private, no-cache"
+
+def entity_tag(key: str, version: int) -> str:
+    """返回強ETag"""
+    return f'"{key}.{version}"'
+
+def transaction_etag(transaction) -> str:
+    return entity_tag(transaction["transaction_id"], transaction["version"])
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        # If-None-Match 使用弱比較: 忽略 W/ 前綴
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+def not_modified(if_none_match: Optional[str], etag: str) -> Optional[Response]:
+    """客戶端緩存的版本仍是最新時返回 304 響應，否則返回None"""
+    if _matches(if_none_match, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL}
+        )
+    return None
+
+def set_etag(response: Response, etag: str) -> Response:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return response
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import logging
+import threading
+from contextlib import asynccontextmanager
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.database.db import add_transaction_listener, add_user_listener, get_user, call_storage
+from app.database.journal import deferred_commits, wait_commits
+from app.models.money import from_minor
+from app.utils.serialization import encode_transaction
+from app.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# SSE配置
+EVENT_QUEUE_SIZE = 100
+KEEPALIVE_SECONDS = 15
+FINAL_STATUSES = {"completed", "cancelled"}
+
+def transaction_topic(transaction_id):
+    return f"transaction:{transaction_id}"
+
+def user_topic(email):
+    return f"user:{email}"
+
+class EventHub:
+    """進程內發布/訂閱中心
+
+    每個訂閱者持有一個有界隊列，隊列滿時丟棄最舊的消息，慢客戶端不會拖累發布方。
+    多個worker時調用 share() 經分片轉發: 訂閱的主題登記到分片，變更發布到分片，
+    每個分片一個中繼線程長輪詢事件，推送給本進程的訂閱者。
+    """
+
+    def __init__(self, queue_size=EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        # 等待fsync後推送的任務 (持有引用，避免被回收)
+        self._durable_publishes = set()
+        # 多個worker共享事件時的分片存儲
+        self.shared = None
+        self._stopped = threading.Event()
+
+    def share(self, repository):
+        """經分片存儲與其他worker共享事件，啟動各分片的中繼線程"""
+        self.shared = repository
+        for shard in range(repository.count):
+            threading.Thread(target=self._relay, args=(shard,), name=f"event-relay-{shard}", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _relay(self, shard):
+        after = None
+        while not self._stopped.is_set():
+            try:
+                after, events = self.shared.events_since(shard, after)
+            except Exception:
+                if self._stopped.is_set():
+                    return
+                logger.exception("讀取分片事件失敗", extra={"shard": shard})
+                self._stopped.wait(1)
+                continue
+            for topic, event, payload in events:
+                if topic in self._subscribers:
+                    self._deliver(topic, event, _shared_event_data(event, payload), None)
+
+    def has_subscribers(self, topic):
+        return topic in self._subscribers
+
+    def subscriber_count(self):
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    @asynccontextmanager
+    async def subscribe(self, *topics):
+        """訂閱一個或多個主題，返回接收 (event, data) 的隊列"""
+        loop = asyncio.get_running_loop()
+        subscriber = (loop, asyncio.Queue(maxsize=self.queue_size))
+        for topic in topics:
+            self._subscribers.setdefault(topic, set()).add(subscriber)
+        try:
+            # 共享時每個訂閱在分片上計數一次，登記完成之後的變更都會轉發過來
+            if self.shared is not None:
+                for topic in topics:
+                    await run_in_threadpool(self.shared.watch, topic)
+            yield subscriber[1]
+        finally:
+            for topic in topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._subscribers[topic]
+            # 連接斷開時所在的任務已被取消，不等待注銷完成
+            if self.shared is not None:
+                for topic in topics:
+                    loop.run_in_executor(None, self.shared.unwatch, topic)
+
+    def publish(self, topic, event, data):
+        """發布消息，沒有訂閱者時直接返回"""
+        if not self._subscribers.get(topic):
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        # journal 後端的請求內: 等修改操作所屬的批次fsync之後再推送，訂閱者不會先於磁盤看到結果
+        commits = deferred_commits.get()
+        if commits and running_loop is not None:
+            task = running_loop.create_task(self._publish_durable(list(commits), topic, event, data, running_loop))
+            self._durable_publishes.add(task)
+            task.add_done_callback(self._durable_publishes.discard)
+            return
+        self._deliver(topic, event, data, running_loop)
+
+    async def _publish_durable(self, commits, topic, event, data, running_loop):
+        try:
+            await wait_commits(commits)
+        except OSError:
+            # 寫入失敗，操作未確認，不推送
+            return
+        self._deliver(topic, event, data, running_loop)
+
+    def _deliver(self, topic, event, data, running_loop):
+        for loop, queue in list(self._subscribers.get(topic, ())):
+            if loop is running_loop:
+                self._put(queue, (event, data))
+            else:
+                # 從其他線程發布時交給訂閱者所在的事件循環處理
+                loop.call_soon_threadsafe(self._put, queue, (event, data))
+
+    @staticmethod
+    def _put(queue, message):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+# 應用全局的事件中心
+event_hub = EventHub()
+
+registry.gauge("sse_subscribers", "Open server-sent event subscriptions", function=event_hub.subscriber_count)
+
+def serialize_transaction(transaction):
+    return encode_transaction(transaction)
+
+def serialize_balance(user):
+    return json.dumps({"balance": from_minor(user["balance"])})
+
+def _shared_event_data(event, payload):
+    """分片轉發的事件內容 (交易dict或 {"balance": 最小單位}) 序列化為推送的數據"""
+    return serialize_transaction(payload) if event == "transaction" else serialize_balance(payload)
+
+def _publish_transaction(transaction):
+    topic = transaction_topic(transaction["transaction_id"])
+    if event_hub.shared is not None:
+        # 訂閱者可能在其他worker上: 交給交易所在的分片，分片只記錄有訂閱的主題
+        event_hub.shared.publish(topic, "transaction", transaction["transaction_id"])
+    elif event_hub.has_subscribers(topic):
+        event_hub.publish(topic, "transaction", serialize_transaction(transaction))
+
+def _publish_balance(email):
+    topic = user_topic(email)
+    if event_hub.shared is not None:
+        event_hub.shared.publish(topic, "balance", email)
+    elif event_hub.has_subscribers(topic):
+        user = get_user(email)
+        if user is not None:
+            event_hub.publish(topic, "balance", serialize_balance(user))
+
+# 交易結算(確認、取消、過期)與餘額變更時推送給訂閱者
+add_transaction_listener(_publish_transaction)
+add_user_listener(_publish_balance)
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {data}\n\n"
+
+async def _event_stream(topic, snapshot, is_final):
+    async with event_hub.subscribe(topic) as queue:
+        # 先訂閱再讀取快照，保證兩者之間的變更不會丟失
+        initial = await call_storage(snapshot)
+        if initial is None:
+            return
+        event, data = initial
+        yield format_sse(event, data)
+        if is_final(event, data):
+            return
+        while True:
+            try:
+                event, data = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse(event, data)
+            if is_final(event, data):
+                return
+
+def sse_response(topic, snapshot, is_final=lambda event, data: False):
+    """構建SSE響應: 先發送 snapshot() 返回的當前狀態，之後推送主題上的更新"""
+    return StreamingResponse(
+        _event_stream(topic, snapshot, is_final),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # 關閉nginx代理緩衝
+        },
+    )
+
+def is_final_transaction_event(event, data):
+    return event == "transaction" and json.loads(data)["status"] in FINAL_STATUSES
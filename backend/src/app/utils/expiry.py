@@ -0,0 +1,98 @@
+import asyncio
+import heapq
+from datetime import datetime
+
+from starlette.concurrency import run_in_threadpool
+
+from app.database.db import close_transfer, get_transactions_by_status
+from app.utils.metrics import registry
+
+# 每批最多處理的過期交易數，批次之間讓出事件循環
+EXPIRY_BATCH_SIZE = 500
+
+class ExpirySweeper:
+    """後台過期交易清理
+
+    以 expires_at 為鍵維護最小堆，只在最近的截止時間醒來，
+    批量取消過期交易並退還發送方餘額。每筆交易的入堆/出堆成本為 O(log n)。
+    """
+
+    def __init__(self, batch_size=EXPIRY_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._heap = []
+        self._wakeup = asyncio.Event()
+        self.expired_count = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, transaction):
+        """登記待處理交易的過期時間"""
+        expires_at = transaction.get("expires_at")
+        if expires_at is None:
+            return
+        entry = (expires_at, transaction["transaction_id"], transaction["sender_email"])
+        heapq.heappush(self._heap, entry)
+        # 新截止時間比原來最早的更早時，喚醒循環重新計算等待時間
+        if self._heap[0] is entry:
+            self._wakeup.set()
+
+    def load_pending(self):
+        """啟動時從存儲中載入所有待處理交易"""
+        for transaction in get_transactions_by_status("pending"):
+            self.schedule(transaction)
+
+    def _pop_due(self, now):
+        """從堆中取出一批已到期的交易 (只在事件循環線程中操作堆)"""
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            _, transaction_id, sender_email = heapq.heappop(self._heap)
+            due.append((transaction_id, sender_email))
+        return due
+
+    def _cancel(self, due, now):
+        """取消並退款，返回實際取消的筆數"""
+        expired = 0
+        for transaction_id, sender_email in due:
+            # 狀態CAS: 已被確認或取消的交易直接跳過
+            if close_transfer(transaction_id, "cancelled", sender_email, completed_at=now) is not None:
+                expired += 1
+        return expired
+
+    def expire_due(self, now=None):
+        """取消一批已過期的交易，返回本批處理數量"""
+        now = now or datetime.now()
+        due = self._pop_due(now)
+        self.expired_count += self._cancel(due, now)
+        return len(due)
+
+    def _seconds_until_next(self):
+        if not self._heap:
+            return None
+        return max((self._heap[0][0] - datetime.now()).total_seconds(), 0)
+
+    async def run(self):
+        """後台循環，在 lifespan 中啟動"""
+        while True:
+            self._wakeup.clear()
+            delay = self._seconds_until_next()
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            # 存儲的取消與退款 (sqlite、分片IPC、日誌fsync) 在線程池中執行，不阻塞事件循環
+            now = datetime.now()
+            due = self._pop_due(now)
+            self.expired_count += await run_in_threadpool(self._cancel, due, now)
+            await asyncio.sleep(0)
+
+# 應用全局的清理器實例
+expiry_sweeper = ExpirySweeper()
+
+registry.counter(
+    "points_transactions_expired_total", "Pending transactions cancelled by the expiry sweeper",
+    function=lambda: expiry_sweeper.expired_count,
+)
+registry.gauge("points_expiry_scheduled", "Deadlines waiting in the expiry heap", function=lambda: len(expiry_sweeper))
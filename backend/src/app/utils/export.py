@@ -0,0 +1,205 @@
+import csv
+import io
+import struct
+import sys
+from array import array
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+
+from app.database.db import transaction_sort_key
+from app.database.records import TRANSACTION_FIELDS, TransactionRecord, encode_time, decode_time
+from app.models.money import format_minor
+from app.utils.metrics import registry
+from app.utils.serialization import TRANSACTION_FIELDS as API_FIELDS
+
+# 導出配置 - 每批從存儲讀取的交易數，內存佔用只與批大小有關
+EXPORT_BATCH_SIZE = 1000
+CSV_MEDIA_TYPE = "text/csv"
+COLUMNAR_MEDIA_TYPE = "application/vnd.points.columnar"
+
+# 列名與API輸出一致 (camelCase)，順序與存儲欄位一致
+_ALIASES = dict(API_FIELDS)
+EXPORT_COLUMNS = tuple(_ALIASES[field] for field in TRANSACTION_FIELDS)
+_TIME_FIELDS = frozenset(field for field in TRANSACTION_FIELDS if field.endswith("_at"))
+_INTEGER_FIELDS = frozenset(("amount", "version"))
+# 用戶可自由輸入的欄位 - 以 = + - @ 開頭時加前綴，避免在表格軟件中被當作公式執行
+_FREE_TEXT_FIELDS = frozenset(("note", "sender_name", "receiver_name"))
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+export_rows = registry.counter("points_export_rows_total", "Transactions written by statement exports", ("format",))
+
+# ---------- 列式格式 ----------
+#
+# 文件: MAGIC + 若干行組 + 行數為0的行組頭 (結束標記)，所有數值為小端序
+# 行組: <I 行數 n，之後按 EXPORT_COLUMNS 順序寫出每一列
+#   字符串列: <II 字典條目數 k 與字典字節數，k+1 個 int32 偏移，UTF-8 數據，n 個 int32 索引 (-1 為null)
+#   amount: n 個 int64 最小單位 (與存儲一致，1點 = 100)；version: n 個 int64
+#   時間列: n 個 int64 距紀元微秒 (INT64_MIN 為null)
+COLUMNAR_MAGIC = b"PTXCOL3\n"
+_ROWS = struct.Struct("<I")
+_DICTIONARY = struct.Struct("<II")
+_NULL_TIME = -(2 ** 63)
+_SWAP = sys.byteorder != "little"
+
+def _pack(typecode, values):
+    packed = array(typecode, values)
+    if _SWAP:
+        packed.byteswap()
+    return packed.tobytes()
+
+def _unpack(typecode, data, offset, count):
+    values = array(typecode)
+    end = offset + count * values.itemsize
+    values.frombytes(data[offset:end])
+    if _SWAP:
+        values.byteswap()
+    return values, end
+
+def _columns(transactions):
+    """轉為按 TRANSACTION_FIELDS 排列的列，時間為整數微秒"""
+    rows = []
+    for transaction in transactions:
+        if isinstance(transaction, TransactionRecord):
+            rows.append(transaction.to_tuple())
+        else:
+            rows.append(tuple(
+                encode_time(transaction.get(field)) if field in _TIME_FIELDS else transaction.get(field)
+                for field in TRANSACTION_FIELDS
+            ))
+    return list(zip(*rows))
+
+def encode_row_group(transactions) -> bytes:
+    """將一批交易編碼為一個列式行組"""
+    parts = [_ROWS.pack(len(transactions))]
+    for field, values in zip(TRANSACTION_FIELDS, _columns(transactions)):
+        if field in _INTEGER_FIELDS:
+            parts.append(_pack("q", values))
+        elif field in _TIME_FIELDS:
+            parts.append(_pack("q", [_NULL_TIME if value is None else value for value in values]))
+        else:
+            # 字典編碼: 同一用戶的email、名稱等在一個行組中只存一次
+            dictionary = {}
+            indexes = [-1 if value is None else dictionary.setdefault(value, len(dictionary)) for value in values]
+            encoded = [value.encode() for value in dictionary]
+            offsets = [0]
+            for item in encoded:
+                offsets.append(offsets[-1] + len(item))
+            data = b"".join(encoded)
+            parts += [_DICTIONARY.pack(len(encoded), len(data)), _pack("i", offsets), data, _pack("i", indexes)]
+    return b"".join(parts)
+
+def read_columnar(data: bytes):
+    """解碼列式導出文件，逐行返回與存儲相同欄位的dict"""
+    if not data.startswith(COLUMNAR_MAGIC):
+        raise ValueError("不是列式導出文件")
+    offset = len(COLUMNAR_MAGIC)
+    while True:
+        (count,), offset = _ROWS.unpack_from(data, offset), offset + _ROWS.size
+        if count == 0:
+            return
+        columns = []
+        for field in TRANSACTION_FIELDS:
+            if field in _INTEGER_FIELDS:
+                values, offset = _unpack("q", data, offset, count)
+            elif field in _TIME_FIELDS:
+                raw, offset = _unpack("q", data, offset, count)
+                values = [None if value == _NULL_TIME else decode_time(value) for value in raw]
+            else:
+                (size, length), offset = _DICTIONARY.unpack_from(data, offset), offset + _DICTIONARY.size
+                offsets, offset = _unpack("i", data, offset, size + 1)
+                text = data[offset:offset + length]
+                offset += length
+                dictionary = [text[offsets[i]:offsets[i + 1]].decode() for i in range(size)]
+                indexes, offset = _unpack("i", data, offset, count)
+                values = [None if index < 0 else dictionary[index] for index in indexes]
+            columns.append(values)
+        for row in zip(*columns):
+            yield dict(zip(TRANSACTION_FIELDS, row))
+
+# ---------- CSV ----------
+
+_TIME_POSITIONS = tuple(i for i, field in enumerate(TRANSACTION_FIELDS) if field in _TIME_FIELDS)
+_FREE_TEXT_POSITIONS = tuple(i for i, field in enumerate(TRANSACTION_FIELDS) if field in _FREE_TEXT_FIELDS)
+_AMOUNT_POSITION = TRANSACTION_FIELDS.index("amount")
+
+def encode_csv_rows(transactions) -> str:
+    buffer = io.StringIO()
+    rows = []
+    for transaction in transactions:
+        if isinstance(transaction, TransactionRecord):
+            transaction = transaction.to_dict()
+        row = [transaction.get(field) for field in TRANSACTION_FIELDS]
+        row[_AMOUNT_POSITION] = format_minor(row[_AMOUNT_POSITION])
+        for position in _TIME_POSITIONS:
+            if row[position] is not None:
+                row[position] = row[position].isoformat()
+        for position in _FREE_TEXT_POSITIONS:
+            value = row[position]
+            if value and value.startswith(_FORMULA_PREFIXES):
+                row[position] = "'" + value
+        rows.append(row)
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue()
+
+def csv_header() -> str:
+    return ",".join(EXPORT_COLUMNS) + "\n"
+
+# ---------- 分批讀取與響應 ----------
+
+def local_naive(value: Optional[datetime]):
+    """存儲中的時間為本地時間 (無時區)，帶時區的查詢參數先轉換"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+def iter_export_batches(fetch, start=None, end=None, batch_size=EXPORT_BATCH_SIZE):
+    """按時間倒序分批讀取 [start, end) 範圍內的交易
+
+    fetch(before, limit) 返回排序鍵小於 before 的前 limit 筆交易 (倒序)
+    """
+    before = None if end is None else (end, "")
+    while True:
+        batch = fetch(before, batch_size)
+        if start is not None and batch and batch[-1]["created_at"] < start:
+            batch = [transaction for transaction in batch if transaction["created_at"] >= start]
+            if batch:
+                yield batch
+            return
+        if batch:
+            yield batch
+        if len(batch) < batch_size:
+            return
+        before = transaction_sort_key(batch[-1])
+
+async def _chunks(batches, export_format):
+    # 每批在線程池中讀取 (sqlite 查詢、分片IPC)，大範圍導出不阻塞事件循環上的其他請求
+    batches = iterate_in_threadpool(batches)
+    if export_format == "csv":
+        yield csv_header()
+        async for batch in batches:
+            yield encode_csv_rows(batch)
+            export_rows.inc(len(batch), labels=("csv",))
+    else:
+        yield COLUMNAR_MAGIC
+        async for batch in batches:
+            yield encode_row_group(batch)
+            export_rows.inc(len(batch), labels=("columnar",))
+        yield _ROWS.pack(0)
+
+def export_response(fetch, export_format: str, start: Optional[datetime], end: Optional[datetime], name: str):
+    """流式導出交易 (CSV 或列式二進制)，逐批讀取並編碼"""
+    start, end = local_naive(start), local_naive(end)
+    if start is not None and end is not None and start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="開始時間必須早於結束時間"
+        )
+    extension = "csv" if export_format == "csv" else "ptxc"
+    return StreamingResponse(
+        _chunks(iter_export_batches(fetch, start, end), export_format),
+        media_type=CSV_MEDIA_TYPE if export_format == "csv" else COLUMNAR_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'},
+    )
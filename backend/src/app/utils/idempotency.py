@@ -0,0 +1,182 @@
+import os
+import threading
+from contextvars import ContextVar
+from typing import Optional
+from fastapi import Header, HTTPException, Response, status
+from starlette.concurrency import run_in_threadpool
+
+from app.database.journal import after_commits
+from app.utils.cache import TTLCache
+
+# 冪等鍵配置 - 條目數上限、響應體總字節數上限與保留時間
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_CACHE_BYTES = int(os.getenv("IDEMPOTENCY_CACHE_BYTES", str(64 * 1024 * 1024)))
+# 單個響應體超過此大小時不保存響應體，只記錄請求已完成 (重試時返回409，不會再次執行)
+IDEMPOTENCY_MAX_BODY_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", str(1024 * 1024)))
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 60 * 60)))
+REPLAYED_HEADER = "Idempotent-Replayed"
+# 每個條目除響應體外的估計佔用 (key元組、指紋等)
+_ENTRY_OVERHEAD = 512
+
+def _entry_size(entry):
+    fingerprint, _, body, _ = entry
+    return _ENTRY_OVERHEAD + len(fingerprint) + (len(body) if body is not None else 0)
+
+def _new_cache():
+    # key為 (操作, 調用方, 冪等鍵)，value為 (請求指紋, 狀態碼, 響應體, 媒體類型)
+    # 響應體過大時為None，處理中 (含修改操作寫入磁盤之前) 狀態碼為None；按條目數與總字節數雙重限制，內存佔用有上界
+    return TTLCache(
+        maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL_SECONDS,
+        maxbytes=IDEMPOTENCY_CACHE_BYTES, sizeof=_entry_size,
+    )
+
+class IdempotencyEntries:
+    """冪等響應表 (線程安全) - 進程內存儲與分片進程 (多個worker共享時) 使用同一實現"""
+
+    def __init__(self, cache=None):
+        self.cache = cache if cache is not None else _new_cache()
+        self._lock = threading.Lock()
+
+    def claim(self, key, marker):
+        """key沒有記錄時寫入處理中標記並返回None，否則返回已有的條目"""
+        with self._lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                self.cache.set(key, marker)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self.cache.set(key, entry)
+
+    def release(self, key, marker):
+        """key仍為指定的處理中標記時刪除，請求失敗後可以用同一個鍵重試"""
+        with self._lock:
+            if self.cache.get(key) == marker:
+                self.cache.pop(key)
+
+class IdempotencyStore:
+    """冪等響應存儲接口 - 多個worker共享時替換為共享存儲實現"""
+
+    async def claim(self, key, marker):
+        raise NotImplementedError
+
+    async def put(self, key, entry):
+        raise NotImplementedError
+
+    async def release(self, key, marker):
+        raise NotImplementedError
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """進程內冪等響應表"""
+
+    def __init__(self, cache=None):
+        self.entries = IdempotencyEntries(cache)
+
+    async def claim(self, key, marker):
+        return self.entries.claim(key, marker)
+
+    async def put(self, key, entry):
+        self.entries.put(key, entry)
+
+    async def release(self, key, marker):
+        self.entries.release(key, marker)
+
+class SharedIdempotencyStore(IdempotencyStore):
+    """多個worker共享的冪等響應表 - 保存在分片進程中 (按冪等鍵選擇分片)，佔用在分片內原子完成"""
+
+    def __init__(self, repository):
+        self.repository = repository
+
+    async def _call(self, method, key, *args):
+        return await run_in_threadpool(self.repository.shared, key[-1], method, key, *args)
+
+    async def claim(self, key, marker):
+        return await self._call("claim_idempotency", key, marker)
+
+    async def put(self, key, entry):
+        await self._call("put_idempotency", key, entry)
+
+    async def release(self, key, marker):
+        await self._call("release_idempotency", key, marker)
+
+# 進程內的冪等響應 (單個worker時使用)
+idempotency_cache = _new_cache()
+_store = MemoryIdempotencyStore(idempotency_cache)
+
+def set_idempotency_store(store: IdempotencyStore):
+    """替換冪等響應使用的存儲"""
+    global _store
+    _store = store
+
+# 當前請求佔用的冪等鍵 - (cache key, 處理中標記)，請求結束時仍未完成的佔用被釋放
+_claims: ContextVar[list] = ContextVar("idempotency_claims")
+
+def _marker(fingerprint):
+    return (fingerprint, None, None, None)
+
+async def idempotency_key(key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER, max_length=255)):
+    """讀取可選的 Idempotency-Key 請求頭
+
+    請求結束時 (包括拋出異常) 釋放未記錄響應的佔用，失敗的請求可以用同一個鍵重試。
+    """
+    claims = []
+    _claims.set(claims)
+    try:
+        yield key
+    finally:
+        for cache_key, marker in claims:
+            await _store.release(cache_key, marker)
+
+async def replay_response(scope: tuple, key: Optional[str], fingerprint: str = "") -> Optional[Response]:
+    """返回同一冪等鍵之前成功的響應，沒有記錄時佔用該鍵並返回None
+
+    同一個鍵用於不同內容的請求時返回422，避免客戶端誤用鍵而拿到錯誤的結果。
+    檢查與佔用在存儲內原子完成，處理過程中相同鍵的並發請求 (包括落到其他worker的) 返回409，
+    不會同時執行業務邏輯。
+    """
+    if key is None:
+        return None
+    cache_key = (*scope, key)
+    marker = _marker(fingerprint)
+    entry = await _store.claim(cache_key, marker)
+    if entry is None:
+        _claims.get().append((cache_key, marker))
+        return None
+    stored_fingerprint, status_code, body, media_type = entry
+    if stored_fingerprint != fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="冪等鍵已用於不同的請求"
+        )
+    if status_code is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="相同冪等鍵的請求正在處理，請稍後重試",
+            headers={"Retry-After": "1"},
+        )
+    if body is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="該冪等鍵的請求已成功處理，響應過大未保存，請查詢交易記錄確認結果",
+            headers={REPLAYED_HEADER: "true"},
+        )
+    return Response(body, status_code=status_code, media_type=media_type, headers={REPLAYED_HEADER: "true"})
+
+async def remember_response(scope: tuple, key: Optional[str], response: Response, fingerprint: str = "") -> Response:
+    """記錄成功的響應供重試時直接返回 (失敗的請求重試時重新執行)
+
+    響應在修改操作fsync之後才記錄 (見 after_commits)，在此之前保持 replay_response 寫入的處理中標記，
+    寫入失敗時移除標記，客戶端不會重放一個未寫入磁盤的成功響應。
+    """
+    if key is None or response.status_code >= 300:
+        return response
+    cache_key = (*scope, key)
+    body = response.body if len(response.body) <= IDEMPOTENCY_MAX_BODY_BYTES else None
+    entry = (fingerprint, response.status_code, body, response.media_type)
+    # 佔用交給 after_commits 處理，請求結束時不再釋放
+    claims = _claims.get()
+    claims[:] = [claim for claim in claims if claim[0] != cache_key]
+    await after_commits(lambda: _store.put(cache_key, entry), lambda: _store.release(cache_key, _marker(fingerprint)))
+    return response
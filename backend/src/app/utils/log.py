@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+# 日誌配置 - 各模塊使用 logging.getLogger(__name__)，均位於 app 命名空間下
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOGGER_NAME = "app"
+
+# 需要脫敏的欄位 (小寫比較)
+REDACTED_KEYS = {"password", "hashed_password", "token", "access_token", "authorization", "secret"}
+REDACTED = "***"
+
+# LogRecord 自帶的屬性，其餘通過 extra 傳入的屬性作為結構化欄位輸出
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+def redact(value):
+    """遞歸遮蔽敏感欄位"""
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if str(key).lower() in REDACTED_KEYS else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+class JsonFormatter(logging.Formatter):
+    """輸出單行JSON，extra 傳入的欄位經脫敏後一併輸出"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        fields = {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+        entry.update(redact(fields))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+_listener = None
+
+def setup_logging(level=LOG_LEVEL, stream=None):
+    """配置應用日誌: 調用方只把記錄放入隊列，格式化與輸出在後台線程完成"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+    logger.addHandler(QueueHandler(log_queue))
+    logger.propagate = False
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """停止後台線程並輸出隊列中剩餘的日誌"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
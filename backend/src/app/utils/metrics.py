@@ -0,0 +1,247 @@
+import threading
+import time
+from bisect import bisect_left
+
+from app.database.db import add_transaction_listener, get_transactions_by_status
+from app.models.money import from_minor
+
+# Prometheus 文本格式 (text exposition format 0.0.4)
+CONTENT_TYPE = "text/plain; version=0.0.4"
+# 默認延遲分桶 (秒)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# 未匹配任何路由的請求統一歸為一個標籤，避免404路徑造成標籤爆炸
+UNMATCHED_ROUTE = "unmatched"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """指標基類 - 以標籤值元組為key保存樣本
+
+    指定 function 時不保存樣本，輸出時調用 function() 取值：
+    無標籤時返回數值，有標籤時返回 {標籤值元組: 數值}
+    """
+
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _samples(self):
+        if self.function is None:
+            with self._lock:
+                return list(self._values.items())
+        value = self.function()
+        return list(value.items()) if self.labelnames else [((), value)]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for labels, value in self._samples():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, labels=()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, amount=1, labels=()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, amount=1, labels=()):
+        self.inc(-amount, labels)
+
+    def set(self, value, labels=()):
+        with self._lock:
+            self._values[labels] = value
+
+class Histogram(Metric):
+    """延遲直方圖 - 每個標籤組合保存各分桶計數、總和與次數"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        # 分桶內計數不累加，輸出時再轉為累計值
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][position] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        names = self.labelnames + ("le",)
+        for labels, (counts, total, count) in self._samples():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (_format_value(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+    def _samples(self):
+        with self._lock:
+            return [(labels, (list(counts), total, count)) for labels, (counts, total, count) in self._values.items()]
+
+class MetricsRegistry:
+    """指標註冊表 - 各模塊在導入時註冊自己的指標"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"指標已註冊: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=(), function=None):
+        return self.register(Counter(name, documentation, labelnames, function))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# 應用全局的指標註冊表
+registry = MetricsRegistry()
+
+# HTTP請求指標
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by method, route template and status", ("method", "route", "status")
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency until the response body is complete", ("method", "route")
+)
+http_requests_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests currently being processed")
+
+class MetricsMiddleware:
+    """記錄每個路由的請求數、延遲與進行中的請求數 (純ASGI中間件)
+
+    路由標籤使用路由模板 (如 /api/transactions/{transaction_id})，
+    由路由匹配後寫入 scope 的 endpoint 查得。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = {}
+
+    def _route_path(self, scope):
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return UNMATCHED_ROUTE
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            routes = getattr(scope.get("app"), "routes", ())
+            self._route_paths.update({route.endpoint: route.path for route in routes if hasattr(route, "endpoint")})
+            path = self._route_paths.setdefault(endpoint, UNMATCHED_ROUTE)
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            http_requests_in_flight.dec()
+            method, route = scope["method"], self._route_path(scope)
+            http_requests.inc(labels=(method, route, str(status_code)))
+            http_request_duration.observe(duration, labels=(method, route))
+
+# 交易業務指標
+_TRANSACTION_EVENTS = {"pending": "prepared", "completed": "confirmed", "cancelled": "cancelled"}
+
+transaction_events = registry.counter(
+    "points_transactions_total",
+    "Transactions by lifecycle event (prepared, confirmed, cancelled incl. expired)",
+    ("event",),
+)
+
+class PendingLocked:
+    """待接收交易暫扣的點數總額 (最小單位)
+
+    由交易監聽器維護: 創建待接收交易時加上金額，確認、取消或過期時減去
+    (結算以狀態CAS進行，每筆交易只減一次)，抓取指標時不再掃描交易 (分片模式下為跨進程查詢)。
+    啟動時由 load() 按存儲中已有的待接收交易設置初值。
+    """
+
+    def __init__(self):
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        total = sum(transaction["amount"] for transaction in get_transactions_by_status("pending"))
+        with self._lock:
+            self.total = total
+
+    def observe(self, transaction):
+        amount = transaction["amount"]
+        with self._lock:
+            self.total += amount if transaction["status"] == "pending" else -amount
+
+    def points(self):
+        return from_minor(self.total)
+
+pending_locked = PendingLocked()
+
+def _count_transaction(transaction):
+    event = _TRANSACTION_EVENTS.get(transaction["status"])
+    if event is not None:
+        transaction_events.inc(labels=(event,))
+        pending_locked.observe(transaction)
+
+add_transaction_listener(_count_transaction)
+
+registry.gauge(
+    "points_pending_locked", "Points debited from senders and held by pending transactions",
+    function=pending_locked.points,
+)
@@ -0,0 +1,73 @@
+import base64
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+
+from app.database.db import get_user_transactions, transaction_sort_key, call_storage
+from app.utils.serialization import encode_transaction, transactions_response
+
+# 分頁配置
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 1000
+STREAM_BATCH_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(transaction: dict) -> str:
+    """將交易的 (created_at, transaction_id) 編碼為游標"""
+    created_at, transaction_id = transaction_sort_key(transaction)
+    raw = f"{created_at.isoformat()}|{transaction_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    """解碼游標為排序鍵"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, transaction_id = base64.urlsafe_b64decode(padded).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), transaction_id
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="無效的分頁游標"
+        )
+
+async def _ndjson_lines(user_id: str, before):
+    """分批從索引讀取並逐行序列化，內存佔用與歷史長度無關"""
+    while True:
+        batch = await call_storage(get_user_transactions, user_id, before=before, limit=STREAM_BATCH_SIZE)
+        if not batch:
+            return
+        yield "".join(encode_transaction(tx) + "\n" for tx in batch)
+        before = transaction_sort_key(batch[-1])
+
+async def list_user_transactions(
+    user_id: str,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    stream: bool = False
+):
+    """按 (created_at, transaction_id) 游標分頁返回用戶交易歷史
+
+    - 未指定 limit 時返回全部交易 (保持舊接口行為)
+    - 還有更多數據時，下一頁游標放在 X-Next-Cursor 響應頭中
+    - stream=True 時以 NDJSON 流式返回，忽略 limit
+    """
+    before = decode_cursor(cursor) if cursor else None
+
+    if stream:
+        return StreamingResponse(_ndjson_lines(user_id, before), media_type="application/x-ndjson")
+
+    if limit is None:
+        return transactions_response(await call_storage(get_user_transactions, user_id, before=before))
+
+    # 多取一條以判斷是否還有下一頁
+    page = await call_storage(get_user_transactions, user_id, before=before, limit=limit + 1)
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1])
+
+    response = transactions_response(page)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
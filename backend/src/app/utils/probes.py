@@ -0,0 +1,37 @@
+from fastapi import HTTPException, status
+
+from app.database.db import might_contain_transaction, transaction_filter_stats
+from app.utils.metrics import registry
+
+# 無需認證的交易接口常被機器人用隨機UUID探測:
+# 過濾器判定一定不存在的交易ID在限流、並發控制與存儲訪問之前直接返回404
+
+transaction_probe_rejections = registry.counter(
+    "transaction_probe_rejections_total", "Lookups of unknown transaction IDs rejected by the membership filter"
+)
+
+async def known_transaction(transaction_id: str):
+    """路由依賴: 交易ID一定不存在時返回404，響應與路由內查不到交易時相同"""
+    if not might_contain_transaction(transaction_id):
+        transaction_probe_rejections.inc()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="交易不存在"
+        )
+
+def _filter_stat(field):
+    stats = transaction_filter_stats()
+    return stats[field] if stats else 0
+
+registry.gauge(
+    "transaction_filter_bytes", "Memory used by the transaction ID membership filter",
+    function=lambda: _filter_stat("bytes"),
+)
+registry.gauge(
+    "transaction_filter_keys", "Transaction IDs added to the membership filter",
+    function=lambda: _filter_stat("count"),
+)
+registry.gauge(
+    "transaction_filter_false_positive_rate", "Estimated false-positive rate of the membership filter",
+    function=lambda: _filter_stat("false_positive_rate"),
+)
@@ -0,0 +1,230 @@
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from app.utils.auth import ADMIN_EMAILS, token_email
+from app.utils.metrics import registry
+
+# 請求剖析配置 - 默認關閉；PROFILING_ENABLED=true 時 main 才安裝中間件，關閉時請求路徑上沒有任何額外開銷
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+# 隨機剖析的請求比例 (0~1)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# 慢請求閾值 (毫秒)，耗時超過時自動保存該請求的剖析結果，0 為關閉
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "500"))
+# 棧採樣間隔 (毫秒)
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# 棧樣本的保留時長 (秒)，更長的請求只保留最後這段時間的樣本
+PROFILE_RETENTION_SECONDS = float(os.getenv("PROFILE_RETENTION_SECONDS", "30"))
+# 保留的剖析結果數 (環形緩衝區，超出時丟棄最舊的)
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "50"))
+# 管理員帶上此請求頭 (值非空) 時剖析該請求
+PROFILE_HEADER = b"x-profile"
+
+# 最內層幀位於這些模塊或函數時線程處於空閒等待 (事件循環select、線程池與日誌隊列)，不計入樣本
+_IDLE_MODULES = ("selectors.py", "threading.py", "queue.py")
+_IDLE_FUNCTIONS = {("handlers.py", "dequeue"), ("thread.py", "_worker")}
+# SSE 等長連接不按慢請求處理，響應開始後即停止觀察
+_STREAMING_TYPES = (b"text/event-stream",)
+
+profiles_captured = registry.counter("request_profiles_captured_total", "Request profiles captured", ("reason",))
+
+class StackSampler:
+    """後台線程定時採樣各線程的Python調用棧，只在有被觀察的請求進行中時運行
+
+    每次採樣記錄 (時間, 折疊棧元組)，只保留最近 retention 秒；請求結束時按其起止時間取出。
+    asyncio 中並發的請求共用事件循環線程，剖析結果會包含同一時段其他請求的棧。
+    """
+
+    def __init__(self, interval_ms=PROFILE_INTERVAL_MS, retention_seconds=PROFILE_RETENTION_SECONDS):
+        self.interval = interval_ms / 1000
+        self.samples = deque(maxlen=max(1, int(retention_seconds / self.interval)))
+        # 代碼對象 → 棧幀標籤，避免每次採樣重新格式化
+        self._labels = {}
+        self._watching = 0
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._thread = None
+
+    def watch(self):
+        with self._lock:
+            self._watching += 1
+            self._active.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+
+    def unwatch(self):
+        with self._lock:
+            self._watching -= 1
+            if self._watching == 0:
+                self._active.clear()
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            # 保留上一級目錄，區分 fastapi/routing.py 與 starlette/routing.py
+            module = "/".join(code.co_filename.replace(os.sep, "/").rsplit("/", 2)[-2:])
+            label = self._labels[code] = f"{code.co_name} ({module}:{code.co_firstlineno})"
+        return label
+
+    def _fold(self, frame):
+        """調用棧折疊為 根;...;葉 字符串，空閒線程返回None"""
+        code = frame.f_code
+        if code.co_filename.endswith(_IDLE_MODULES) or (os.path.basename(code.co_filename), code.co_name) in _IDLE_FUNCTIONS:
+            return None
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        return ";".join(reversed(labels))
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            self._active.wait()
+            started = time.perf_counter()
+            frames = sys._current_frames()
+            stacks = tuple(filter(None, (self._fold(frame) for ident, frame in frames.items() if ident != own)))
+            del frames
+            if stacks:
+                with self._lock:
+                    self.samples.append((started, stacks))
+            time.sleep(max(0.0, self.interval - (time.perf_counter() - started)))
+
+    def collect(self, started, finished):
+        """返回時間窗口內的折疊棧計數與採樣次數 (樣本按時間遞增，從最新的往回取)"""
+        stacks = Counter()
+        count = 0
+        with self._lock:
+            for at, sample in reversed(self.samples):
+                if at < started:
+                    break
+                if at <= finished:
+                    stacks.update(sample)
+                    count += 1
+        return stacks, count
+
+class ProfileBuffer:
+    """最近的剖析結果 (有上限的環形緩衝區)，每個worker進程各自保存"""
+
+    def __init__(self, maxsize=PROFILE_BUFFER_SIZE):
+        self._profiles = deque(maxlen=maxsize)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        with self._lock:
+            profile["id"] = next(self._ids)
+            self._profiles.append(profile)
+        return profile
+
+    def summaries(self):
+        """不含棧數據的列表，最新的在前"""
+        with self._lock:
+            profiles = list(self._profiles)
+        return [{key: value for key, value in profile.items() if key != "stacks"} for profile in reversed(profiles)]
+
+    def get(self, profile_id):
+        with self._lock:
+            return next((profile for profile in self._profiles if profile["id"] == profile_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+def folded(profile):
+    """折疊棧文本 (每行 "棧 次數")，可直接交給 flamegraph.pl / speedscope 生成火焰圖"""
+    stacks = sorted(profile["stacks"].items(), key=lambda item: item[1], reverse=True)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+def _header(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+def _requested_by_admin(scope):
+    """請求帶有剖析請求頭且令牌屬於管理員"""
+    if not _header(scope, PROFILE_HEADER):
+        return False
+    authorization = (_header(scope, b"authorization") or b"").decode("latin-1")
+    scheme, _, token = authorization.partition(" ")
+    return scheme.lower() == "bearer" and token_email(token) in ADMIN_EMAILS
+
+class ProfilingMiddleware:
+    """按比例、管理員請求頭或慢請求閾值剖析請求 (純ASGI中間件)
+
+    被觀察的請求進行中時採樣線程才運行；請求結束後，按原因 (sampled / header / slow)
+    把其時間窗口內的棧樣本保存到環形緩衝區，由管理員接口下載。
+    """
+
+    def __init__(self, app, sampler=None, buffer=None):
+        self.app = app
+        self.sampler = sampler or stack_sampler
+        self.buffer = buffer or profile_buffer
+
+    def _reason(self, scope):
+        if _requested_by_admin(scope):
+            return "header"
+        if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        reason = self._reason(scope)
+        if reason is None and PROFILE_SLOW_MS <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        watching = True
+
+        async def send_wrapper(message):
+            nonlocal status_code, watching
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if reason is None and (_header(message, b"content-type") or b"").startswith(_STREAMING_TYPES):
+                    watching = False
+                    self.sampler.unwatch()
+            await send(message)
+
+        self.sampler.watch()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finished = time.perf_counter()
+            if watching:
+                self.sampler.unwatch()
+            duration_ms = (finished - started) * 1000
+            if reason is None and watching and duration_ms >= PROFILE_SLOW_MS:
+                reason = "slow"
+            if reason is not None:
+                self._capture(scope, reason, status_code, started, finished, duration_ms)
+
+    def _capture(self, scope, reason, status_code, started, finished, duration_ms):
+        stacks, samples = self.sampler.collect(started, finished)
+        self.buffer.add({
+            "captured_at": datetime.now().isoformat(),
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": status_code,
+            "reason": reason,
+            "duration_ms": round(duration_ms, 2),
+            "samples": samples,
+            "interval_ms": self.sampler.interval * 1000,
+            "stacks": dict(stacks),
+        })
+        profiles_captured.inc(labels=(reason,))
+
+# 應用全局的採樣器與剖析結果緩衝區
+stack_sampler = StackSampler()
+profile_buffer = ProfileBuffer()
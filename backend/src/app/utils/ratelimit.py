@@ -0,0 +1,154 @@
+import math
+import os
+import threading
+import time
+from fastapi import HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.cache import TTLCache
+from app.utils.metrics import registry
+
+# 限流配置 - RATE_LIMIT_ENABLED=false 時關閉 (壓測等場景)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "false"
+# 部署在反向代理之後時，從 X-Real-IP / X-Forwarded-For 讀取客戶端IP
+TRUST_PROXY_HEADERS = os.getenv("TRUST_PROXY_HEADERS", "false").lower() == "true"
+# 每個進程 (或分片) 最多保存的令牌桶數量
+RATE_LIMIT_MAX_KEYS = 100000
+
+rate_limit_rejections = registry.counter(
+    "rate_limit_rejections_total", "Requests rejected by rate limiters and concurrency caps", ("limiter",)
+)
+
+def client_ip(request: Request):
+    """獲取客戶端IP"""
+    if TRUST_PROXY_HEADERS:
+        forwarded = request.headers.get("x-real-ip") or request.headers.get("x-forwarded-for", "").split(",")[0].strip()
+        if forwarded:
+            return forwarded
+    return request.client.host if request.client else "unknown"
+
+class TokenBuckets:
+    """令牌桶集合 (線程安全) - 桶在重新裝滿時過期，數量有上限
+
+    進程內存儲與分片進程 (多個worker共享限流狀態時) 使用同一實現。
+    """
+
+    def __init__(self, maxsize=RATE_LIMIT_MAX_KEYS):
+        self._buckets = TTLCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, burst, cost=1):
+        """嘗試從桶中取出 cost 個令牌，返回 (是否允許, 需等待的秒數)"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._buckets.get(key)
+            tokens, updated = state if state is not None else (burst, now)
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < cost:
+                return False, (cost - tokens) / rate
+            tokens -= cost
+            # 桶重新裝滿後與新桶等價，不再需要保存
+            self._buckets.set(key, (tokens, now), expires_at=time.time() + (burst - tokens) / rate)
+            return True, 0.0
+
+class RateLimitStore:
+    """令牌桶狀態存儲接口 - 多個worker共享限流狀態時替換為共享存儲實現"""
+
+    async def consume(self, key, rate, burst, cost=1):
+        """嘗試從桶中取出 cost 個令牌，返回 (是否允許, 需等待的秒數)"""
+        raise NotImplementedError
+
+class MemoryRateLimitStore(RateLimitStore):
+    """進程內令牌桶"""
+
+    def __init__(self, maxsize=RATE_LIMIT_MAX_KEYS):
+        self.buckets = TokenBuckets(maxsize)
+
+    async def consume(self, key, rate, burst, cost=1):
+        return self.buckets.consume(key, rate, burst, cost)
+
+class SharedRateLimitStore(RateLimitStore):
+    """多個worker共享的令牌桶 - 桶保存在分片進程中 (按key選擇分片)，扣減在分片內原子完成"""
+
+    def __init__(self, repository):
+        self.repository = repository
+
+    async def consume(self, key, rate, burst, cost=1):
+        return await run_in_threadpool(self.repository.shared, key, "consume_tokens", key, rate, burst, cost)
+
+_store = MemoryRateLimitStore()
+
+def set_rate_limit_store(store: RateLimitStore):
+    """替換所有限流器使用的狀態存儲"""
+    global _store
+    _store = store
+
+def _reject(name, status_code, detail, retry_after):
+    rate_limit_rejections.inc(labels=(name,))
+    raise HTTPException(
+        status_code=status_code,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+class RateLimiter:
+    """令牌桶限流器 - rate 為每秒補充的令牌數，burst 為桶容量
+
+    作為依賴使用時按客戶端IP限流；check(key) 可按email、交易ID等任意鍵限流。
+    """
+
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+
+    async def check(self, key):
+        if not RATE_LIMIT_ENABLED:
+            return
+        allowed, retry_after = await _store.consume(f"{self.name}:{key}", self.rate, self.burst)
+        if not allowed:
+            _reject(self.name, status.HTTP_429_TOO_MANY_REQUESTS, "請求過於頻繁，請稍後再試", retry_after)
+
+    async def __call__(self, request: Request):
+        await self.check(client_ip(request))
+
+class ConcurrencyLimiter:
+    """進程內並發上限 - 超出時立即返回503，而不是在隊列中無限等待
+
+    保護的是本進程的資源 (bcrypt線程池、事件循環上的長連接)，多個worker時各自計數。
+    """
+
+    def __init__(self, name, limit, retry_after=1):
+        self.name = name
+        self.limit = limit
+        self.retry_after = retry_after
+        self.in_flight = 0
+
+    async def __call__(self):
+        if RATE_LIMIT_ENABLED and self.in_flight >= self.limit:
+            _reject(self.name, status.HTTP_503_SERVICE_UNAVAILABLE, "服務繁忙，請稍後再試", self.retry_after)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+# 登入與註冊 - bcrypt 計算昂貴，按IP與email限流並限制並發數
+login_ip_limiter = RateLimiter("login_ip", rate=0.5, burst=10)
+login_email_limiter = RateLimiter("login_email", rate=5 / 60, burst=5)
+register_ip_limiter = RateLimiter("register_ip", rate=0.2, burst=5)
+password_admission = ConcurrencyLimiter("password", int(os.getenv("PASSWORD_MAX_CONCURRENCY", "32")))
+
+# 公共交易接口 - 無需認證，按IP、交易ID與接收方email限流
+public_ip_limiter = RateLimiter("public_ip", rate=20, burst=60)
+public_transaction_limiter = RateLimiter("public_transaction", rate=1, burst=10)
+public_email_limiter = RateLimiter("public_email", rate=2, burst=20)
+public_admission = ConcurrencyLimiter("public", int(os.getenv("PUBLIC_MAX_CONCURRENCY", "256")))
+
+# SSE 事件流 - 長連接各佔一個名額，用戶與公共交易事件流共用同一上限
+event_stream_admission = ConcurrencyLimiter("events", int(os.getenv("EVENT_STREAM_MAX_CONCURRENCY", "1024")))
+
+registry.gauge(
+    "admission_in_flight", "Requests holding an admission slot", ("limiter",),
+    function=lambda: {(limiter.name,): limiter.in_flight for limiter in (password_admission, public_admission, event_stream_admission)},
+)
@@ -0,0 +1,49 @@
+import json
+from datetime import datetime
+from fastapi import Response, status
+
+from app.database.records import TransactionRecord
+from app.models.money import from_minor
+from app.models.transaction import Transaction
+from app.models.user import User
+
+# 預先計算 (欄位名, camelCase別名)，順序與 Transaction 模型一致
+TRANSACTION_FIELDS = tuple(
+    (name, field.alias or name) for name, field in Transaction.model_fields.items()
+)
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+# 與 FastAPI JSONResponse 相同的緊湊格式
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_default)
+
+def transaction_to_camel(transaction: dict) -> dict:
+    """將存儲中的交易記錄轉為API輸出的camelCase字典 (跳過pydantic校驗)"""
+    if isinstance(transaction, TransactionRecord):
+        transaction = transaction.to_dict()
+    record = {alias: transaction.get(name) for name, alias in TRANSACTION_FIELDS}
+    record["amount"] = from_minor(record["amount"])
+    return record
+
+def user_to_model(user: dict) -> User:
+    """將存儲中的用戶轉為API模型，餘額由最小單位轉為點數 (數據已經過驗證，跳過pydantic校驗)"""
+    fields = {field: user[field] for field in User.model_fields}
+    fields["balance"] = from_minor(fields["balance"])
+    return User.model_construct(**fields)
+
+def encode_transaction(transaction: dict) -> str:
+    """交易記錄直接編碼為JSON，輸出與 Transaction(**tx).model_dump_json(by_alias=True) 一致"""
+    return _encoder.encode(transaction_to_camel(transaction))
+
+def encode_transactions(transactions) -> str:
+    return _encoder.encode([transaction_to_camel(transaction) for transaction in transactions])
+
+def transaction_response(transaction: dict, status_code: int = status.HTTP_200_OK) -> Response:
+    """直接返回已編碼的響應，FastAPI 不再按 response_model 重複校驗和序列化"""
+    return Response(encode_transaction(transaction), status_code=status_code, media_type="application/json")
+
+def transactions_response(transactions) -> Response:
+    return Response(encode_transactions(transactions), media_type="application/json")
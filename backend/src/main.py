@@ -1,15 +1,61 @@
 import os
-import uvicorn
-from fastapi import FastAPI
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.openapi.docs import get_swagger_ui_html
 from fastapi.openapi.utils import get_openapi
 
-from app.routes import auth, users, transactions
-from app.database.db import init_db
+from app.utils.log import setup_logging
+from app.routes import auth, users, transactions, profiles
+from app.database import db
+from app.database.db import init_db, DB_BACKEND
+from app.utils.expiry import expiry_sweeper
+from app.utils.metrics import MetricsMiddleware, registry, pending_locked, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from app.utils.profiling import ProfilingMiddleware, PROFILING_ENABLED
+from app.utils.durability import DurableCommitMiddleware
+from app.utils.events import event_hub
+from app.utils.idempotency import SharedIdempotencyStore, set_idempotency_store
+from app.utils.ratelimit import SharedRateLimitStore, set_rate_limit_store
+
+# 運行環境 - production 時不創建測試數據、不自動重載，並使用構建時生成的OpenAPI文檔
+APP_ENV = os.getenv("APP_ENV", "development")
+OPENAPI_SCHEMA_PATH = os.getenv("OPENAPI_SCHEMA_PATH", os.path.join(os.path.dirname(__file__), "openapi.json"))
+
+# 配置日誌 (後台線程輸出)
+setup_logging()
+
+# API worker進程數 - 多個worker需要 sharded 後端: 數據與SSE推送、冪等鍵、限流狀態都經分片共享
+WORKERS = int(os.getenv("WORKERS", "1"))
+if __name__ == "__main__" and WORKERS > 1 and DB_BACKEND != "sharded":
+    raise SystemExit("WORKERS>1 需要 DB_BACKEND=sharded: 其他後端的SSE推送、冪等鍵與限流狀態只在單個進程內有效")
+
+# 分片模式: 主進程先啟動分片進程，各worker進程通過Unix socket訪問數據
+if __name__ == "__main__" and DB_BACKEND == "sharded":
+    from app.database.shard import start_shards
+    shard_processes = start_shards()
+
+# 分片模式下限流令牌桶與冪等響應保存在分片中，落到任意worker的請求看到同一份狀態
+# (並發上限保護的是本進程的線程池與連接，仍按worker計數)
+if DB_BACKEND == "sharded":
+    set_rate_limit_store(SharedRateLimitStore(db.repository))
+    set_idempotency_store(SharedIdempotencyStore(db.repository))
 
 # 初始化測試數據
-init_db()
+if APP_ENV != "production":
+    init_db()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """應用生命週期 - 啟動後台過期交易清理，載入待接收交易的暫扣總額；分片模式下經分片共享SSE事件"""
+    if DB_BACKEND == "sharded":
+        event_hub.share(db.repository)
+    expiry_sweeper.load_pending()
+    pending_locked.load()
+    sweeper_task = asyncio.create_task(expiry_sweeper.run())
+    yield
+    sweeper_task.cancel()
+    event_hub.stop()
 
 # 創建FastAPI應用
 app = FastAPI(
@@ -21,7 +67,8 @@ app = FastAPI(
                "3. 點擊 'Authorize' 完成認證\n"
                "4. 完成認證後，可以訪問需要認證的API端點",
     version="1.0.0",
-    swagger_ui_parameters={"defaultModelsExpandDepth": -1}
+    swagger_ui_parameters={"defaultModelsExpandDepth": -1},
+    lifespan=lifespan
 )
 
 # 配置CORS
@@ -31,12 +78,30 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Idempotent-Replayed", "X-Query-Plan"],  # 讓前端可以讀取分頁游標、冪等重放標記與查詢計劃
 )
 
+# 請求指標 (每個路由的請求數、延遲直方圖、進行中的請求數)
+app.add_middleware(MetricsMiddleware)
+
+# journal 後端: 響應等到請求內的修改操作fsync之後才發出 (同時處理的請求共享一次fsync)
+if DB_BACKEND == "journal":
+    app.add_middleware(DurableCommitMiddleware)
+
+# 請求剖析 (PROFILING_ENABLED=true 時啟用): 按比例、管理員 X-Profile 請求頭或慢請求閾值採樣調用棧
+# 放在最外層，耗時包含其他中間件；關閉時不安裝，請求路徑上沒有額外開銷
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
 # 自定義OpenAPI配置，修復Swagger UI認證問題
 def custom_openapi():
     if app.openapi_schema:
         return app.openapi_schema
+    # 生產環境直接讀取構建時導出的文檔 (python main.py --export-openapi)
+    if APP_ENV == "production" and os.path.exists(OPENAPI_SCHEMA_PATH):
+        with open(OPENAPI_SCHEMA_PATH, encoding="utf-8") as f:
+            app.openapi_schema = json.load(f)
+        return app.openapi_schema
     openapi_schema = get_openapi(
         title=app.title,
         version=app.version,
@@ -70,15 +135,33 @@ app.openapi = custom_openapi
 app.include_router(auth.router, prefix="/api/auth", tags=["認證"])
 app.include_router(users.router, prefix="/api/users", tags=["用戶"])
 app.include_router(transactions.router, prefix="/api/transactions", tags=["交易"])
+app.include_router(profiles.router, prefix="/api/profiles", tags=["診斷"])
 
 @app.get("/")
 async def root():
     return {"message": "XX幣交易系統API服務運行中"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus 指標"""
+    return Response(registry.render(), media_type=METRICS_CONTENT_TYPE)
+
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="XX幣交易系統API服務")
+    parser.add_argument("--export-openapi", metavar="PATH", help="導出OpenAPI文檔後退出 (鏡像構建時使用)")
+    args = parser.parse_args()
+    if args.export_openapi:
+        with open(args.export_openapi, "w", encoding="utf-8") as f:
+            json.dump(custom_openapi(), f, ensure_ascii=False)
+        raise SystemExit(0)
+
+    import uvicorn
+    # 多個worker或生產環境時關閉自動重載
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=int(os.getenv("BACKEND_PORT", 5555)),
-        reload=True
+        reload=WORKERS == 1 and APP_ENV != "production",
+        workers=WORKERS
     )
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+# 所有請求來自同一IP，關閉限流以測試存儲層的並發正確性 (須在導入應用之前設置)
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+from app.database import db
+from app.database.ledger import LedgerColumns
+from app.database.query import CompositeIndex
+
+
+def fresh_memory_store(monkeypatch):
+    """memory 後端的數據在模塊級dict中，換成空的存儲，用例之間互不影響"""
+    for name in ("users_db", "transactions_db", "transactions_by_sender", "transactions_by_receiver",
+                 "transactions_by_status"):
+        monkeypatch.setattr(db, name, {})
+    monkeypatch.setattr(db, "ledger_columns", LedgerColumns())
+    monkeypatch.setattr(db, "transaction_query_indexes", tuple(
+        CompositeIndex(index.fields, index.order) for index in db.transaction_query_indexes
+    ))
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path, monkeypatch):
+    """在 memory 與 sqlite 後端上分別運行 (替換 db.repository)，每個用例使用空的存儲"""
+    if request.param == "memory":
+        fresh_memory_store(monkeypatch)
+    options = {"path": str(tmp_path / "test.db")} if request.param == "sqlite" else {}
+    repository = db.create_repository(request.param, **options)
+    monkeypatch.setattr(db, "repository", repository)
+    yield request.param
+    if hasattr(repository, "close"):
+        repository.close()
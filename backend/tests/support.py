@@ -0,0 +1,71 @@
+"""測試共用的數據構造函數"""
+import errno
+import uuid
+from datetime import datetime, timedelta
+
+from app.database import db
+from app.database.journal import JournaledMemoryRepository
+from app.utils.auth import create_access_token
+from conftest import fresh_memory_store
+
+
+def make_user(balance=0):
+    name = f"u{uuid.uuid4().hex[:12]}"
+    return db.add_user({
+        "user_id": str(uuid.uuid4()),
+        "email": f"{name}@example.com",
+        "name": name,
+        "hashed_password": "not-a-real-hash",
+        "balance": balance,
+        "created_at": datetime.now(),
+    })
+
+
+def make_pending(sender, amount, expires_in=timedelta(minutes=30)):
+    now = datetime.now()
+    transaction = db.open_transfer({
+        "transaction_id": str(uuid.uuid4()),
+        "amount": amount,
+        "note": "test",
+        "sender_id": sender["user_id"],
+        "sender_email": sender["email"],
+        "sender_name": sender["name"],
+        "receiver_id": None,
+        "receiver_email": None,
+        "receiver_name": None,
+        "status": "pending",
+        "created_at": now,
+        "expires_at": now + expires_in,
+        "completed_at": None,
+    })
+    assert transaction is not None
+    return transaction
+
+
+def auth_headers(user):
+    return {"Authorization": f"Bearer {create_access_token({'sub': user['user_id'], 'email': user['email']})}"}
+
+
+def balances(users):
+    return [db.get_user(user["email"])["balance"] for user in users]
+
+
+def open_journal(directory, monkeypatch):
+    # 同一進程內重新打開時換成空的內存存儲，相當於重啟後只按磁盤上的文件恢復
+    fresh_memory_store(monkeypatch)
+    return JournaledMemoryRepository(str(directory), fsync_interval=0.001)
+
+
+class TornWrites:
+    """只寫出一半數據後報錯的日誌文件，模擬磁盤已滿時留下不完整的幀"""
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, data):
+        self.file.write(data[:len(data) // 2])
+        self.file.flush()
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
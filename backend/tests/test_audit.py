@@ -0,0 +1,61 @@
+"""對賬測試: 正常流水對平、篡改的餘額被找出、註冊與對賬快照並發時快照仍一致"""
+import threading
+from datetime import datetime
+
+from app.database import db
+from app.models.money import INITIAL_BALANCE, from_minor
+from app.utils.audit import run_audit
+from support import make_pending, make_user
+
+
+def settle(sender, receiver):
+    confirmed = make_pending(sender, 300)
+    cancelled = make_pending(sender, 200)
+    make_pending(sender, 50)
+    assert db.close_transfer(confirmed["transaction_id"], "completed", receiver["email"],
+                             receiver_email=receiver["email"], completed_at=datetime.now())
+    assert db.close_transfer(cancelled["transaction_id"], "cancelled", sender["email"], completed_at=datetime.now())
+
+
+def test_audit_balances_settled_ledger(backend):
+    sender, receiver = make_user(INITIAL_BALANCE), make_user(INITIAL_BALANCE)
+    settle(sender, receiver)
+
+    report = run_audit()
+    assert report.balanced, report
+    assert report.accounts == 2
+    assert report.transactions == 3
+    assert report.pending == from_minor(50)
+
+
+def test_audit_reports_tampered_balance(backend):
+    sender, receiver = make_user(INITIAL_BALANCE), make_user(INITIAL_BALANCE)
+    settle(sender, receiver)
+    db.repository.adjust_balance(receiver["email"], 7)
+
+    report = run_audit()
+    assert not report.balanced
+    assert [item.email for item in report.discrepancies] == [receiver["email"]]
+    assert report.discrepancies[0].difference == from_minor(7)
+
+
+def test_ledger_snapshot_consistent_during_registrations(backend):
+    # 用戶較多時讀取餘額需要更久，更容易與註冊交錯
+    for _ in range(20_000 if backend == "memory" else 200):
+        make_user(INITIAL_BALANCE)
+    stop = threading.Event()
+
+    def register():
+        while not stop.is_set():
+            make_user(INITIAL_BALANCE)
+
+    writer = threading.Thread(target=register)
+    writer.start()
+    try:
+        for _ in range(50):
+            ledger = db.get_ledger()
+            assert len(ledger.emails) == len(ledger.balances)
+    finally:
+        stop.set()
+        writer.join()
+    assert run_audit().balanced
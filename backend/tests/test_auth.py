@@ -0,0 +1,19 @@
+"""認證測試: bcrypt線程池的任務計數在並發下保持一致"""
+import asyncio
+
+from app.utils import auth
+
+
+def test_password_pool_counts_balance_under_concurrency():
+    # 以輕量函數代替bcrypt，只測試計數
+    jobs = 2000
+    before = auth.password_pool_stats()
+
+    async def run():
+        await asyncio.gather(*(auth._offload_password_job(sum, (i, 1)) for i in range(jobs)))
+
+    asyncio.run(run())
+    after = auth.password_pool_stats()
+    assert after["queued"] == before["queued"] == 0
+    assert after["running"] == before["running"] == 0
+    assert after["completed"] - before["completed"] == jobs
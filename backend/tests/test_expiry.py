@@ -0,0 +1,46 @@
+"""過期清理測試: 到期的待接收交易被取消並退款，存儲調用不在事件循環線程中執行"""
+import asyncio
+import threading
+from datetime import timedelta
+
+from app.database import db
+from app.utils import expiry
+from app.utils.expiry import ExpirySweeper
+from support import balances, make_pending, make_user
+
+
+def test_sweeper_cancels_expired_off_the_event_loop(backend, monkeypatch):
+    sender = make_user(1000)
+    expired = make_pending(sender, 300, expires_in=timedelta(seconds=-1))
+    alive = make_pending(sender, 200)
+
+    threads = []
+    original = expiry.close_transfer
+
+    def recording_close_transfer(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(expiry, "close_transfer", recording_close_transfer)
+    sweeper = ExpirySweeper()
+
+    async def sweep():
+        sweeper.schedule(expired)
+        sweeper.schedule(alive)
+        loop_thread = threading.current_thread()
+        task = asyncio.create_task(sweeper.run())
+        for _ in range(200):
+            await asyncio.sleep(0.01)
+            if sweeper.expired_count:
+                break
+        task.cancel()
+        return loop_thread
+
+    loop_thread = asyncio.run(sweep())
+
+    assert sweeper.expired_count == 1
+    assert threads and all(thread is not loop_thread for thread in threads)
+    assert db.get_transaction(expired["transaction_id"])["status"] == "cancelled"
+    assert db.get_transaction(alive["transaction_id"])["status"] == "pending"
+    assert balances([sender]) == [1000 - 200]
+    assert len(sweeper) == 1
@@ -0,0 +1,41 @@
+"""對賬單導出測試: 分批讀取在線程池中進行，導出的行數與存儲一致"""
+import asyncio
+import csv
+import io
+import threading
+
+import httpx
+
+from app.database import db
+from app.utils import export
+from main import app
+from support import auth_headers, make_pending, make_user
+
+
+def test_export_fetches_batches_off_the_event_loop(backend, monkeypatch):
+    sender = make_user(10_000)
+    for _ in range(25):
+        make_pending(sender, 10)
+
+    threads = []
+    original = export.iter_export_batches
+
+    def recording_batches(fetch, *args, **kwargs):
+        def recording_fetch(before, limit):
+            threads.append(threading.current_thread())
+            return fetch(before, limit)
+        return original(recording_fetch, *args, batch_size=10)
+
+    monkeypatch.setattr(export, "iter_export_batches", recording_batches)
+
+    async def download():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.get("/api/users/me/transactions/export", headers=auth_headers(sender))
+            return response, threading.current_thread()
+
+    response, loop_thread = asyncio.run(download())
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert len(rows) == 1 + 25
+    assert len(threads) == 3
+    assert all(thread is not loop_thread for thread in threads)
@@ -0,0 +1,127 @@
+"""冪等鍵測試: 重試重放同一響應且只扣款一次、並發的相同鍵只執行一次、鍵被誤用時拒絕、fsync失敗的響應不記錄、緩存按字節數有界
+
+用法: python -m pytest tests/test_idempotency.py  (在 backend 目錄下)
+"""
+import asyncio
+import uuid
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app.database import db
+from app.utils import idempotency
+from app.utils.cache import TTLCache
+from app.utils.durability import DurableCommitMiddleware
+from main import app
+from support import TornWrites, auth_headers, balances, make_user, open_journal
+
+client = TestClient(app)
+
+
+def idempotent(user, key):
+    return {**auth_headers(user), "Idempotency-Key": key}
+
+
+def test_retry_replays_response_and_debits_once(backend):
+    sender = make_user(10_000)
+    key = str(uuid.uuid4())
+
+    first = client.post("/api/transactions/prepare", json={"amount": 10}, headers=idempotent(sender, key))
+    retry = client.post("/api/transactions/prepare", json={"amount": 10}, headers=idempotent(sender, key))
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert balances([sender]) == [10_000 - 1000]
+
+
+def test_concurrent_requests_with_same_key_execute_once(backend):
+    # sqlite 後端的存儲調用在線程池中執行，處理過程中相同鍵的請求會到達
+    sender = make_user(10_000)
+    headers = idempotent(sender, str(uuid.uuid4()))
+
+    async def prepare_all():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await asyncio.gather(*(
+                client.post("/api/transactions/prepare", json={"amount": 10}, headers=headers) for _ in range(20)
+            ))
+
+    statuses = [response.status_code for response in asyncio.run(prepare_all())]
+    assert statuses.count(201) >= 1
+    assert set(statuses) <= {201, 409}, statuses
+    assert balances([sender]) == [10_000 - 1000]
+
+
+def test_failed_request_releases_key(backend):
+    sender = make_user(500)
+    headers = idempotent(sender, str(uuid.uuid4()))
+
+    # 餘額不足失敗後，同一個鍵的重試重新執行，而不是返回處理中
+    assert client.post("/api/transactions/prepare", json={"amount": 10}, headers=headers).status_code == 400
+    assert client.post("/api/transactions/prepare", json={"amount": 10}, headers=headers).status_code == 400
+    assert client.post("/api/transactions/prepare", json={"amount": 5}, headers=headers).status_code == 201
+
+
+def test_key_reused_for_different_request_is_rejected(backend):
+    sender = make_user(10_000)
+    key = str(uuid.uuid4())
+
+    assert client.post("/api/transactions/prepare", json={"amount": 10}, headers=idempotent(sender, key)).status_code == 201
+    reused = client.post("/api/transactions/prepare", json={"amount": 11}, headers=idempotent(sender, key))
+
+    assert reused.status_code == 422
+    assert balances([sender]) == [10_000 - 1000]
+
+
+def test_oversized_response_is_not_stored_but_not_reexecuted(backend, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_MAX_BODY_BYTES", 16)
+    sender, receiver = make_user(10_000), make_user()
+    key = str(uuid.uuid4())
+    batch = {"items": [{"amount": 1, "receiverEmail": receiver["email"]}] * 3}
+
+    first = client.post("/api/transactions/prepare/batch", json=batch, headers=idempotent(sender, key))
+    retry = client.post("/api/transactions/prepare/batch", json=batch, headers=idempotent(sender, key))
+
+    assert first.status_code == 201
+    assert retry.status_code == 409
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert balances([sender]) == [10_000 - 300]
+
+
+def test_response_is_remembered_only_after_fsync(tmp_path, monkeypatch):
+    # journal 後端: 與服務一樣由 DurableCommitMiddleware 在發出響應前等待fsync
+    repository = open_journal(tmp_path, monkeypatch)
+    monkeypatch.setattr(db, "repository", repository)
+    sender = make_user(10_000)
+    durable, failed = str(uuid.uuid4()), str(uuid.uuid4())
+
+    async def prepare(key):
+        transport = httpx.ASGITransport(app=DurableCommitMiddleware(app), raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(
+                "/api/transactions/prepare", json={"amount": 10}, headers=idempotent(sender, key)
+            )
+
+    try:
+        assert asyncio.run(prepare(durable)).status_code == 201
+        assert asyncio.run(prepare(durable)).headers["Idempotent-Replayed"] == "true"
+
+        repository._file = TornWrites(repository._file)
+        assert asyncio.run(prepare(failed)).status_code == 500
+        assert idempotency.idempotency_cache.get(("prepare", sender["email"], durable)) is not None
+        assert idempotency.idempotency_cache.get(("prepare", sender["email"], failed)) is None
+    finally:
+        repository.close()
+
+
+def test_cache_is_bounded_by_total_bytes():
+    cache = TTLCache(maxsize=1000, maxbytes=10_000, sizeof=len)
+    for i in range(100):
+        cache.set(i, b"x" * 1000)
+
+    assert cache.bytes == 10_000
+    assert len(cache) == 10
+    assert cache.get(0) is None
+    assert cache.get(99) == b"x" * 1000
+    cache.pop(99)
+    assert cache.bytes == 9_000
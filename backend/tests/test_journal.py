@@ -0,0 +1,69 @@
+"""journal 後端測試: 重放在不完整的幀處停止、寫入失敗後停止接受修改，已確認的操作重啟後都在
+
+用法: python -m pytest tests/test_journal.py  (在 backend 目錄下)
+"""
+import glob
+import os
+import uuid
+from datetime import datetime
+
+import pytest
+
+from app.database.journal import JournalError
+from support import TornWrites, open_journal
+
+
+def new_user(balance=0):
+    name = f"u{uuid.uuid4().hex[:12]}"
+    return {
+        "user_id": str(uuid.uuid4()),
+        "email": f"{name}@example.com",
+        "name": name,
+        "hashed_password": "not-a-real-hash",
+        "balance": balance,
+        "created_at": datetime.now(),
+    }
+
+
+def test_replay_stops_at_torn_frame(tmp_path, monkeypatch):
+    repository = open_journal(tmp_path, monkeypatch)
+    saved = [repository.add_user(new_user(100)) for _ in range(3)]
+    repository.adjust_balance(saved[0]["email"], 50)
+    repository.close()
+
+    journal, = glob.glob(str(tmp_path / "journal-*.log"))
+    intact = os.path.getsize(journal)
+    with open(journal, "ab") as target:
+        target.write(b"\x40\x00\x00\x00torn")
+
+    repository = open_journal(tmp_path, monkeypatch)
+    try:
+        assert [repository.get_user(user["email"])["balance"] for user in saved] == [150, 100, 100]
+        assert os.path.getsize(journal) == intact
+    finally:
+        repository.close()
+
+
+def test_write_failure_stops_further_mutations(tmp_path, monkeypatch):
+    repository = open_journal(tmp_path, monkeypatch)
+    acknowledged = repository.add_user(new_user(100))
+
+    repository._file = TornWrites(repository._file)
+    with pytest.raises(OSError):
+        repository.add_user(new_user())
+    assert repository.failure is not None
+
+    # 不再向不完整的幀之後追加: 新的修改直接被拒絕，不會在重啟後被靜默丟棄
+    with pytest.raises(JournalError):
+        repository.adjust_balance(acknowledged["email"], 1)
+    repository.compact_journal()
+    repository.close()
+
+    repository = open_journal(tmp_path, monkeypatch)
+    try:
+        assert list(repository.users) == [acknowledged["email"]]
+        assert repository.get_user(acknowledged["email"])["balance"] == 100
+        repository.add_user(new_user())
+        assert len(repository.users) == 2
+    finally:
+        repository.close()
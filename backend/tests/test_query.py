@@ -0,0 +1,112 @@
+"""交易查詢API測試: 條件組合與游標分頁的結果正確、查詢計劃選用候選最少的索引、只允許管理員
+
+用法: python -m pytest tests/test_query.py  (在 backend 目錄下)
+"""
+import json
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.database import db
+from app.models.money import to_minor
+from main import app
+from support import auth_headers, make_pending, make_user
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    user = make_user()
+    monkeypatch.setattr("app.utils.auth.ADMIN_EMAILS", frozenset({user["email"]}))
+    return auth_headers(user)
+
+
+def settle(transaction, status, credit_email, receiver=None):
+    changes = {"receiver_email": receiver["email"]} if receiver else {}
+    assert db.close_transfer(
+        transaction["transaction_id"], status, credit_email, completed_at=datetime.now(), **changes
+    )
+
+
+@pytest.fixture
+def ledger(backend):
+    """兩個發送方各自發起轉賬: 一部分由 receiver 確認，一部分取消，其餘待接收"""
+    alice, bob, receiver = make_user(to_minor(1000)), make_user(to_minor(1000)), make_user()
+    expected = {"completed_to_receiver": [], "alice": [], "alice_pending": []}
+    for index, sender in enumerate((alice, bob) * 6):
+        transaction = make_pending(sender, to_minor(index + 1))
+        if index % 3 == 0:
+            settle(transaction, "completed", receiver["email"], receiver)
+            expected["completed_to_receiver"].append(transaction["transaction_id"])
+        elif index % 3 == 1:
+            settle(transaction, "cancelled", sender["email"])
+        elif sender is alice:
+            expected["alice_pending"].append(transaction["transaction_id"])
+        if sender is alice:
+            expected["alice"].append(transaction["transaction_id"])
+    return alice, receiver, expected
+
+
+def query(headers, **params):
+    response = client.get("/api/transactions/query", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response
+
+
+def ids(response):
+    return {transaction["transactionId"] for transaction in response.json()}
+
+
+def test_filters_match_expected_transactions(ledger, admin):
+    alice, receiver, expected = ledger
+
+    assert ids(query(admin, sender=alice["email"])) == set(expected["alice"])
+    assert ids(query(admin, sender=alice["email"], status="pending")) == set(expected["alice_pending"])
+    assert ids(query(admin, status="completed", receiver=receiver["email"])) == set(expected["completed_to_receiver"])
+    assert ids(query(admin, counterparty=receiver["email"])) == set(expected["completed_to_receiver"])
+
+    amounts = [transaction["amount"] for transaction in query(admin, sender=alice["email"], min_amount=3, max_amount=7).json()]
+    assert sorted(amounts) == [3, 5, 7]
+
+
+def test_cursor_pages_cover_the_full_result(ledger, admin):
+    alice, _, expected = ledger
+    full = query(admin, sender=alice["email"]).json()
+    created = [transaction["createdAt"] for transaction in full]
+    assert created == sorted(created, reverse=True)
+
+    pages, cursor = [], None
+    while True:
+        params = {"sender": alice["email"], "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = query(admin, **params)
+        pages += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert [transaction["transactionId"] for transaction in pages] == [transaction["transactionId"] for transaction in full]
+    assert len(pages) == len(expected["alice"])
+
+
+def test_plan_picks_narrowest_index(backend, ledger, admin):
+    if backend == "sqlite":
+        pytest.skip("sqlite 的計劃說明取自 EXPLAIN QUERY PLAN")
+    alice, receiver, _ = ledger
+
+    plan = json.loads(query(admin, sender=alice["email"], status="pending").headers["X-Query-Plan"])
+    assert [step["index"] for step in plan] == ["sender_email+status/created_at"]
+    assert plan[0]["candidates"] == plan[0]["scanned"] == 2
+
+    # counterparty 拆成發送方與接收方兩個分支，各自使用按email分組的索引
+    plan = json.loads(query(admin, counterparty=receiver["email"]).headers["X-Query-Plan"])
+    assert sorted(step["index"] for step in plan) == ["receiver_email+status/created_at", "sender_email+status/created_at"]
+
+
+def test_query_requires_admin_and_valid_ranges(ledger, admin):
+    alice, _, _ = ledger
+    response = client.get("/api/transactions/query", headers=auth_headers(alice))
+    assert response.status_code == 403
+
+    response = client.get("/api/transactions/query", params={"min_amount": 5, "max_amount": 1}, headers=admin)
+    assert response.status_code == 400
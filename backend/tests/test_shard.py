@@ -0,0 +1,101 @@
+"""分片存儲測試: 連接需要認證、只能調用白名單內的操作，多個worker經分片共享限流、冪等與SSE事件
+
+分片服務在測試進程的線程中運行 (與分片進程中的代碼相同)，通過Unix socket訪問；
+每個 ShardedRepository 代表一個worker進程。
+用法: python -m pytest tests/test_shard.py  (在 backend 目錄下)
+"""
+import asyncio
+import os
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+import pytest
+
+from app.database.shard import ShardError, ShardServer, ShardedRepository, socket_path
+from app.utils.events import EventHub, user_topic
+from app.utils.idempotency import SharedIdempotencyStore
+from app.utils.ratelimit import SharedRateLimitStore
+from conftest import fresh_memory_store
+from support import make_user
+
+
+@pytest.fixture
+def sharded(tmp_path, monkeypatch):
+    monkeypatch.setenv("SHARD_AUTHKEY", "test-shard-key")
+    fresh_memory_store(monkeypatch)
+    server = ShardServer(socket_path(str(tmp_path), 0), filter_capacity=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    deadline = time.monotonic() + 5
+    while not os.path.exists(server.path):
+        assert time.monotonic() < deadline, "分片未啟動"
+        time.sleep(0.01)
+    repository = ShardedRepository(str(tmp_path), count=1, recovery_seconds=3600)
+    monkeypatch.setattr("app.database.db.repository", repository)
+    yield repository
+    repository.close()
+
+
+@pytest.fixture
+def other_worker(sharded):
+    repository = ShardedRepository(sharded.directory, count=1, recovery_seconds=3600)
+    yield repository
+    repository.close()
+
+
+def test_dispatch_rejects_methods_outside_allowlist(sharded):
+    user = make_user(100)
+    assert sharded.get_user(user["email"])["balance"] == 100
+
+    for method in ("_update_fields", "dispatch", "__init__", "users", "transaction_filter"):
+        with pytest.raises(ShardError, match="不支持的分片操作"):
+            sharded._call(0, method)
+
+
+def test_unauthenticated_client_is_rejected(sharded):
+    path = socket_path(sharded.directory, 0)
+    with pytest.raises(AuthenticationError):
+        Client(path, family="AF_UNIX", authkey=b"wrong-key")
+
+    # 被拒絕的連接不影響已認證的worker
+    user = make_user(5)
+    assert sharded.get_user(user["email"])["balance"] == 5
+
+
+def test_workers_share_rate_limits_and_idempotency_claims(sharded, other_worker):
+    async def run():
+        first, second = SharedRateLimitStore(sharded), SharedRateLimitStore(other_worker)
+        assert (await first.consume("login_ip:10.0.0.1", 1, 2))[0]
+        assert (await second.consume("login_ip:10.0.0.1", 1, 2))[0]
+        allowed, retry_after = await first.consume("login_ip:10.0.0.1", 1, 2)
+        assert not allowed and retry_after > 0
+
+        first, second = SharedIdempotencyStore(sharded), SharedIdempotencyStore(other_worker)
+        key, marker = ("prepare", "a@example.com", "key-1"), ("{}", None, None, None)
+        assert await first.claim(key, marker) is None
+        assert await second.claim(key, marker) == marker
+        await first.put(key, ("{}", 201, b"{}", "application/json"))
+        assert await second.claim(key, marker) == ("{}", 201, b"{}", "application/json")
+
+    asyncio.run(run())
+
+
+def test_events_reach_subscribers_on_other_workers(sharded, other_worker):
+    user = make_user(100)
+    subscriber_hub = EventHub()
+    subscriber_hub.share(other_worker)
+    topic = user_topic(user["email"])
+
+    async def run():
+        async with subscriber_hub.subscribe(topic) as queue:
+            # 沒有訂閱的主題不記錄事件
+            assert not sharded.publish(user_topic("nobody@example.com"), "balance", "nobody@example.com")
+            sharded.adjust_balance(user["email"], 50)
+            assert sharded.publish(topic, "balance", user["email"])
+            return await asyncio.wait_for(queue.get(), timeout=5)
+
+    try:
+        assert asyncio.run(run()) == ("balance", '{"balance": 1.5}')
+    finally:
+        subscriber_hub.stop()
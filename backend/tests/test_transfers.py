@@ -0,0 +1,95 @@
+"""轉賬並發測試: 重複確認只有一個成功、並發準備不會透支、結算後點數總額守恆
+
+每個用例分別在 memory 與 sqlite 後端上運行 (替換 db.repository)，請求經 ASGI 直接發給應用。
+用法: python -m pytest tests/test_transfers.py  (在 backend 目錄下)
+"""
+import asyncio
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import httpx
+
+from app.database import db
+from app.models.money import to_minor
+from main import app
+from support import auth_headers, balances, make_pending, make_user
+
+CONFIRMS = 200
+PREPARES = 200
+THREADS = 32
+SEED_BALANCE = to_minor(1000)
+
+
+async def gather_requests(requests):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await asyncio.gather(*(request(client) for request in requests))
+
+
+def test_concurrent_public_confirms_credit_once(backend):
+    sender = make_user(SEED_BALANCE)
+    receivers = [make_user() for _ in range(CONFIRMS)]
+    amount = to_minor(100)
+    transaction = make_pending(sender, amount)
+
+    url = f"/api/transactions/public/{transaction['transaction_id']}/confirm"
+    responses = asyncio.run(gather_requests(
+        lambda client, receiver=receiver: client.post(url, json={"email": receiver["email"], "name": receiver["name"]})
+        for receiver in receivers
+    ))
+
+    statuses = Counter(response.status_code for response in responses)
+    assert statuses[200] == 1, statuses
+    assert set(statuses) <= {200, 400}, statuses
+    final = balances([sender, *receivers])
+    assert sorted(final[1:], reverse=True)[:2] == [amount, 0]
+    assert min(final) >= 0
+    assert sum(final) == SEED_BALANCE
+    assert db.get_transaction(transaction["transaction_id"])["status"] == "completed"
+
+
+def test_concurrent_prepares_never_overdraw(backend):
+    # 每個請求轉出1點，餘額只夠其中一半
+    available = PREPARES // 2
+    sender = make_user(to_minor(available))
+    headers = auth_headers(sender)
+
+    responses = asyncio.run(gather_requests(
+        lambda client: client.post("/api/transactions/prepare", json={"amount": 1}, headers=headers)
+        for _ in range(PREPARES)
+    ))
+
+    statuses = Counter(response.status_code for response in responses)
+    assert statuses[201] == available, statuses
+    assert balances([sender]) == [0]
+
+    # 取消全部待接收交易 (每筆並發取消兩次) 後點數全部退回
+    created = [response.json()["transactionId"] for response in responses if response.status_code == 201]
+    cancels = asyncio.run(gather_requests(
+        lambda client, transaction_id=transaction_id: client.post(
+            f"/api/transactions/{transaction_id}/cancel", headers=headers
+        )
+        for transaction_id in created * 2
+    ))
+    statuses = Counter(response.status_code for response in cancels)
+    assert statuses[200] == available, statuses
+    assert balances([sender]) == [to_minor(available)]
+
+
+def test_threaded_close_transfer_settles_once(backend):
+    sender, receiver = make_user(SEED_BALANCE), make_user()
+    amount = to_minor(100)
+    transaction = make_pending(sender, amount)
+
+    def confirm(_):
+        return db.close_transfer(
+            transaction["transaction_id"], "completed", receiver["email"], completed_at=datetime.now()
+        )
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        results = list(pool.map(confirm, range(CONFIRMS * 5)))
+
+    assert sum(result is not None for result in results) == 1
+    final = balances([sender, receiver])
+    assert final == [SEED_BALANCE - amount, amount]
+    assert sum(final) == SEED_BALANCE
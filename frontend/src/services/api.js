@@ -292,3 +292,114 @@ export const getTransaction = async (transactionId) => {
     throw new Error(error.response?.data?.detail || '獲取交易詳情失敗');
   }
 };
+
+// 訂閱服務端推送事件 (SSE)
+// 使用 fetch 讀取事件流以便攜帶認證頭，返回取消訂閱函數
+// onEvent 返回 true 表示已收到最終事件；在此之前連接中斷或被關閉 (網絡錯誤、服務重啟、代理超時、5xx) 都會自動重連，
+// 重連間隔按指數退避並設上限，連接成功後重置；4xx (未登入、無權限、交易不存在、限流) 重試無意義，直接停止。
+// 服務端在連接建立時先推送當前狀態，中斷期間的變更不會丟失
+const EVENT_RETRY_BASE_MS = 1000;
+const EVENT_RETRY_MAX_MS = 30000;
+
+class EventStreamRejected extends Error {}
+
+const subscribeEvents = (path, onEvent) => {
+  if (USE_MOCK) {
+    return () => {};
+  }
+
+  const controller = new AbortController();
+  let retryTimer = null;
+  let retryDelay = EVENT_RETRY_BASE_MS;
+  let finished = false;
+
+  const connect = async () => {
+    try {
+      const headers = { Accept: 'text/event-stream' };
+      const token = localStorage.getItem('token');
+      if (token) {
+        headers['Authorization'] = `Bearer ${token}`;
+      }
+
+      const response = await fetch(`${API_URL}${path}`, { headers, signal: controller.signal });
+      if (response.status >= 400 && response.status < 500) {
+        throw new EventStreamRejected(`事件流被拒絕: ${response.status}`);
+      }
+      if (!response.ok) {
+        throw new Error(`事件流連接失敗: ${response.status}`);
+      }
+      retryDelay = EVENT_RETRY_BASE_MS;
+
+      const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+      let buffer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+          // 收到最終事件後服務端正常結束 (例如交易已完成)，否則視為連接中斷
+          if (finished) {
+            return;
+          }
+          throw new Error('事件流被關閉');
+        }
+        buffer += value;
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+          const message = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+
+          let event = 'message';
+          const data = [];
+          for (const line of message.split('\n')) {
+            if (line.startsWith('event:')) {
+              event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+              data.push(line.slice(5).trim());
+            }
+          }
+          if (data.length && onEvent(event, JSON.parse(data.join('\n'))) === true) {
+            finished = true;
+          }
+        }
+      }
+    } catch (error) {
+      if (controller.signal.aborted) {
+        return;
+      }
+      if (error instanceof EventStreamRejected) {
+        console.error('事件流不再重連:', error);
+        return;
+      }
+      console.error(`事件流中斷，${retryDelay / 1000}秒後重連:`, error);
+      retryTimer = setTimeout(connect, retryDelay);
+      retryDelay = Math.min(retryDelay * 2, EVENT_RETRY_MAX_MS);
+    }
+  };
+
+  connect();
+
+  return () => {
+    controller.abort();
+    clearTimeout(retryTimer);
+  };
+};
+
+// 訂閱交易狀態變更，交易完成或取消 (包括過期) 後服務端會結束事件流
+export const subscribeTransaction = (transactionId, onUpdate) => {
+  return subscribeEvents(`/transactions/${transactionId}/events`, (event, data) => {
+    if (event === 'transaction') {
+      onUpdate(data);
+      return data.status === 'completed' || data.status === 'cancelled';
+    }
+    return false;
+  });
+};
+
+// 訂閱當前用戶的餘額變更
+export const subscribeBalance = (onBalance) => {
+  return subscribeEvents('/users/me/events', (event, data) => {
+    if (event === 'balance') {
+      onBalance(data.balance);
+    }
+  });
+};